@@ -20,8 +20,15 @@ CREATE TABLE IF NOT EXISTS items (
 CREATE TABLE IF NOT EXISTS images (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     file_path TEXT UNIQUE NOT NULL,
-    processed_status TEXT DEFAULT 'PENDING', -- PENDING, PROCESSED, ERROR
-    scan_date DATETIME DEFAULT CURRENT_TIMESTAMP
+    processed_status TEXT DEFAULT 'PENDING', -- PENDING, PROCESSING, PROCESSED, ERROR
+    scan_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+    attempts INTEGER DEFAULT 0, -- Times a worker has claimed this image
+    last_error TEXT,
+    updated_at DATETIME,
+    content_hash TEXT, -- SHA-256 of the file bytes
+    file_size INTEGER,
+    mtime REAL,
+    duplicate_of INTEGER -- images.id this byte-identical copy reused the results of
 );
 
 -- Table: item_images
@@ -31,6 +38,8 @@ CREATE TABLE IF NOT EXISTS item_images (
     item_code TEXT NOT NULL,
     image_id INTEGER NOT NULL,
     is_primary BOOLEAN DEFAULT 0,
+    bbox TEXT, -- JSON [x, y, w, h] of the item's crop in the photo
+    ocr_code TEXT, -- Code read from the crop by OCR
     FOREIGN KEY (item_code) REFERENCES items(item_code) ON DELETE CASCADE,
     FOREIGN KEY (image_id) REFERENCES images(id) ON DELETE CASCADE,
     PRIMARY KEY (item_code, image_id)
@@ -39,6 +48,12 @@ CREATE TABLE IF NOT EXISTS item_images (
 -- Index for faster lookups
 CREATE INDEX IF NOT EXISTS idx_items_code ON items(item_code);
 CREATE INDEX IF NOT EXISTS idx_images_path ON images(file_path);
+CREATE INDEX IF NOT EXISTS idx_images_status ON images(processed_status, id);
+CREATE INDEX IF NOT EXISTS idx_images_hash ON images(content_hash);
+CREATE INDEX IF NOT EXISTS idx_items_rank_updated ON items(rarity_rank, updated_at);
+CREATE INDEX IF NOT EXISTS idx_items_updated ON items(updated_at);
+-- Full-text index 'items_fts' (FTS5, trigram) is created by db_manager.check_and_migrate_db
+-- Change counter 'meta.items_version' (bumped by triggers on items) is created by db_manager.check_and_migrate_db
 
 -- Table: telemetry
 -- Stores execution logs for debugging and performance tracking.
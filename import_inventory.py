@@ -0,0 +1,37 @@
+import os
+import sys
+import time
+import argparse
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from db_manager import check_and_migrate_db, import_items_from_csv, import_items_from_json
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-import a legacy jade inventory (CSV or JSON) into the database.")
+    parser.add_argument("path", help="CSV file (export_items_to_csv headers) or JSON array / JSON Lines file")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows per transaction (default: 1000)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"❌ File not found: {args.path}")
+        sys.exit(1)
+
+    check_and_migrate_db()
+
+    start = time.time()
+    if args.path.lower().endswith(".csv"):
+        summary = import_items_from_csv(args.path, batch_size=args.batch_size)
+    else:
+        summary = import_items_from_json(args.path, batch_size=args.batch_size)
+    duration = time.time() - start
+
+    print(f"✅ Imported {summary['saved']}/{summary['total']} items in {duration:.2f}s.")
+    if summary["failed"]:
+        print(f"⚠️  {summary['failed']} items failed:")
+        for err in summary["errors"]:
+            print(f"   - {err['item_code']}: {err['error']}")
+
+if __name__ == "__main__":
+    main()
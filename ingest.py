@@ -0,0 +1,68 @@
+import os
+import sys
+import argparse
+import multiprocessing
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from db_manager import check_and_migrate_db, image_queue_counts, get_image_errors
+from ingestion import run_ingest, INGEST_WORKERS
+
+def _print_counts(counts):
+    print(f"   PENDING {counts['PENDING']} · PROCESSING {counts['PROCESSING']} · "
+          f"PROCESSED {counts['PROCESSED']} · ERROR {counts['ERROR']}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Headless batch ingestion: queue tray photos in the database and catalog them with worker processes. "
+                    "Re-running resumes an interrupted run."
+    )
+    parser.add_argument("targets", nargs="*", help="Image directories (scanned recursively) or glob patterns, e.g. 'photos/**/*.jpg'")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help=f"Worker processes (default: INGEST_WORKERS={INGEST_WORKERS})")
+    parser.add_argument("--no-ocr", action="store_true", help="Disable EasyOCR code reading")
+    parser.add_argument("--hints", default="", help="User hints passed to the vision model")
+    parser.add_argument("--retry-errors", action="store_true", help="Requeue images that failed in earlier runs")
+    parser.add_argument("--status", action="store_true", help="Only print the queue status and recent errors")
+    args = parser.parse_args()
+
+    check_and_migrate_db()
+
+    if args.status:
+        print("📋 Ingestion queue:")
+        _print_counts(image_queue_counts())
+        for err in get_image_errors(limit=20):
+            print(f"   - [{err['attempts']}x] {err['file_path']}: {err['last_error']}")
+        return
+
+    def _progress(counts):
+        done = counts["PROCESSED"] + counts["ERROR"]
+        total = done + counts["PENDING"] + counts["PROCESSING"]
+        print(f"⏳ {done}/{total} images (errors: {counts['ERROR']})", flush=True)
+
+    try:
+        summary = run_ingest(
+            args.targets,
+            workers=args.workers,
+            enable_ocr=not args.no_ocr,
+            user_hints=args.hints,
+            retry_errors=args.retry_errors,
+            progress=_progress
+        )
+    except KeyboardInterrupt:
+        print("\n⏸️  Interrupted. Run the command again to resume where it stopped.")
+        sys.exit(130)
+
+    print(f"✅ Scanned {summary['scanned']} files ({summary['added']} new, {summary['changed']} changed, "
+          f"{summary['requeued']} requeued); processed {summary['processed']} images in {summary['duration_s']:.1f}s.")
+    skipped = summary["unchanged"] + summary["duplicates"]
+    if skipped:
+        print(f"⏭️  Skipped {skipped} already-processed images ({summary['unchanged']} unchanged, "
+              f"{summary['duplicates']} byte-identical copies, {summary['skipped_bytes'] / 1024 ** 2:.1f} MB).")
+    _print_counts(summary["counts"])
+    if summary["errors"]:
+        print(f"⚠️  {summary['errors']} images failed (see --status, retry with --retry-errors).")
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support() # Spawned workers in a frozen build
+    main()
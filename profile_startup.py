@@ -0,0 +1,39 @@
+import os
+import sys
+import argparse
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from startup_profile import profile_import, format_report, check_budget, IMPORT_BUDGETS_MS
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start report: time each module's import in a fresh interpreter (python -X importtime).")
+    parser.add_argument("modules", nargs="*", help=f"Modules under src/ (default: {', '.join(IMPORT_BUDGETS_MS)})")
+    parser.add_argument("--top", type=int, default=15, help="Slowest packages listed per module (default: 15)")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 if a module is over its budget or loads heavy dependencies")
+    args = parser.parse_args()
+
+    problems = []
+    for module in args.modules or list(IMPORT_BUDGETS_MS):
+        try:
+            result = profile_import(module)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            problems.append(f"{module}: import failed")
+            continue
+        print(format_report(result, top=args.top))
+        print()
+        problems.extend(check_budget(result))
+
+    if problems:
+        print("⚠️  Startup budget exceeded:")
+        for problem in problems:
+            print(f"   - {problem}")
+        if args.check:
+            sys.exit(1)
+    else:
+        print("✅ All modules within their startup budget.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import sys
+import time
+import argparse
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from db_manager import check_and_migrate_db
+from grading_utils import regrade_all
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-grade the whole inventory with the current data/grading_rules.json.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows graded per batch (default: 1000)")
+    args = parser.parse_args()
+
+    check_and_migrate_db()
+
+    start = time.time()
+    summary = regrade_all(batch_size=args.batch_size)
+    duration = time.time() - start
+
+    tiers = ", ".join(f"{tier}: {count}" for tier, count in sorted(summary["tiers"].items()))
+    print(f"✅ Regraded {summary['total']} items in {duration:.2f}s ({summary['changed']} changed).")
+    if tiers:
+        print(f"   {tiers}")
+
+if __name__ == "__main__":
+    main()
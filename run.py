@@ -1,6 +1,6 @@
 import os
 import sys
-import streamlit.web.cli as stcli
+import multiprocessing
 
 def resolve_path(path):
     if hasattr(sys, "_MEIPASS"):
@@ -8,6 +8,11 @@ def resolve_path(path):
     return os.path.join(os.getcwd(), path)
 
 if __name__ == "__main__":
+    # Spawned preprocessing workers re-run this executable when frozen; let them
+    # act as workers instead of starting another Streamlit server
+    multiprocessing.freeze_support()
+    import streamlit.web.cli as stcli
+
     # Point to the internal app.py
     # When bundled, we will make sure src/app.py is in the root or accessible path
     app_path = resolve_path(os.path.join("src", "app.py"))
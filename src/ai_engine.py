@@ -1,13 +1,18 @@
-import ollama
 import json
+import hashlib
 import logging
 import time
 import os
 import re
-from typing import Dict, Any, Optional, List
+import asyncio
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple, Iterator
 from db_manager import log_telemetry
-from utils import check_ollama_status
-from vision_utils import ImageProcessor
+from model_registry import get_registry
+from result_cache import ResultCache, make_cache_key, file_digest
+from host_pool import HostPool, OLLAMA_HOSTS
 
 # Configure Logging
 logger = logging.getLogger(__name__)
@@ -16,24 +21,80 @@ logger = logging.getLogger(__name__)
 VISION_MODEL = os.getenv("VISION_MODEL", "moondream:latest")
 TEXT_MODEL = os.getenv("TEXT_MODEL", "gemma3n:e4b")
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://192.168.16.120:11434")
+# Max crops analyzed concurrently; keep in line with OLLAMA_NUM_PARALLEL on the host
+CROP_CONCURRENCY = int(os.getenv("CROP_CONCURRENCY", "4"))
 
-# Initialize Client explicitly to avoid localhost resolution issues
-client = ollama.Client(host=OLLAMA_HOST)
+# Vision result cache (content-addressed on crop bytes + model + prompt + hints)
+VISION_CACHE_ENABLED = os.getenv("VISION_CACHE_ENABLED", "1") == "1"
+VISION_CACHE = ResultCache(
+    "vision",
+    max_entries=int(os.getenv("VISION_CACHE_MAX_ENTRIES", "5000")),
+    max_age_s=float(os.getenv("VISION_CACHE_MAX_AGE_DAYS", "30")) * 86400
+)
 
-# Initialize Image Processor
-processor = ImageProcessor()
+# Marketing copy cache (keyed on a normalized feature signature)
+COPY_CACHE_ENABLED = os.getenv("COPY_CACHE_ENABLED", "1") == "1"
+COPY_CACHE = ResultCache(
+    "copy",
+    max_entries=int(os.getenv("COPY_CACHE_MAX_ENTRIES", "2000")),
+    max_age_s=float(os.getenv("COPY_CACHE_TTL_HOURS", "168")) * 3600
+)
+# When on, cache hits are returned as a cheap rewrite so every item gets unique text
+COPY_VARIANT_MODE = os.getenv("COPY_VARIANT_MODE", "0") == "1"
+# Bump when the copy prompt changes so stale generations are not reused
+COPY_PROMPT_VERSION = "1"
+# Stream copy into the UI token by token instead of waiting for the full JSON
+COPY_STREAMING = os.getenv("COPY_STREAMING", "1") == "1"
+COPY_KEYS = ["hero", "modern", "social"]
 
-# Load Symbolism Glossary
+# Requests are routed over every host in OLLAMA_HOSTS (defaults to OLLAMA_HOST).
+# Cheap to build: each host's ollama client is only created on its first request.
+host_pool = HostPool(OLLAMA_HOSTS)
+
+# Heavy singletons are created on first use, so importing this module stays fast
+# (vision_utils loads OpenCV/NumPy; see startup_profile for the import budget)
 GLOSSARY_PATH = os.path.join("data", "symbolism_glossary.json")
-SYMBOLISM_GLOSSARY = {}
-try:
-    with open(GLOSSARY_PATH, 'r', encoding='utf-8') as f:
-        SYMBOLISM_GLOSSARY = json.load(f)
-    logger.info("Symbolism glossary loaded successfully.")
-except FileNotFoundError:
-    logger.error(f"Symbolism glossary not found at {GLOSSARY_PATH}. Descriptions may be generic.")
-except json.JSONDecodeError:
-    logger.error(f"Error decoding symbolism glossary at {GLOSSARY_PATH}. Descriptions may be generic.")
+_processor = None
+_processor_lock = threading.Lock()
+_glossary = None
+
+def get_processor():
+    """Shared vision_utils.ImageProcessor."""
+    global _processor
+    if _processor is None:
+        with _processor_lock:
+            if _processor is None:
+                from vision_utils import ImageProcessor
+                _processor = ImageProcessor()
+    return _processor
+
+def get_symbolism_glossary() -> Dict[str, Any]:
+    """Symbolism glossary, read from GLOSSARY_PATH once."""
+    global _glossary
+    if _glossary is not None:
+        return _glossary
+    glossary = {}
+    try:
+        with open(GLOSSARY_PATH, 'r', encoding='utf-8') as f:
+            glossary = json.load(f)
+        logger.info("Symbolism glossary loaded successfully.")
+    except FileNotFoundError:
+        logger.error(f"Symbolism glossary not found at {GLOSSARY_PATH}. Descriptions may be generic.")
+    except json.JSONDecodeError:
+        logger.error(f"Error decoding symbolism glossary at {GLOSSARY_PATH}. Descriptions may be generic.")
+    _glossary = glossary
+    return glossary
+
+def __getattr__(name: str) -> Any:
+    # Lazy module attributes (PEP 562) for code that used the former import-time singletons
+    if name == "processor":
+        return get_processor()
+    if name == "client":
+        # Client of the primary host, for direct calls outside the pool
+        return host_pool.hosts[0].client
+    if name == "SYMBOLISM_GLOSSARY":
+        return get_symbolism_glossary()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def _get_symbolism_context(motif: str, color: str) -> str:
@@ -41,6 +102,7 @@ def _get_symbolism_context(motif: str, color: str) -> str:
     Retrieves symbolism context from the loaded glossary based on detected features.
     """
     context_parts = []
+    SYMBOLISM_GLOSSARY = get_symbolism_glossary()
 
     # Motif symbolism
     if motif and motif.lower() in SYMBOLISM_GLOSSARY.get("motifs", {}):
@@ -90,36 +152,61 @@ def clean_json_output(text: str) -> str:
     
     return text.strip()
 
-def safe_chat_call(model, messages, options=None, format=None, retries=2):
+_JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+def _read_partial_json_string(text: str, pos: int) -> str:
+    """Decodes a JSON string body starting at pos, stopping at the closing quote or wherever the text ends."""
+    chars = []
+    while pos < len(text):
+        ch = text[pos]
+        if ch == '"':
+            break
+        if ch == '\\':
+            if pos + 1 >= len(text):
+                break # Escape split across chunks
+            esc = text[pos + 1]
+            if esc == 'u':
+                code = text[pos + 2:pos + 6]
+                if len(code) < 4:
+                    break
+                try:
+                    chars.append(chr(int(code, 16)))
+                except ValueError:
+                    pass
+                pos += 6
+                continue
+            chars.append(_JSON_ESCAPES.get(esc, esc))
+            pos += 2
+            continue
+        chars.append(ch)
+        pos += 1
+    return "".join(chars)
+
+def parse_partial_json_fields(text: str, keys: List[str]) -> Dict[str, str]:
     """
-    Wraps client.chat with retry logic for network stability.
+    Tolerant parser for an incomplete JSON object of string fields, e.g. a model
+    response that is still streaming. Returns the text received so far for each
+    key that has started; keys not yet present are omitted.
     """
-    attempt = 0
-    last_error = None
-    
-    while attempt <= retries:
-        try:
-            return client.chat(
-                model=model,
-                messages=messages,
-                options=options,
-                format=format
-            )
-        except Exception as e:
-            last_error = e
-            logger.warning(f"Ollama Call Failed (Attempt {attempt+1}/{retries+1}): {e}")
-            attempt += 1
-            time.sleep(1) # Wait 1s before retry
-            
-    raise last_error
+    fields = {}
+    for key in keys:
+        match = re.search(r'"' + re.escape(key) + r'"\s*:\s*"', text)
+        if match:
+            fields[key] = _read_partial_json_string(text, match.end())
+    return fields
 
-def analyze_single_crop(image_path: str, ocr_code: str = "Unknown", user_hints: str = "") -> Dict[str, Any]:
+def safe_chat_call(model, messages, options=None, format=None, retries=None):
     """
-    Analyzes a single cropped image. 
+    Sends a chat request through the host pool: least-loaded healthy host first,
+    failover to the other hosts on errors, jittered backoff once all have failed.
+    """
+    return host_pool.chat(model, messages, options=options, format=format, retries=retries)
+
+def _build_crop_prompt(ocr_code: str) -> Tuple[str, bool]:
+    """
+    Returns (prompt, is_moondream) for one crop.
     Adjusts prompt based on whether it's moondream or a more capable model.
     """
-    hint_text = f'User Hints/Context: "{user_hints}"' if user_hints else "User Hints: None"
-    
     is_moondream = "moondream" in VISION_MODEL.lower()
 
     if is_moondream:
@@ -144,7 +231,103 @@ def analyze_single_crop(image_path: str, ocr_code: str = "Unknown", user_hints:
             }}
         }}
         """
+    return prompt, is_moondream
+
+def _crop_cache_key(image_path: Optional[str], image_bytes: Optional[bytes], prompt: str, user_hints: str, ocr_code: str) -> Optional[str]:
+    """Vision cache key on crop content + model + prompt + hints, or None when caching is off/impossible."""
+    if not VISION_CACHE_ENABLED:
+        return None
+    try:
+        digest = hashlib.sha256(image_bytes).hexdigest() if image_bytes is not None else file_digest(image_path)
+    except OSError as e:
+        logger.warning(f"Vision cache skipped for {image_path}: {e}")
+        return None
+    return make_cache_key(digest, VISION_MODEL, prompt, user_hints, ocr_code)
+
+def _parse_crop_response(content: str, ocr_code: str, is_moondream: bool) -> Dict[str, Any]:
+    """Turns the vision model's reply into {'item_code', 'visual_features'}. Raises on bad JSON."""
+    if is_moondream:
+        # Enhanced Heuristic Parsing for Moondream's natural language output
+        content_lower = content.lower()
+        
+        # 1. Extract Motif (More robust check)
+        motif = "Unknown"
+        motif_keywords = {
+            "Buddha": ["buddha", "彌勒", "佛"],
+            "Guanyin": ["guanyin", "觀音"],
+            "Leaf": ["leaf", "葉子", "一葉致富"],
+            "Dragon": ["dragon", "龍"],
+            "Ruyi": ["ruyi", "如意"],
+            "Cabbage": ["cabbage", "白菜"],
+            "Fish": ["fish", "魚"],
+            "Gourd": ["gourd", "葫蘆"],
+            "Peanut": ["peanut", "花生"],
+            "Bamboo": ["bamboo", "竹"],
+            "Peach": ["peach", "桃"]
+        }
+        for label, keys in motif_keywords.items():
+            if any(k in content_lower for k in keys):
+                motif = label
+                break
+        
+        # 2. Extract Color
+        color = "Extracted"
+        color_keywords = ["green", "white", "lavender", "purple", "yellow", "red", "black", "icy", "透明", "綠", "白", "紫"]
+        found_colors = [c for c in color_keywords if c in content_lower]
+        if found_colors:
+            color = found_colors[0].capitalize()
+
+        # 3. Extract Item Code from AI response if EasyOCR failed
+        final_code = ocr_code
+        if ocr_code == "Unknown":
+            code_match = re.search(r'([A-Z]{2}-\d{4}(?:_[A-Z]{2})?)', content.upper())
+            if code_match:
+                final_code = code_match.group(1)
+
+        return {
+            "item_code": final_code,
+            "visual_features": {
+                "color": color,
+                "motif": motif,
+                "characteristics": content.strip()
+            }
+        }
+
+    cleaned = clean_json_output(content)
+    result = json.loads(cleaned)
+    # Merge EasyOCR code if Vision model failed to read it or returned placeholder
+    if ocr_code != "Unknown":
+        result["item_code"] = ocr_code
+    return result
+
+def _crop_failure(ocr_code: str) -> Dict[str, Any]:
+    return {
+        "item_code": ocr_code,
+        "visual_features": {
+            "color": "Analysis Failed", 
+            "motif": "Unknown", 
+            "characteristics": "Error during analysis"
+        }
+    }
+
+def analyze_single_crop(image_path: Optional[str], ocr_code: str = "Unknown", user_hints: str = "", image_bytes: Optional[bytes] = None) -> Dict[str, Any]:
+    """
+    Analyzes a single cropped image, given as a file path or as encoded bytes
+    (image_bytes wins when both are set, so no file is read).
+    """
+    image = image_bytes if image_bytes is not None else image_path
+    label = image_path or "in-memory crop"
+    prompt, is_moondream = _build_crop_prompt(ocr_code)
     
+    # Cache lookup: identical crop bytes with the same model/prompt/hints skip Ollama
+    cache_key = _crop_cache_key(image_path, image_bytes, prompt, user_hints, ocr_code)
+    if cache_key:
+        cached = VISION_CACHE.get(cache_key)
+        if cached is not None:
+            logger.info(f"Vision cache hit for {label}")
+            return cached
+
+    start_time = time.time()
     try:
         # Use JSON format only for non-moondream models
         response = safe_chat_call(
@@ -152,116 +335,144 @@ def analyze_single_crop(image_path: str, ocr_code: str = "Unknown", user_hints:
             messages=[{
                 'role': 'user',
                 'content': prompt,
-                'images': [image_path]
+                'images': [image]
             }],
             format='json' if not is_moondream else None,
             options={'temperature': 0.1}
         )
-        
-        content = response['message']['content']
-        
-        if is_moondream:
-            # Enhanced Heuristic Parsing for Moondream's natural language output
-            content_lower = content.lower()
-            
-            # 1. Extract Motif (More robust check)
-            motif = "Unknown"
-            motif_keywords = {
-                "Buddha": ["buddha", "彌勒", "佛"],
-                "Guanyin": ["guanyin", "觀音"],
-                "Leaf": ["leaf", "葉子", "一葉致富"],
-                "Dragon": ["dragon", "龍"],
-                "Ruyi": ["ruyi", "如意"],
-                "Cabbage": ["cabbage", "白菜"],
-                "Fish": ["fish", "魚"],
-                "Gourd": ["gourd", "葫蘆"],
-                "Peanut": ["peanut", "花生"],
-                "Bamboo": ["bamboo", "竹"],
-                "Peach": ["peach", "桃"]
-            }
-            for label, keys in motif_keywords.items():
-                if any(k in content_lower for k in keys):
-                    motif = label
-                    break
-            
-            # 2. Extract Color
-            color = "Extracted"
-            color_keywords = ["green", "white", "lavender", "purple", "yellow", "red", "black", "icy", "透明", "綠", "白", "紫"]
-            found_colors = [c for c in color_keywords if c in content_lower]
-            if found_colors:
-                color = found_colors[0].capitalize()
-
-            # 3. Extract Item Code from AI response if EasyOCR failed
-            final_code = ocr_code
-            if ocr_code == "Unknown":
-                code_match = re.search(r'([A-Z]{2}-\d{4}(?:_[A-Z]{2})?)', content.upper())
-                if code_match:
-                    final_code = code_match.group(1)
-
-            result = {
-                "item_code": final_code,
-                "visual_features": {
-                    "color": color,
-                    "motif": motif,
-                    "characteristics": content.strip()
-                }
-            }
-        else:
-            cleaned = clean_json_output(content)
-            result = json.loads(cleaned)
-            # Merge EasyOCR code if Vision model failed to read it or returned placeholder
-            if ocr_code != "Unknown":
-                result["item_code"] = ocr_code
+        result = _parse_crop_response(response['message']['content'], ocr_code, is_moondream)
+
+        if cache_key:
+            VISION_CACHE.put(cache_key, result, cost_ms=(time.time() - start_time) * 1000)
             
         return result
     except Exception as e:
         logger.error(f"Crop analysis failed: {e}")
-        return {
-            "item_code": ocr_code,
-            "visual_features": {
-                "color": "Analysis Failed", 
-                "motif": "Unknown", 
-                "characteristics": "Error during analysis"
-            }
-        }
+        return _crop_failure(ocr_code)
 
-def analyze_image_content(image_path: str, enable_ocr: bool = True, user_hints: str = "") -> List[Dict[str, Any]]:
+async def analyze_single_crop_async(image_path: Optional[str], ocr_code: str = "Unknown", user_hints: str = "", image_bytes: Optional[bytes] = None, deadline_s: Optional[float] = None) -> Dict[str, Any]:
     """
-    Analyzes an image using a Hybrid Pipeline:
-    1. Computer Vision Segmentation (Crops) + EasyOCR (Optional)
-    2. AI Vision Analysis on Crops
+    Awaitable analyze_single_crop through the host pool: same prompt, parsing and
+    vision cache; deadline_s bounds the whole call including retries.
     """
+    image = image_bytes if image_bytes is not None else image_path
+    label = image_path or "in-memory crop"
+    prompt, is_moondream = _build_crop_prompt(ocr_code)
+
+    cache_key = _crop_cache_key(image_path, image_bytes, prompt, user_hints, ocr_code)
+    if cache_key:
+        cached = VISION_CACHE.get(cache_key)
+        if cached is not None:
+            logger.info(f"Vision cache hit for {label}")
+            return cached
+
     start_time = time.time()
-    
-    # 1. Check Service
-    status = check_ollama_status(base_url=OLLAMA_HOST)
-    if not status["running"]:
-        return [{"error": f"Ollama service is not running or accessible at {OLLAMA_HOST}."}]
+    try:
+        response = await host_pool.async_chat(
+            model=VISION_MODEL,
+            messages=[{'role': 'user', 'content': prompt, 'images': [image]}],
+            format='json' if not is_moondream else None,
+            options={'temperature': 0.1},
+            deadline_s=deadline_s
+        )
+        result = _parse_crop_response(response['message']['content'], ocr_code, is_moondream)
 
-    logger.info(f"Analyzing image: {image_path} (OCR: {enable_ocr}, Hints: {user_hints})")
-    
-    # 2. Attempt Segmentation & Crop
+        if cache_key:
+            VISION_CACHE.put(cache_key, result, cost_ms=(time.time() - start_time) * 1000)
+
+        return result
+    except Exception as e:
+        logger.error(f"Crop analysis failed: {e}")
+        return _crop_failure(ocr_code)
+
+def analyze_crops(detected_crops: List[Dict[str, Any]], user_hints: str = "", max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Runs analyze_single_crop over the segmented crops on a bounded thread pool.
+    Results are returned in tray order; a failing crop only affects its own entry.
+    """
+    workers = max(1, min(max_workers or CROP_CONCURRENCY, len(detected_crops) or 1))
+
+    def _analyze(item: Dict[str, Any]) -> Dict[str, Any]:
+        crop_path = item.get("crop_path")
+        crop_bytes = item.get("crop_bytes")
+        try:
+            crop_result = analyze_single_crop(crop_path, item["ocr_code"], user_hints=user_hints, image_bytes=crop_bytes)
+        except Exception as e:
+            logger.error(f"Crop worker failed for {crop_path or 'in-memory crop'}: {e}")
+            crop_result = _crop_failure(item["ocr_code"])
+        return _attach_crop(crop_result, item)
+
+    if workers == 1:
+        return [_analyze(item) for item in detected_crops]
+
+    # executor.map preserves input order regardless of completion order
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crop") as executor:
+        return list(executor.map(_analyze, detected_crops))
+
+def _attach_crop(crop_result: Dict[str, Any], item: Dict[str, Any]) -> Dict[str, Any]:
+    """Adds the crop (and where it sits in the photo) to the result so UI and ingestion can use it."""
+    crop_result["crop_path"] = item.get("crop_path")
+    crop_result["bbox"] = item.get("bbox")
+    crop_result["ocr_code"] = item.get("ocr_code")
+    if item.get("crop_bytes") is not None:
+        crop_result["crop_bytes"] = item["crop_bytes"]
+    return crop_result
+
+async def analyze_crops_async(detected_crops: List[Dict[str, Any]], user_hints: str = "", max_concurrency: Optional[int] = None, deadline_s: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Fans analyze_single_crop_async out over the crops, at most max_concurrency
+    (default CROP_CONCURRENCY) in flight. Results are returned in tray order.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency or CROP_CONCURRENCY))
+
+    async def _analyze(item: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                crop_result = await analyze_single_crop_async(
+                    item.get("crop_path"), item["ocr_code"], user_hints=user_hints,
+                    image_bytes=item.get("crop_bytes"), deadline_s=deadline_s
+                )
+            except Exception as e:
+                logger.error(f"Crop task failed for {item.get('crop_path') or 'in-memory crop'}: {e}")
+                crop_result = _crop_failure(item["ocr_code"])
+        return _attach_crop(crop_result, item)
+
+    return list(await asyncio.gather(*(_analyze(item) for item in detected_crops)))
+
+def segment_image(image_path: str, enable_ocr: bool = True) -> List[Dict[str, Any]]:
+    """
+    Stage 1 of the hybrid pipeline: OpenCV segmentation + EasyOCR (Optional).
+    Returns an empty list when segmentation fails so the caller can fall back.
+    """
+    start_time = time.time()
     try:
-        detected_crops = processor.segment_and_crop(image_path, enable_ocr=enable_ocr)
+        detected_crops = get_processor().segment_and_crop(image_path, enable_ocr=enable_ocr)
     except Exception as e:
         logger.error(f"Segmentation failed: {e}")
         detected_crops = []
 
+    duration = (time.time() - start_time) * 1000
+    log_telemetry(
+        module="ai_engine",
+        action="segment_image",
+        execution_data={"duration_ms": duration, "exit_code": 0},
+        context={"crops": len(detected_crops), "ocr": enable_ocr},
+        args=[image_path]
+    )
+    return detected_crops
+
+def analyze_segmented_image(image_path: str, detected_crops: List[Dict[str, Any]], user_hints: str = "", max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Stage 2 of the hybrid pipeline: AI Vision Analysis on the crops produced by
+    segment_image, or on the full image when nothing was segmented.
+    """
+    start_time = time.time()
     results = []
 
     # 3. Process Crops (Zoom-In Analysis)
     if detected_crops:
         logger.info(f"Segmentation found {len(detected_crops)} items. Running Zoom-In Analysis.")
-        for item in detected_crops:
-            crop_path = item["crop_path"]
-            ocr_code = item["ocr_code"]
-            
-            # Analyze
-            crop_result = analyze_single_crop(crop_path, ocr_code, user_hints=user_hints)
-            
-            # Add file path to result so UI can display the crop
-            crop_result["crop_path"] = crop_path 
-            results.append(crop_result)
+        results = analyze_crops(detected_crops, user_hints=user_hints, max_workers=max_workers)
             
     else:
         # 4. Fallback: Full Image Analysis (Old Method)
@@ -291,20 +502,239 @@ def analyze_image_content(image_path: str, enable_ocr: bool = True, user_hints:
         module="ai_engine",
         action="analyze_image_hybrid",
         execution_data={"duration_ms": duration, "exit_code": 0, "items_found": len(results)},
+        context={
+            "crop_concurrency": max_workers or CROP_CONCURRENCY,
+            "vision_cache": VISION_CACHE.stats()
+        },
         args=[image_path]
     )
     
     return results
 
-def generate_marketing_copy(features: Dict[str, Any]) -> Dict[str, str]:
+def check_ollama_service() -> Optional[str]:
+    """Error message when no Ollama host is running, else None (cached registry status)."""
+    if not any(get_registry(url).status()["running"] for url in OLLAMA_HOSTS):
+        return f"Ollama service is not running or accessible at {', '.join(OLLAMA_HOSTS)}."
+    return None
+
+def analyze_image_content(image_path: str, enable_ocr: bool = True, user_hints: str = "", max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Analyzes an image using a Hybrid Pipeline:
+    1. Computer Vision Segmentation (Crops) + EasyOCR (Optional)
+    2. AI Vision Analysis on Crops (concurrent, up to max_workers / CROP_CONCURRENCY)
+    """
+    # 1. Check Service (cached; refreshed in the background)
+    service_error = check_ollama_service()
+    if service_error:
+        return [{"error": service_error}]
+
+    logger.info(f"Analyzing image: {image_path} (OCR: {enable_ocr}, Hints: {user_hints})")
+    
+    # 2. Attempt Segmentation & Crop
+    detected_crops = segment_image(image_path, enable_ocr=enable_ocr)
+
+    return analyze_segmented_image(image_path, detected_crops, user_hints=user_hints, max_workers=max_workers)
+
+def _feature_signature(visual_features: Dict[str, Any]) -> str:
+    """
+    Normalizes the features that feed the copy prompt so near-identical items
+    (same motif/color, description differing only in case/punctuation/spacing)
+    share one signature.
+    """
+    def _norm(value: Any) -> str:
+        text = str(value or "").lower()
+        text = re.sub(r'[^\w\s]', ' ', text)
+        return " ".join(text.split())
+
+    return "|".join([
+        _norm(visual_features.get('motif', 'Unknown')),
+        _norm(visual_features.get('color', 'Unknown')),
+        _norm(visual_features.get('characteristics', 'Unknown'))
+    ])
+
+# Striped locks keyed on the signature, so concurrent identical items generate only
+# once. A fixed set: unrelated items rarely share a stripe, and nothing accumulates.
+COPY_LOCK_STRIPES = 64
+_copy_locks = [threading.Lock() for _ in range(COPY_LOCK_STRIPES)]
+
+def _get_copy_lock(key: str) -> threading.Lock:
+    return _copy_locks[hash(key) % COPY_LOCK_STRIPES]
+
+def _build_rewrite_prompt(descriptions: Dict[str, str]) -> str:
+    return f"""
+    請改寫以下三段翡翠文案，保持原意、風格與長度，但使用不同的用詞與句式。
+    必須使用「繁體中文（台灣）」，並以相同的 JSON 鍵 "hero", "modern", "social" 回傳。
+    {json.dumps(descriptions, ensure_ascii=False)}
+    """
+
+def _merge_rewrite(content: str, descriptions: Dict[str, str]) -> Dict[str, str]:
+    rewritten = json.loads(clean_json_output(content))
+    return {key: rewritten.get(key) or descriptions[key] for key in ["hero", "modern", "social"]}
+
+def _rewrite_marketing_copy(descriptions: Dict[str, str]) -> Dict[str, str]:
+    """
+    Cheap variant of a cached generation: asks TEXT_MODEL to reword the existing
+    copy instead of composing it from scratch. Falls back to the cached copy.
+    """
+    try:
+        response = safe_chat_call(
+            model=TEXT_MODEL,
+            messages=[{'role': 'user', 'content': _build_rewrite_prompt(descriptions)}],
+            format='json',
+            options={'temperature': 0.9}
+        )
+        return _merge_rewrite(response['message']['content'], descriptions)
+    except Exception as e:
+        logger.warning(f"Copy rewrite failed, reusing cached copy: {e}")
+        return dict(descriptions)
+
+async def _rewrite_marketing_copy_async(descriptions: Dict[str, str], deadline_s: Optional[float] = None) -> Dict[str, str]:
+    try:
+        response = await host_pool.async_chat(
+            model=TEXT_MODEL,
+            messages=[{'role': 'user', 'content': _build_rewrite_prompt(descriptions)}],
+            format='json',
+            options={'temperature': 0.9},
+            deadline_s=deadline_s
+        )
+        return _merge_rewrite(response['message']['content'], descriptions)
+    except Exception as e:
+        logger.warning(f"Copy rewrite failed, reusing cached copy: {e}")
+        return dict(descriptions)
+
+def _log_copy_cache_hit(variant: bool):
+    log_telemetry(
+        module="ai_engine",
+        action="generate_marketing_copy",
+        execution_data={"duration_ms": 0, "exit_code": 0},
+        context={"copy_cache": "hit", "variant": variant, **COPY_CACHE.stats()}
+    )
+
+def generate_marketing_copy(features: Dict[str, Any], variant: Optional[bool] = None) -> Dict[str, str]:
     """
     Generates three styles of Traditional Chinese descriptions:
     1. Hero (Poetic/Classical)
     2. Modern (E-commerce/Benefit-focused)
     3. Social (Short/Hashtags)
+
+    Generations are cached on the normalized feature signature. With variant=True
+    (default: COPY_VARIANT_MODE) a cache hit is returned as a cheap rewrite instead
+    of verbatim.
+    """
+    if variant is None:
+        variant = COPY_VARIANT_MODE
+
+    if not COPY_CACHE_ENABLED:
+        return _generate_marketing_copy(features)[0]
+
+    signature = _feature_signature(features.get('visual_features', {}))
+    cache_key = make_cache_key(TEXT_MODEL, COPY_PROMPT_VERSION, signature)
+
+    with _get_copy_lock(cache_key):
+        cached = COPY_CACHE.get(cache_key)
+        if cached is None:
+            start_time = time.time()
+            descriptions, cacheable = _generate_marketing_copy(features)
+            if cacheable:
+                COPY_CACHE.put(cache_key, descriptions, cost_ms=(time.time() - start_time) * 1000)
+            return descriptions
+
+    _log_copy_cache_hit(variant)
+    if variant:
+        return _rewrite_marketing_copy(cached)
+    return cached
+
+# In-flight async generations per event loop, so concurrent identical items generate once
+_copy_inflight = weakref.WeakKeyDictionary()
+
+async def generate_marketing_copy_async(features: Dict[str, Any], variant: Optional[bool] = None, deadline_s: Optional[float] = None) -> Dict[str, str]:
+    """
+    Awaitable generate_marketing_copy through the host pool, with the same copy
+    cache. Concurrent calls with the same feature signature share one generation.
+    """
+    if variant is None:
+        variant = COPY_VARIANT_MODE
+
+    if not COPY_CACHE_ENABLED:
+        return (await _generate_marketing_copy_async(features, deadline_s))[0]
+
+    signature = _feature_signature(features.get('visual_features', {}))
+    cache_key = make_cache_key(TEXT_MODEL, COPY_PROMPT_VERSION, signature)
+
+    cached = COPY_CACHE.get(cache_key)
+    if cached is None:
+        inflight = _copy_inflight.setdefault(asyncio.get_running_loop(), {})
+        task = inflight.get(cache_key)
+        if task is None:
+            async def _generate_and_cache():
+                start_time = time.time()
+                descriptions, cacheable = await _generate_marketing_copy_async(features, deadline_s)
+                if cacheable:
+                    COPY_CACHE.put(cache_key, descriptions, cost_ms=(time.time() - start_time) * 1000)
+                return descriptions
+
+            task = inflight[cache_key] = asyncio.ensure_future(_generate_and_cache())
+            task.add_done_callback(lambda _: inflight.pop(cache_key, None))
+            return await asyncio.shield(task)
+        cached = await asyncio.shield(task)
+
+    _log_copy_cache_hit(variant)
+    if variant:
+        return await _rewrite_marketing_copy_async(cached, deadline_s)
+    return cached
+
+def generate_marketing_copy_stream(features: Dict[str, Any], variant: Optional[bool] = None) -> Iterator[Dict[str, str]]:
+    """
+    Streaming generate_marketing_copy. Yields the copy deck ({'hero', 'modern',
+    'social'}, fields still missing are '') each time a field grows, parsed from
+    the partial JSON as tokens arrive. The last deck yielded is the final result,
+    identical to what generate_marketing_copy returns, and is cached the same way.
+    Cache hits yield once. Unlike the blocking call, concurrent identical items
+    are not de-duplicated.
     """
+    if variant is None:
+        variant = COPY_VARIANT_MODE
+
+    cache_key = None
+    if COPY_CACHE_ENABLED:
+        signature = _feature_signature(features.get('visual_features', {}))
+        cache_key = make_cache_key(TEXT_MODEL, COPY_PROMPT_VERSION, signature)
+        cached = COPY_CACHE.get(cache_key)
+        if cached is not None:
+            _log_copy_cache_hit(variant)
+            yield _rewrite_marketing_copy(cached) if variant else cached
+            return
+
     start_time = time.time()
-    
+    first_token_ms = None
+    content = ""
+    last_deck = None
+    try:
+        for delta in host_pool.chat_stream(
+            model=TEXT_MODEL,
+            messages=[{'role': 'user', 'content': _build_copy_prompt(features)}],
+            format='json',
+            options={'temperature': 0.7}
+        ):
+            if first_token_ms is None:
+                first_token_ms = (time.time() - start_time) * 1000
+            content += delta
+            partial = parse_partial_json_fields(content, COPY_KEYS)
+            deck = {key: partial.get(key, "") for key in COPY_KEYS}
+            if deck != last_deck and any(deck.values()):
+                last_deck = deck
+                yield deck
+        descriptions, cacheable = _parse_copy_response(
+            content, start_time, context={"stream": True, "first_token_ms": first_token_ms}
+        )
+    except Exception as e:
+        descriptions, cacheable = _copy_failure(e, start_time)
+
+    if cacheable and cache_key:
+        COPY_CACHE.put(cache_key, descriptions, cost_ms=(time.time() - start_time) * 1000)
+    yield descriptions
+
+def _build_copy_prompt(features: Dict[str, Any]) -> str:
     motif = features.get('visual_features', {}).get('motif', 'Unknown')
     color = features.get('visual_features', {}).get('color', 'Unknown')
     characteristics = features.get('visual_features', {}).get('characteristics', 'Unknown')
@@ -314,7 +744,7 @@ def generate_marketing_copy(features: Dict[str, Any]) -> Dict[str, str]:
     symbolism_section = f"文化寓意參考: {symbolism_context}" if symbolism_context else ""
     
     # Construct the Prompt
-    prompt = f"""
+    return f"""
     您是一位專業的高端翡翠珠寶文案撰寫專家，精通台灣市場的語言習慣。
     物件詳細資料：
     - 主題: {motif}
@@ -336,55 +766,81 @@ def generate_marketing_copy(features: Dict[str, Any]) -> Dict[str, str]:
         "social": "🐾 超可愛的翡翠小萌物..."
     }}
     """
+
+def _parse_copy_response(content: str, start_time: float, context: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, str], bool]:
+    """Parses the copy JSON and logs the generation. Returns (descriptions, cacheable)."""
+    try:
+        cleaned_content = clean_json_output(content)
+        descriptions = json.loads(cleaned_content)
+        
+        # Defensive check for keys
+        cacheable = True
+        for key in COPY_KEYS:
+            if key not in descriptions:
+                descriptions[key] = "生成不完整 (Generation Incomplete)"
+                cacheable = False
+                
+    except json.JSONDecodeError:
+        logger.warning(f"Failed to parse Copy JSON. Raw: {content}")
+        cacheable = False
+        descriptions = {
+            "hero": content,
+            "modern": "格式錯誤 (Format Error)",
+            "social": "格式錯誤 (Format Error)"
+        }
+
+    duration = (time.time() - start_time) * 1000
+    log_telemetry(
+        module="ai_engine",
+        action="generate_marketing_copy",
+        execution_data={"duration_ms": duration, "exit_code": 0},
+        context={"copy_cache": "miss", **(context or {})}
+    )
     
+    return descriptions, cacheable
+
+def _copy_failure(error: Exception, start_time: float) -> Tuple[Dict[str, str], bool]:
+    duration = (time.time() - start_time) * 1000
+    logger.error(f"Copy Generation Failed: {error}")
+    log_telemetry(
+        module="ai_engine",
+        action="generate_marketing_copy",
+        execution_data={"duration_ms": duration, "exit_code": 1, "error": str(error)}
+    )
+    return {
+        "hero": "生成失敗 (Generation Failed)",
+        "modern": "",
+        "social": ""
+    }, False
+
+def _generate_marketing_copy(features: Dict[str, Any]) -> Tuple[Dict[str, str], bool]:
+    """
+    Uncached TEXT_MODEL generation behind generate_marketing_copy.
+    Returns (descriptions, cacheable); only complete generations are cacheable.
+    """
+    start_time = time.time()
     try:
         # Call with Retry
         response = safe_chat_call(
             model=TEXT_MODEL,
-            messages=[{'role': 'user', 'content': prompt}],
+            messages=[{'role': 'user', 'content': _build_copy_prompt(features)}],
             format='json',
             options={'temperature': 0.7}
         )
-        
-        content = response['message']['content']
-        
-        try:
-            cleaned_content = clean_json_output(content)
-            descriptions = json.loads(cleaned_content)
-            
-            # Defensive check for keys
-            for key in ["hero", "modern", "social"]:
-                if key not in descriptions:
-                    descriptions[key] = "生成不完整 (Generation Incomplete)"
-                    
-        except json.JSONDecodeError:
-            logger.warning(f"Failed to parse Copy JSON. Raw: {content}")
-            descriptions = {
-                "hero": content,
-                "modern": "格式錯誤 (Format Error)",
-                "social": "格式錯誤 (Format Error)"
-            }
+        return _parse_copy_response(response['message']['content'], start_time)
+    except Exception as e:
+        return _copy_failure(e, start_time)
 
-        duration = (time.time() - start_time) * 1000
-        log_telemetry(
-            module="ai_engine",
-            action="generate_marketing_copy",
-            execution_data={"duration_ms": duration, "exit_code": 0}
+async def _generate_marketing_copy_async(features: Dict[str, Any], deadline_s: Optional[float] = None) -> Tuple[Dict[str, str], bool]:
+    start_time = time.time()
+    try:
+        response = await host_pool.async_chat(
+            model=TEXT_MODEL,
+            messages=[{'role': 'user', 'content': _build_copy_prompt(features)}],
+            format='json',
+            options={'temperature': 0.7},
+            deadline_s=deadline_s
         )
-        
-        return descriptions
-
+        return _parse_copy_response(response['message']['content'], start_time)
     except Exception as e:
-        duration = (time.time() - start_time) * 1000
-        logger.error(f"Copy Generation Failed: {e}")
-        log_telemetry(
-            module="ai_engine",
-            action="generate_marketing_copy",
-            execution_data={"duration_ms": duration, "exit_code": 1, "error": str(e)}
-        )
-        return {
-            "hero": "生成失敗 (Generation Failed)",
-            "modern": "",
-            "social": ""
-        }
-
+        return _copy_failure(e, start_time)
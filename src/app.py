@@ -2,24 +2,83 @@ import streamlit as st
 import logging
 import json
 import os
+import sys
 import time
-from PIL import Image
-from utils import check_ollama_status, get_default_model_config
-from ai_engine import analyze_image_content, generate_marketing_copy
-from db_manager import save_item, get_all_items, check_and_migrate_db, export_items_to_csv
+import tempfile
+import threading
+from utils import get_default_model_config
+from model_registry import get_registry
+from batch_pipeline import BatchPipeline, count_model_loads
+from model_scheduler import ModelAffinityScheduler, MODEL_AFFINITY
+from ai_engine import host_pool, COPY_STREAMING, generate_marketing_copy_stream
+from preprocess_pool import PREPROCESS_WORKERS, get_shared_pool
+from db_manager import save_items, query_items, count_items, check_and_migrate_db, export_items, EXPORT_FORMATS, get_db_connection, get_items_version
 from grading_utils import JadeGrader
-from pdf_generator import generate_pdf_catalog
-from manual_generator import generate_user_manual
 
 # Configure Logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # --- Initialization ---
-# Migrate DB on startup
-check_and_migrate_db()
-# Initialize Grader
-grader = JadeGrader()
+# Streamlit re-runs this script on every interaction: startup work goes through
+# st.cache_resource (once per process) and DB-derived artifacts through
+# st.cache_data keyed on the items change counter (get_items_version).
+def _warm_up_ocr():
+    # vision_utils pulls in OpenCV/NumPy; import it off the script thread too
+    from vision_utils import ocr_service
+    ocr_service.warm_up()
+
+def _ocr_status():
+    """OCRService.status(), or 'loading' while vision_utils is still being imported."""
+    ocr_service = getattr(sys.modules.get("vision_utils"), "ocr_service", None)
+    if ocr_service is None:
+        return {"state": "loading", "load_s": None, "error": None}
+    return ocr_service.status()
+
+@st.cache_resource(show_spinner=False)
+def _startup():
+    # Migrate DB on startup
+    check_and_migrate_db()
+    # Load EasyOCR in the background so neither the first render nor the first tray waits for it
+    threading.Thread(target=_warm_up_ocr, name="ocr-import", daemon=True).start()
+
+@st.cache_resource(show_spinner=False)
+def _get_grader() -> JadeGrader:
+    return JadeGrader()
+
+@st.cache_data(show_spinner=False)
+def _user_manual_pdf() -> bytes:
+    # Static content: built once per process, on first request (ReportLab loads lazily)
+    from manual_generator import generate_user_manual
+    return generate_user_manual()
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _count_items(items_version: str) -> int:
+    return count_items()
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _query_page(items_version: str, grade: str, keyword: str, sort: str, offset: int, limit):
+    return query_items(grade=grade, keyword=keyword, sort=sort, offset=offset, limit=limit)
+
+@st.cache_data(max_entries=len(EXPORT_FORMATS), show_spinner=False)
+def _export_file(items_version: str, export_format: str):
+    """Builds the export once per catalog version. Returns (bytes, row_count)."""
+    # Private temp file per build, so concurrent sessions never share (or delete) one
+    fd, export_path = tempfile.mkstemp(suffix=f".{EXPORT_FORMATS[export_format]['ext']}")
+    os.close(fd)
+    try:
+        row_count = export_items(export_path, export_format)
+        with open(export_path, "rb") as f:
+            return f.read(), row_count
+    finally:
+        os.remove(export_path)
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _catalog_pdf(items_version: str, grade: str, keyword: str, sort: str) -> bytes:
+    from pdf_generator import generate_pdf_catalog
+    # The catalog covers every match, not just the current page
+    all_matches = query_items(grade=grade, keyword=keyword, sort=sort, limit=None)["items"]
+    return generate_pdf_catalog(all_matches)
 
 # --- UI Configuration (Traditional Chinese Default) ---
 st.set_page_config(
@@ -29,36 +88,39 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+_startup()
+grader = _get_grader()
+
 # --- Sidebar: System Status & Config ---
 with st.sidebar:
     st.header("系統狀態 (System Status)")
     
-    # 1. Check Connection
-    ollama_status = check_ollama_status()
+    # 1. Check Connection (cached registry, same host as the AI engine)
+    config = get_default_model_config()
+    registry = get_registry(config["base_url"])
+    ollama_status = registry.status()
     system_healthy = False
     
     if ollama_status["running"]:
         st.success(f"✅ AI 引擎運作中 ({ollama_status.get('message', '')})")
         
         # 2. Check Models
-        config = get_default_model_config()
         vision_model = config["vision_model"]
         text_model = config["text_model"]
         
-        from utils import check_model_availability
-        vision_check = check_model_availability(vision_model)
-        text_check = check_model_availability(text_model)
+        vision_check = registry.check_model(vision_model)
+        text_check = registry.check_model(text_model)
         
         # Vision Model Status
         if vision_check["available"]:
-            st.caption(f"👁️ 視覺模型: {vision_model} (Ready)")
+            st.caption(f"👁️ 視覺模型: {vision_model} ({registry.describe_model(vision_model)})")
         else:
             st.error(f"❌ 缺少視覺模型: {vision_model}")
             st.code(f"ollama pull {vision_model}", language="bash")
             
         # Text Model Status
         if text_check["available"]:
-            st.caption(f"✍️ 文字模型: {text_model} (Ready)")
+            st.caption(f"✍️ 文字模型: {text_model} ({registry.describe_model(text_model)})")
         else:
             st.error(f"❌ 缺少文字模型: {text_model}")
             st.code(f"ollama pull {text_model}", language="bash")
@@ -74,20 +136,30 @@ with st.sidebar:
         st.error("🛑 AI 引擎未連線")
         st.warning("請確保 Ollama 已在背景執行.\n\n(Please ensure Ollama is running in the background.)")
         if st.button("重新檢查連線 (Retry)"):
+            registry.invalidate()
             st.rerun()
 
+    # 3. Host Pool (only shown when several Ollama hosts are configured)
+    if len(host_pool.hosts) > 1:
+        with st.expander(f"🖥️ AI 主機 ({len(host_pool.hosts)})"):
+            for url, host_stats in host_pool.stats().items():
+                up = get_registry(url).status()["running"]
+                latency = f"{host_stats['latency_ms']:.0f} ms" if host_stats["latency_ms"] is not None else "-"
+                st.caption(f"{'🟢' if up and host_stats['breaker'] != 'open' else '🔴'} {url} · 進行中 {host_stats['in_flight']} · {latency}")
+
     st.markdown("---")
-    # Manual Download
-    try:
-        manual_pdf = generate_user_manual()
-        st.download_button(
-            label="📘 下載使用手冊 (User Manual)",
-            data=manual_pdf,
-            file_name="JadeScribe_User_Manual.pdf",
-            mime="application/pdf"
-        )
-    except Exception as e:
-        logger.error(f"Manual generation failed: {e}")
+    # Manual Download (only built on request)
+    if st.button("📘 使用手冊 (User Manual)"):
+        try:
+            manual_pdf = _user_manual_pdf()
+            st.download_button(
+                label="📥 下載使用手冊 (Download Manual)",
+                data=manual_pdf,
+                file_name="JadeScribe_User_Manual.pdf",
+                mime="application/pdf"
+            )
+        except Exception as e:
+            logger.error(f"Manual generation failed: {e}")
 
     st.markdown("---")
     st.header("設定 (Settings)")
@@ -100,6 +172,14 @@ with st.sidebar:
     )
     if not enable_ocr:
         st.caption("⚠️ 快速模式：將跳過文字識別，僅進行影像分析。")
+    else:
+        ocr_status = _ocr_status()
+        if ocr_status["state"] == "ready":
+            st.caption(f"🔤 OCR 引擎已就緒 (Ready, {ocr_status['load_s']:.1f}s)")
+        elif ocr_status["state"] == "unavailable":
+            st.caption(f"⚠️ OCR 引擎無法使用 (Unavailable): {ocr_status['error']}")
+        else:
+            st.caption("⏳ OCR 引擎載入中... (Loading, first scan may wait)")
     
     st.markdown("---")
     st.header("危險區域 (Danger Zone)")
@@ -110,6 +190,7 @@ with st.sidebar:
         if st.button("🗑️ 重置資料庫 (Reset DB)", type="primary", disabled=not confirm_reset):
             from db_manager import reset_database
             if reset_database():
+                st.cache_data.clear()
                 st.toast("資料庫已重置！ (Database Reset)", icon="🧹")
                 time.sleep(1)
                 st.rerun()
@@ -153,6 +234,8 @@ with tab1:
             )
         
         if analyze_btn:
+            # Write all uploads first so the pipeline can start segmenting ahead of the UI
+            jobs = []
             for file_idx, uploaded_file in enumerate(uploaded_files):
                 # Unique filename per session/file to prevent multi-window collision
                 unique_prefix = f"{int(time.time())}_{file_idx}"
@@ -163,61 +246,121 @@ with tab1:
                 
                 with open(temp_path, "wb") as f:
                     f.write(uploaded_file.getbuffer())
-                
+                jobs.append({"name": uploaded_file.name, "path": temp_path})
+
+            # Multi-file batches preprocess in worker processes (one per PREPROCESS_WORKERS)
+            use_pool = PREPROCESS_WORKERS > 1 and len(jobs) > 1
+            preprocess_pool = get_shared_pool() if use_pool else None
+            if MODEL_AFFINITY:
+                # All vision calls first, then all copy, so models are not swapped per item.
+                # Copy is generated by the scheduler's pool (COPY_WORKERS); with
+                # COPY_STREAMING only the first item is streamed below, for fast first text.
+                pipeline = ModelAffinityScheduler(
+                    enable_ocr=enable_ocr,
+                    user_hints=user_tags,
+                    preprocess_pool=preprocess_pool,
+                    stream_first=COPY_STREAMING
+                )
+            else:
+                # Segmentation -> Vision -> Copywriting run as overlapping stages
+                # (with COPY_STREAMING, copy is streamed below instead of generated in the pipeline)
+                pipeline = BatchPipeline(
+                    enable_ocr=enable_ocr,
+                    user_hints=user_tags,
+                    generate_copy=not COPY_STREAMING,
+                    preprocess_pool=preprocess_pool
+                )
+            loads_before = host_pool.model_loads()
+            batch_progress = st.progress(0.0, text="⏳ 批次處理中 (Processing batch)...")
+
+            for job in pipeline.run(jobs):
+                file_idx = job["index"]
+                file_name = job["name"]
+                batch_progress.progress((file_idx + 1) / len(jobs), text=f"⏳ 已完成 {file_idx+1}/{len(jobs)}")
+
                 st.markdown(f"---")
-                st.subheader(f"🖼️ 正在處理 ({file_idx+1}/{len(uploaded_files)}): {uploaded_file.name}")
+                st.subheader(f"🖼️ 處理結果 ({file_idx+1}/{len(jobs)}): {file_name}")
                 
-                with st.spinner(f"⏳ 正在分析 {uploaded_file.name}..."):
-                    # 1. Vision Analysis
-                    items_found = analyze_image_content(temp_path, enable_ocr=enable_ocr, user_hints=user_tags)
+                items_found = job.get("items", [])
+                
+                if "error" in job:
+                     st.error(f"[{file_name}] Analysis Failed: {job['error']}")
+                elif not items_found:
+                    st.warning(f"⚠️ [{file_name}] 未檢測到任何翡翠物件。")
+                else:
+                    st.success(f"✅ [{file_name}] 成功識別 {len(items_found)} 個物件!")
                     
-                    if len(items_found) == 1 and "error" in items_found[0]:
-                         st.error(f"[{uploaded_file.name}] Analysis Failed: {items_found[0]['error']}")
-                    elif not items_found:
-                        st.warning(f"⚠️ [{uploaded_file.name}] 未檢測到任何翡翠物件。")
-                    else:
-                        st.success(f"✅ [{uploaded_file.name}] 成功識別 {len(items_found)} 個物件!")
+                    # Iterate through each detected item
+                    items_to_save = []
+                    for idx, item in enumerate(items_found):
+                        item_code = item.get("item_code", f"Unknown-{file_idx}-{idx}")
+                        features = item.get("visual_features", {})
+                        crop_path = item.get("crop_path", None)
+                        crop_bytes = item.get("crop_bytes", None)
                         
-                        # Iterate through each detected item
-                        for idx, item in enumerate(items_found):
-                            item_code = item.get("item_code", f"Unknown-{file_idx}-{idx}")
-                            features = item.get("visual_features", {})
-                            crop_path = item.get("crop_path", None)
-                            
-                            rank = grader.calculate_grade(features)
-                            rank_info = grader.get_tier_info(rank)
+                        rank = grader.calculate_grade(features)
+                        rank_info = grader.get_tier_info(rank)
+                        
+                        with st.expander(f"💎 物件 #{idx+1} ({file_name}): {item_code}", expanded=True):
+                            c1, c2 = st.columns([1, 2])
+                            with c1:
+                                if crop_bytes:
+                                    st.image(crop_bytes, caption="🔍 增強細節")
+                                elif crop_path and os.path.exists(crop_path):
+                                    st.image(crop_path, caption="🔍 增強細節")
+                                else:
+                                    st.caption("無局部特寫")
+                                
+                                st.metric("識別編號", item_code)
+                                st.markdown(f"**參考評級:** :{rank_info['color']}[{rank}級 - {rank_info['name']}]")
+                                st.json(features)
                             
-                            with st.expander(f"💎 物件 #{idx+1} ({uploaded_file.name}): {item_code}", expanded=True):
-                                c1, c2 = st.columns([1, 2])
-                                with c1:
-                                    if crop_path and os.path.exists(crop_path):
-                                        st.image(crop_path, caption="🔍 增強細節")
-                                    else:
-                                        st.caption("無局部特寫")
-                                    
-                                    st.metric("識別編號", item_code)
-                                    st.markdown(f"**參考評級:** :{rank_info['color']}[{rank}級 - {rank_info['name']}]")
-                                    st.json(features)
+                            with c2:
+                                t_hero, t_modern, t_social = st.tabs(["📜 經典", "🛍️ 現代", "📱 社群"])
+                                if "copy_future" in item: # Generated in the scheduler's pool
+                                    with st.spinner("✍️ 文案生成中..."):
+                                        item["copy_deck"] = item.pop("copy_future").result()
+                                if "copy_deck" in item:
+                                    copy_deck = item["copy_deck"]
+                                    with t_hero: st.write(copy_deck["hero"])
+                                    with t_modern: st.write(copy_deck["modern"])
+                                    with t_social: st.write(copy_deck["social"])
+                                else:
+                                    # Stream copy into the tabs as the fields arrive
+                                    placeholders = {}
+                                    with t_hero: placeholders["hero"] = st.empty()
+                                    with t_modern: placeholders["modern"] = st.empty()
+                                    with t_social: placeholders["social"] = st.empty()
+                                    placeholders["hero"].caption("✍️ 文案生成中...")
+                                    for copy_deck in generate_marketing_copy_stream(item):
+                                        for key, placeholder in placeholders.items():
+                                            if copy_deck[key]:
+                                                placeholder.write(copy_deck[key])
                                 
-                                with c2:
-                                    with st.spinner(f"✍️ 正在生成文案..."):
-                                        copy_deck = generate_marketing_copy(item)
-                                        t_hero, t_modern, t_social = st.tabs(["📜 經典", "🛍️ 現代", "📱 社群"])
-                                        with t_hero: st.write(copy_deck["hero"])
-                                        with t_modern: st.write(copy_deck["modern"])
-                                        with t_social: st.write(copy_deck["social"])
-                                        
-                                        if item_code and "Unknown" not in item_code:
-                                            save_item({
-                                                "item_code": item_code,
-                                                "title": f"Jade Pendant - {features.get('motif', 'Unknown')}",
-                                                "description_hero": copy_deck["hero"],
-                                                "description_modern": copy_deck["modern"],
-                                                "description_social": copy_deck["social"],
-                                                "attributes": features,
-                                                "rarity_rank": rank
-                                            })
-                                            st.toast(f"已儲存: {item_code}", icon="💾")
+                                if item_code and "Unknown" not in item_code:
+                                    items_to_save.append({
+                                        "item_code": item_code,
+                                        "title": f"Jade Pendant - {features.get('motif', 'Unknown')}",
+                                        "description_hero": copy_deck["hero"],
+                                        "description_modern": copy_deck["modern"],
+                                        "description_social": copy_deck["social"],
+                                        "attributes": features,
+                                        "rarity_rank": rank
+                                    })
+
+                    # Save the whole tray in one transaction
+                    if items_to_save:
+                        save_results = save_items(items_to_save)
+                        saved_codes = [r["item_code"] for r in save_results if r["success"]]
+                        failed = [r for r in save_results if not r["success"]]
+                        if saved_codes:
+                            st.toast(f"已儲存 {len(saved_codes)} 筆: {', '.join(saved_codes)}", icon="💾")
+                        for r in failed:
+                            st.error(f"儲存失敗 (Save failed): {r['item_code']} - {r['error']}")
+
+            batch_progress.progress(1.0, text="✅ 批次處理完成 (Batch complete)")
+            model_loads = count_model_loads(loads_before, host_pool.model_loads())
+            st.caption(f"🔁 本批次模型載入次數 (Model loads): {sum(model_loads.values())}")
     else:
         st.info("💡 請先上傳照片以開始編目流程。")
 
@@ -229,54 +372,62 @@ with tab2:
 
     # --- Toolbar (Search & Filter) ---
     st.markdown("##### 🔍 搜尋與篩選 (Search & Filter)")
-    f_col1, f_col2, f_col3 = st.columns([2, 1, 1])
+    f_col1, f_col2, f_col3, f_col4 = st.columns([2, 1, 1, 1])
     with f_col1:
-        search_query = st.text_input("關鍵字搜尋 (Search by code or title)", placeholder="PA-0425, Guanyin...")
+        search_query = st.text_input("關鍵字搜尋 (Search by code, title or description)", placeholder="PA-0425, Guanyin...")
     with f_col2:
         filter_grade = st.selectbox("等級篩選 (Grade)", ["All", "S", "A", "B"])
     with f_col3:
+        sort_labels = {
+            "updated_desc": "最新更新 (Newest)",
+            "updated_asc": "最早更新 (Oldest)",
+            "rank": "等級 (Grade)",
+            "code": "編號 (Code)",
+        }
+        sort_order = st.selectbox("排序 (Sort)", list(sort_labels.keys()), format_func=sort_labels.get)
+    with f_col4:
         if st.button("🔄 重新整理 (Refresh)"):
             st.rerun()
             
-    # --- Data Loading & Filtering ---
-    all_items = get_all_items()
-    filtered_items = []
-    
-    for item in all_items:
-        # 1. Filter by Grade
-        rank = item.get('rarity_rank', 'B')
-        if filter_grade != "All" and rank != filter_grade:
-            continue
-            
-        # 2. Filter by Search Query
-        q = search_query.lower()
-        if q:
-            text_corpus = (str(item['item_code']) + str(item['title']) + str(item['description_hero'])).lower()
-            if q not in text_corpus:
-                continue
-        
-        filtered_items.append(item)
+    # --- Data Loading (server-side filter + pagination, cached until the catalog changes) ---
+    PAGE_SIZE = 25
+    items_version = get_items_version()
+    total_items = _count_items(items_version)
+    page = st.number_input("頁碼 (Page)", min_value=1, value=1, step=1)
+
+    page_result = _query_page(items_version, filter_grade, search_query, sort_order, (page - 1) * PAGE_SIZE, PAGE_SIZE)
+    filtered_items = page_result["items"]
+    match_count = page_result["total"]
+    page_count = max(1, (match_count + PAGE_SIZE - 1) // PAGE_SIZE)
     
-    st.caption(f"顯示 {len(filtered_items)} / {len(all_items)} 筆資料")
+    st.caption(f"符合 {match_count} / {total_items} 筆資料，第 {page}/{page_count} 頁")
 
     # --- Export Tools ---
     with st.expander("📤 匯出工具 (Export Tools)"):
         ec1, ec2 = st.columns(2)
         with ec1:
-            # CSV Export
-            csv_data = export_items_to_csv()
-            st.download_button(
-                label="📥 下載 CSV 報表",
-                data=csv_data,
-                file_name="jade_inventory_export.csv",
-                mime="text/csv",
-                use_container_width=True
+            # Inventory Export (streamed to disk on request, reused until the catalog changes)
+            export_format = st.selectbox(
+                "匯出格式 (Format)", list(EXPORT_FORMATS.keys()),
+                format_func=lambda f: {"csv": "CSV", "jsonl": "JSON Lines", "parquet": "Parquet"}[f]
             )
+            if st.button("📦 準備匯出檔案 (Prepare Export)", use_container_width=True):
+                try:
+                    export_bytes, row_count = _export_file(items_version, export_format)
+                    st.download_button(
+                        label=f"📥 下載報表 ({row_count} 筆)",
+                        data=export_bytes,
+                        file_name=f"jade_inventory_export.{EXPORT_FORMATS[export_format]['ext']}",
+                        mime=EXPORT_FORMATS[export_format]["mime"],
+                        use_container_width=True
+                    )
+                except Exception as e:
+                    st.error(f"Export Failed: {e}")
         with ec2:
             # PDF Export
             if st.button("📄 生成 PDF 目錄 (Generate Catalog)", use_container_width=True):
                 try:
-                    pdf_bytes = generate_pdf_catalog(filtered_items)
+                    pdf_bytes = _catalog_pdf(items_version, filter_grade, search_query, sort_order)
                     st.download_button(
                         label="📥 下載 PDF 目錄",
                         data=pdf_bytes,
@@ -327,16 +478,13 @@ with tab3:
     st.header("系統日誌與遙測 (Telemetry)")
     st.write("目前僅支援後台記錄 (Logs are currently backend-only). Check `telemetry` table in SQLite.")
     
-    # Simple query to show last 5 logs
-    import sqlite3
-    conn = sqlite3.connect(os.path.join("data", "jade_inventory.db"))
+    # Simple query to show last 10 logs
+    conn = get_db_connection()
     try:
         logs = conn.execute("SELECT timestamp, module, action, duration_ms, error FROM telemetry ORDER BY id DESC LIMIT 10").fetchall()
         if logs:
-            st.table(logs)
+            st.table([tuple(row) for row in logs])
         else:
             st.info("尚無日誌資料 (No logs yet)")
     except Exception as e:
         st.error(f"Error fetching logs: {e}")
-    finally:
-        conn.close()
\ No newline at end of file
@@ -0,0 +1,218 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, Any, Optional, List, Iterator, Callable
+
+from ai_engine import segment_image, analyze_segmented_image, generate_marketing_copy, host_pool, check_ollama_service
+from db_manager import log_telemetry
+
+# Configure Logging
+logger = logging.getLogger(__name__)
+
+# Per-stage worker counts and queue depth (backpressure between stages)
+SEGMENT_WORKERS = int(os.getenv("PIPELINE_SEGMENT_WORKERS", "1"))
+VISION_WORKERS = int(os.getenv("PIPELINE_VISION_WORKERS", "1"))
+COPY_WORKERS = int(os.getenv("PIPELINE_COPY_WORKERS", "2"))
+QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "2"))
+
+_SENTINEL = object()
+
+def count_model_loads(before: Dict[str, int], after: Dict[str, int]) -> Dict[str, int]:
+    """Per-model loads between two HostPool.model_loads() readings."""
+    return {model: after[model] - before.get(model, 0) for model in after if after[model] > before.get(model, 0)}
+
+
+class BatchPipeline:
+    """
+    Staged pipeline for a multi-file upload batch:
+    segmentation/OCR -> vision analysis -> marketing copy.
+
+    Each stage runs on its own worker threads and hands jobs downstream through a
+    bounded queue, so segmentation of file N+1 overlaps vision inference on file N
+    and copywriting for earlier files. A full queue blocks the upstream stage, which
+    keeps the batch limited by the slowest stage instead of the sum of all stages.
+    """
+
+    def __init__(
+        self,
+        enable_ocr: bool = True,
+        user_hints: str = "",
+        generate_copy: bool = True,
+        segment_workers: Optional[int] = None,
+        vision_workers: Optional[int] = None,
+        copy_workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        preprocess_pool=None,
+        stage_hook: Optional[Callable[[str, Dict[str, Any]], None]] = None
+    ):
+        self.enable_ocr = enable_ocr
+        self.user_hints = user_hints
+        self.generate_copy = generate_copy
+        self.queue_size = max(1, queue_size or QUEUE_SIZE)
+        # Optional preprocess_pool.PreprocessPool: segmentation then runs in worker
+        # processes, one in-flight photo per process
+        self.preprocess_pool = preprocess_pool
+        if preprocess_pool is not None and segment_workers is None:
+            segment_workers = preprocess_pool.workers
+        # Optional stage_hook(stage_name, job), called as each job enters a stage
+        # (also for jobs that already failed and will pass through unprocessed)
+        self.stage_hook = stage_hook
+
+        self.stages = [
+            ("segment", self._segment_stage, max(1, segment_workers or SEGMENT_WORKERS)),
+            ("vision", self._vision_stage, max(1, vision_workers or VISION_WORKERS)),
+        ]
+        if generate_copy:
+            self.stages.append(("copy", self._copy_stage, max(1, copy_workers or COPY_WORKERS)))
+
+        self._stop = threading.Event()
+        self._busy_ms = {name: 0.0 for name, _, _ in self.stages}
+        self._busy_lock = threading.Lock()
+
+    # --- Stage Functions ---
+
+    def _segment_stage(self, job: Dict[str, Any]):
+        if self.preprocess_pool is not None:
+            job["crops"] = self.preprocess_pool.segment(job["path"], enable_ocr=self.enable_ocr)
+        else:
+            job["crops"] = segment_image(job["path"], enable_ocr=self.enable_ocr)
+
+    def _vision_stage(self, job: Dict[str, Any]):
+        items = analyze_segmented_image(job["path"], job.pop("crops", []), user_hints=self.user_hints)
+        if len(items) == 1 and "error" in items[0]:
+            job["error"] = items[0]["error"]
+            items = []
+        job["items"] = items
+
+    def _copy_stage(self, job: Dict[str, Any]):
+        for item in job.get("items", []):
+            item["copy_deck"] = generate_marketing_copy(item)
+
+    # --- Plumbing ---
+
+    def _put(self, q: queue.Queue, item: Any):
+        """Blocking put that still honours cancellation."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue) -> Any:
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _SENTINEL
+
+    def _worker(self, name: str, fn: Callable, in_q: queue.Queue, out_q: queue.Queue, remaining: List[int], lock: threading.Lock, downstream_workers: int):
+        while True:
+            job = self._get(in_q)
+            if job is _SENTINEL:
+                break
+
+            if self.stage_hook is not None:
+                try:
+                    self.stage_hook(name, job)
+                except Exception as e:
+                    logger.warning(f"Stage hook failed for '{name}': {e}")
+
+            if "error" not in job:
+                start_time = time.time()
+                try:
+                    fn(job)
+                except Exception as e:
+                    logger.error(f"Pipeline stage '{name}' failed for {job.get('name')}: {e}")
+                    job["error"] = str(e)
+                with self._busy_lock:
+                    self._busy_ms[name] += (time.time() - start_time) * 1000
+
+            self._put(out_q, job)
+
+        # Last worker of this stage closes the downstream queue
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            for _ in range(downstream_workers):
+                self._put(out_q, _SENTINEL)
+
+    def run(self, jobs: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Processes jobs of the form {'name': str, 'path': str} and yields each job,
+        in input order, once it has passed all stages. Finished jobs carry 'items'
+        (with 'copy_deck' per item when copy generation is enabled) or 'error'.
+        When no Ollama host is running, every job fails with that error up front.
+        """
+        # Once per batch, instead of every crop failing its vision call
+        service_error = check_ollama_service()
+        if service_error:
+            logger.error(service_error)
+            for idx, job in enumerate(jobs):
+                yield dict(job, index=idx, items=[], error=service_error)
+            return
+
+        start_time = time.time()
+        loads_before = host_pool.model_loads()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = []
+
+        for stage_idx, (name, fn, workers) in enumerate(self.stages):
+            downstream = self.stages[stage_idx + 1][2] if stage_idx + 1 < len(self.stages) else 1
+            remaining, lock = [workers], threading.Lock()
+            for n in range(workers):
+                t = threading.Thread(
+                    target=self._worker,
+                    args=(name, fn, queues[stage_idx], queues[stage_idx + 1], remaining, lock, downstream),
+                    name=f"pipeline-{name}-{n}",
+                    daemon=True
+                )
+                t.start()
+                threads.append(t)
+
+        def _feed():
+            for idx, job in enumerate(jobs):
+                job = dict(job, index=idx)
+                self._put(queues[0], job)
+            for _ in range(self.stages[0][2]):
+                self._put(queues[0], _SENTINEL)
+
+        feeder = threading.Thread(target=_feed, name="pipeline-feed", daemon=True)
+        feeder.start()
+
+        # Re-order completed jobs so callers see them in upload order
+        pending = {}
+        next_idx = 0
+        try:
+            while next_idx < len(jobs):
+                job = self._get(queues[-1])
+                if job is _SENTINEL:
+                    break
+                pending[job["index"]] = job
+                while next_idx in pending:
+                    yield pending.pop(next_idx)
+                    next_idx += 1
+        finally:
+            # Also reached when the consumer abandons the generator (e.g. Streamlit rerun)
+            self._stop.set()
+            feeder.join(timeout=1)
+            for t in threads:
+                t.join(timeout=1)
+
+            duration = (time.time() - start_time) * 1000
+            log_telemetry(
+                module="batch_pipeline",
+                action="run_batch",
+                execution_data={"duration_ms": duration, "exit_code": 0},
+                context={
+                    "files": len(jobs),
+                    "completed": next_idx,
+                    "workers": {name: workers for name, _, workers in self.stages},
+                    "stage_busy_ms": {k: round(v, 1) for k, v in self._busy_ms.items()},
+                    "model_loads": count_model_loads(loads_before, host_pool.model_loads())
+                }
+            )
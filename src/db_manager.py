@@ -4,22 +4,143 @@ import logging
 import os
 import csv
 import io
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+import itertools
+import queue
+import threading
+import time
+import atexit
+import weakref
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Iterator, Iterable
+from datetime import datetime, timezone
 
 # Configure Logging
 logger = logging.getLogger(__name__)
 
 DB_PATH = os.path.join("data", "jade_inventory.db")
 
+# Per-connection tuning, applied once when a pooled connection is opened.
+# WAL lets readers proceed while a writer commits; NORMAL sync is safe under WAL.
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000", # ~16 MB page cache
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+BUSY_TIMEOUT_S = 10.0
+
+class _PooledConnection(sqlite3.Connection):
+    """sqlite3.Connection subclass so the pool can hold weak references to it."""
+
+class ConnectionManager:
+    """
+    Thread-safe SQLite connection manager.
+
+    Each thread reuses one connection per database file for its lifetime, so hot
+    paths no longer pay for connect/close. Connections run in autocommit mode;
+    writes are grouped with transaction(), which issues BEGIN IMMEDIATE to take the
+    write lock up front instead of failing mid-transaction with "database is locked".
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = weakref.WeakSet() # Closed automatically when the owning thread exits
+        self._wal_paths = set()
+        self._generation = 0
+        self._savepoint_seq = itertools.count()
+
+    def get(self, path: str) -> sqlite3.Connection:
+        """Returns this thread's connection to path, opening it on first use."""
+        conns = self._local.__dict__.setdefault("conns", {})
+        entry = conns.get(path)
+        if entry and entry[0] == self._generation:
+            return entry[1]
+
+        conn = sqlite3.connect(
+            path,
+            timeout=BUSY_TIMEOUT_S,
+            isolation_level=None,
+            check_same_thread=False, # Only so close_all() can close it from another thread
+            factory=_PooledConnection
+        )
+        conn.row_factory = sqlite3.Row # Access columns by name
+        self._configure(conn, path)
+
+        with self._lock:
+            self._open.add(conn)
+            conns[path] = (self._generation, conn)
+        return conn
+
+    def _configure(self, conn: sqlite3.Connection, path: str):
+        # journal_mode is persistent in the database file, so set it once per path
+        if path not in self._wal_paths:
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._wal_paths.add(path)
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+
+    @contextmanager
+    def transaction(self, path: str) -> Iterator[sqlite3.Connection]:
+        """
+        Commits on success and rolls back on error. Nested use becomes a SAVEPOINT,
+        so helpers can open their own transaction inside a caller's.
+        """
+        conn = self.get(path)
+        if conn.in_transaction:
+            name = f"sp_{next(self._savepoint_seq)}"
+            conn.execute(f"SAVEPOINT {name}")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute(f"ROLLBACK TO {name}")
+                conn.execute(f"RELEASE {name}")
+                raise
+            conn.execute(f"RELEASE {name}")
+        else:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def close_all(self):
+        """Closes every pooled connection (all threads); they reopen lazily."""
+        with self._lock:
+            self._generation += 1
+            conns = list(self._open)
+            self._open = weakref.WeakSet()
+            self._wal_paths.clear()
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+_pool = ConnectionManager()
+
+def get_connection(path: str) -> sqlite3.Connection:
+    """Pooled connection to an arbitrary SQLite file (e.g. the result cache)."""
+    return _pool.get(path)
+
+def transaction(path: Optional[str] = None):
+    """Context manager yielding a pooled connection inside a transaction (default: DB_PATH)."""
+    return _pool.transaction(path or DB_PATH)
+
+def close_db_connections():
+    """Closes all pooled connections, e.g. before the database file is replaced."""
+    _pool.close_all()
+
 def reset_database():
     """
     WARNING: Drops all tables and re-initializes the database from schema.sql.
     This action is irreversible.
     """
     try:
-        # 1. Close any existing connections (best effort)
-        # In this simple app, we open/close per request, so it should be fine.
+        # 1. Close any existing pooled connections so the file can be removed
+        close_db_connections()
         
         # 2. Re-run Schema
         SCHEMA_PATH = os.path.join("data", "schema.sql")
@@ -27,14 +148,18 @@ def reset_database():
             logger.error(f"Schema file not found at {SCHEMA_PATH}")
             return False
 
-        if os.path.exists(DB_PATH):
-            os.remove(DB_PATH) # Delete the file completely to ensure clean slate
-            logger.info("Existing database file deleted.")
+        for path in (DB_PATH, DB_PATH + "-wal", DB_PATH + "-shm"):
+            if os.path.exists(path):
+                os.remove(path) # Delete the file completely to ensure clean slate
+        logger.info("Existing database file deleted.")
 
         conn = sqlite3.connect(DB_PATH)
         with open(SCHEMA_PATH, 'r', encoding='utf-8') as f:
             conn.executescript(f.read())
         conn.close()
+
+        # 3. Objects created in code (full-text index), so callers need not re-migrate
+        check_and_migrate_db()
         
         logger.info("Database has been reset successfully.")
         return True
@@ -43,48 +168,337 @@ def reset_database():
         return False
 
 def get_db_connection():
-    """Establishes a connection to the SQLite database."""
+    """Returns this thread's pooled connection to the SQLite database."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row # Access columns by name
-        return conn
+        return _pool.get(DB_PATH)
     except sqlite3.Error as e:
         logger.error(f"Database connection failed: {e}")
         return None
 
+# Columns added after v1.2, per table (name -> DDL)
+ADDED_COLUMNS = {
+    "images": {
+        # Ingestion queue (v1.3)
+        "attempts": "INTEGER DEFAULT 0",
+        "last_error": "TEXT",
+        "updated_at": "DATETIME",
+        # File fingerprint for skipping unchanged photos (v1.4)
+        "content_hash": "TEXT",
+        "file_size": "INTEGER",
+        "mtime": "REAL",
+        "duplicate_of": "INTEGER",
+    },
+    "item_images": {
+        "bbox": "TEXT", # JSON [x, y, w, h] of the item's crop in the photo
+        "ocr_code": "TEXT",
+    },
+}
+
 def check_and_migrate_db():
     """Checks for schema updates and applies them if necessary."""
-    conn = get_db_connection()
-    if not conn:
-        return
-
     try:
-        cursor = conn.cursor()
-        
-        # Check existing columns in 'items' table
-        cursor.execute("PRAGMA table_info(items)")
-        columns = [row['name'] for row in cursor.fetchall()]
-        
-        # Add 'description_modern' if missing
-        if 'description_modern' not in columns:
-            logger.info("Migrating DB: Adding 'description_modern' column.")
-            cursor.execute("ALTER TABLE items ADD COLUMN description_modern TEXT")
-            
-        # Add 'description_social' if missing
-        if 'description_social' not in columns:
-            logger.info("Migrating DB: Adding 'description_social' column.")
-            cursor.execute("ALTER TABLE items ADD COLUMN description_social TEXT")
+        with transaction() as conn:
+            cursor = conn.cursor()
             
-        # Add 'rarity_rank' if missing (New in v1.2)
-        if 'rarity_rank' not in columns:
-            logger.info("Migrating DB: Adding 'rarity_rank' column.")
-            cursor.execute("ALTER TABLE items ADD COLUMN rarity_rank TEXT DEFAULT 'B'")
+            # Check existing columns in 'items' table
+            cursor.execute("PRAGMA table_info(items)")
+            columns = [row['name'] for row in cursor.fetchall()]
             
-        conn.commit()
+            # Add 'description_modern' if missing
+            if 'description_modern' not in columns:
+                logger.info("Migrating DB: Adding 'description_modern' column.")
+                cursor.execute("ALTER TABLE items ADD COLUMN description_modern TEXT")
+                
+            # Add 'description_social' if missing
+            if 'description_social' not in columns:
+                logger.info("Migrating DB: Adding 'description_social' column.")
+                cursor.execute("ALTER TABLE items ADD COLUMN description_social TEXT")
+                
+            # Add 'rarity_rank' if missing (New in v1.2)
+            if 'rarity_rank' not in columns:
+                logger.info("Migrating DB: Adding 'rarity_rank' column.")
+                cursor.execute("ALTER TABLE items ADD COLUMN rarity_rank TEXT DEFAULT 'B'")
+
+            # Catalog query indexes (grade filter + recency sort)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_rank_updated ON items(rarity_rank, updated_at)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_updated ON items(updated_at)")
+
+            # Ingestion queue and file fingerprints on 'images', crop info on 'item_images'
+            for table, added in ADDED_COLUMNS.items():
+                cursor.execute(f"PRAGMA table_info({table})")
+                existing = [row['name'] for row in cursor.fetchall()]
+                for column, ddl in added.items():
+                    if column not in existing:
+                        logger.info(f"Migrating DB: Adding '{table}.{column}' column.")
+                        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_images_status ON images(processed_status, id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_images_hash ON images(content_hash)")
     except sqlite3.Error as e:
         logger.error(f"Database migration failed: {e}")
-    finally:
-        conn.close()
+
+    _ensure_fts_index()
+    _ensure_change_counter()
+    _unescape_attributes()
+
+# Full-text index over the catalog. External-content FTS5 table kept in sync with
+# 'items' by triggers; the trigram tokenizer gives substring matching for codes
+# and CJK text (which has no word boundaries for unicode61 to split on).
+FTS_COLUMNS = ("item_code", "title", "description_hero", "description_modern", "description_social", "attributes_json")
+
+def _ensure_fts_index():
+    """Creates items_fts and its sync triggers if missing. No-op without FTS5/trigram."""
+    cols = ", ".join(FTS_COLUMNS)
+    new_cols = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+    old_cols = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+    # Only re-index when an indexed column changes (not e.g. a bulk rarity_rank regrade)
+    update_trigger = f"""
+        CREATE TRIGGER IF NOT EXISTS items_fts_au AFTER UPDATE OF {cols} ON items BEGIN
+            INSERT INTO items_fts(items_fts, rowid, {cols}) VALUES ('delete', old.rowid, {old_cols});
+            INSERT INTO items_fts(rowid, {cols}) VALUES (new.rowid, {new_cols});
+        END
+    """
+    try:
+        with transaction() as conn:
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name='items_fts'").fetchone()
+            if exists:
+                trigger = conn.execute("SELECT sql FROM sqlite_master WHERE name='items_fts_au'").fetchone()
+                if trigger and "UPDATE OF" not in trigger["sql"]:
+                    logger.info("Migrating DB: Limiting 'items_fts_au' to indexed columns.")
+                    conn.execute("DROP TRIGGER items_fts_au")
+                    conn.execute(update_trigger)
+                return
+            logger.info("Migrating DB: Creating full-text index 'items_fts'.")
+            conn.execute(f"""
+                CREATE VIRTUAL TABLE items_fts USING fts5(
+                    {cols}, content='items', content_rowid='rowid', tokenize='trigram'
+                )
+            """)
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS items_fts_ai AFTER INSERT ON items BEGIN
+                    INSERT INTO items_fts(rowid, {cols}) VALUES (new.rowid, {new_cols});
+                END
+            """)
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS items_fts_ad AFTER DELETE ON items BEGIN
+                    INSERT INTO items_fts(items_fts, rowid, {cols}) VALUES ('delete', old.rowid, {old_cols});
+                END
+            """)
+            conn.execute(update_trigger)
+            # Index rows that existed before the FTS table
+            conn.execute("INSERT INTO items_fts(items_fts) VALUES ('rebuild')")
+    except sqlite3.Error as e:
+        logger.warning(f"Full-text search unavailable, falling back to LIKE queries: {e}")
+
+# Catalog change counter: triggers bump meta.items_version on every write to
+# 'items', so caches of derived artifacts (exports, PDFs, pages) can be keyed on it.
+# items_epoch is random per database file, so a reset database never reuses a key.
+CHANGE_COUNTER_STATEMENTS = (
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO meta (key, value) VALUES ('items_epoch', abs(random() % 1000000000))",
+    "INSERT OR IGNORE INTO meta (key, value) VALUES ('items_version', 0)",
+) + tuple(
+    f"""
+    CREATE TRIGGER IF NOT EXISTS items_version_{suffix} AFTER {event} ON items BEGIN
+        UPDATE meta SET value = value + 1 WHERE key = 'items_version';
+    END
+    """
+    for suffix, event in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE"))
+)
+
+def _ensure_change_counter():
+    """Creates the meta table and the items change-counter triggers if missing."""
+    try:
+        with transaction() as conn:
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name='items_version_ad'").fetchone()
+            if exists:
+                return
+            logger.info("Migrating DB: Creating items change counter.")
+            for statement in CHANGE_COUNTER_STATEMENTS:
+                conn.execute(statement)
+    except sqlite3.Error as e:
+        logger.error(f"Change counter migration failed: {e}")
+
+def _unescape_attributes(batch_size: int = 1000):
+    """
+    One-off: rewrites attributes_json stored with \\uXXXX escapes (older versions
+    used ensure_ascii) as plain UTF-8. The items_fts_au trigger re-indexes the
+    rewritten rows. Marked done in meta.attributes_utf8.
+    """
+    try:
+        with transaction() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'attributes_utf8'").fetchone():
+                return
+            cursor = conn.execute("SELECT rowid, attributes_json FROM items WHERE attributes_json LIKE '%\\u%'")
+            rewritten = 0
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                updates = []
+                for rowid, attributes_json in rows:
+                    try:
+                        unescaped = json.dumps(json.loads(attributes_json), ensure_ascii=False)
+                    except ValueError:
+                        continue
+                    if unescaped != attributes_json:
+                        updates.append((unescaped, rowid))
+                # Leaves updated_at alone: the content did not change
+                conn.executemany("UPDATE items SET attributes_json = ? WHERE rowid = ?", updates)
+                rewritten += len(updates)
+            if rewritten:
+                logger.info(f"Migrating DB: Re-encoded attributes_json of {rewritten} item(s) as UTF-8.")
+            conn.execute("INSERT INTO meta (key, value) VALUES ('attributes_utf8', 1)")
+    except sqlite3.Error as e:
+        logger.error(f"attributes_json migration failed: {e}")
+
+def get_items_version() -> str:
+    """
+    Opaque token that changes whenever any item is inserted, updated or deleted
+    (by any process). Cheap: one primary-key read.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return ""
+    try:
+        rows = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('items_epoch', 'items_version')").fetchall())
+    except sqlite3.Error:
+        return "" # Not migrated yet
+    return f"{rows.get('items_epoch', 0)}.{rows.get('items_version', 0)}"
+
+def rebuild_fts_index():
+    """Re-indexes items_fts from 'items' (e.g. after a VACUUM renumbered rowids)."""
+    try:
+        with transaction() as conn:
+            conn.execute("INSERT INTO items_fts(items_fts) VALUES ('rebuild')")
+        return True
+    except sqlite3.Error as e:
+        logger.error(f"Failed to rebuild full-text index: {e}")
+        return False
+
+# Telemetry is buffered in memory and written in batches by a background thread
+TELEMETRY_FLUSH_SIZE = int(os.getenv("TELEMETRY_FLUSH_SIZE", "50"))
+TELEMETRY_FLUSH_INTERVAL_S = float(os.getenv("TELEMETRY_FLUSH_INTERVAL_S", "2.0"))
+TELEMETRY_QUEUE_MAX = int(os.getenv("TELEMETRY_QUEUE_MAX", "10000"))
+TELEMETRY_SPILL_PATH = os.path.join("data", "telemetry_spill.jsonl")
+
+TELEMETRY_INSERT = """
+    INSERT INTO telemetry (
+        timestamp, program, version, module, action, args, 
+        duration_ms, cpu_time_ms, gpu_time_ms, memory_mb, 
+        exit_code, error, context_json
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_STOP = object()
+
+class TelemetryWriter:
+    """
+    Asynchronous telemetry sink.
+
+    log() only enqueues a row; a daemon thread writes queued rows with executemany
+    in one transaction once flush_size rows are waiting or flush_interval_s has
+    passed since the first one. Rows that do not fit in the queue (or fail to
+    write) are appended to a JSON Lines spill file instead of blocking the caller.
+    The buffer is flushed at interpreter exit.
+    """
+
+    def __init__(
+        self,
+        flush_size: int = TELEMETRY_FLUSH_SIZE,
+        flush_interval_s: float = TELEMETRY_FLUSH_INTERVAL_S,
+        max_queue: int = TELEMETRY_QUEUE_MAX,
+        spill_path: str = TELEMETRY_SPILL_PATH
+    ):
+        self.flush_size = max(1, flush_size)
+        self.flush_interval_s = flush_interval_s
+        self.spill_path = spill_path
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self.dropped = 0
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+                self._thread.start()
+
+    def log(self, row: tuple):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._spill([row])
+
+    def _run(self):
+        batch = []
+        deadline = 0.0
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None # Flush interval elapsed
+
+            if item is _STOP:
+                self._write(batch)
+                return
+            if isinstance(item, threading.Event): # Explicit flush request
+                self._write(batch)
+                batch = []
+                item.set()
+                continue
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval_s
+                batch.append(item)
+            if item is None or len(batch) >= self.flush_size:
+                self._write(batch)
+                batch = []
+
+    def _write(self, batch: List[tuple]):
+        if not batch:
+            return
+        try:
+            with transaction() as conn:
+                conn.executemany(TELEMETRY_INSERT, batch)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write {len(batch)} telemetry rows: {e}")
+            self._spill(batch)
+
+    def _spill(self, rows: List[tuple]):
+        try:
+            with self._spill_lock, open(self.spill_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        except OSError as e:
+            self.dropped += len(rows)
+            logger.error(f"Telemetry spill failed, dropped {len(rows)} rows: {e}")
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Blocks until everything logged so far is written (or timeout)."""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        """Stops the writer thread after writing the remaining buffer."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+_telemetry_writer = TelemetryWriter()
+
+def flush_telemetry(timeout: float = 5.0) -> bool:
+    """Writes all buffered telemetry now. Returns False if the flush timed out."""
+    return _telemetry_writer.flush(timeout)
 
 def log_telemetry(
     module: str,
@@ -95,28 +509,16 @@ def log_telemetry(
 ):
     """
     Logs an event to the telemetry table.
+    The row is buffered and written asynchronously; see TelemetryWriter.
     """
-    conn = get_db_connection()
-    if not conn:
-        return
-
     try:
-        cursor = conn.cursor()
-        
         # Defaults
         execution_data = execution_data or {}
         context = context or {}
         args = args or []
         
-        query = """
-            INSERT INTO telemetry (
-                program, version, module, action, args, 
-                duration_ms, cpu_time_ms, gpu_time_ms, memory_mb, 
-                exit_code, error, context_json
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        
         values = (
+            datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"), # Event time, not flush time
             "jade-scribe", "1.0.0", module, action, json.dumps(args),
             execution_data.get("duration_ms", 0),
             execution_data.get("cpu_time_ms", 0),
@@ -127,12 +529,40 @@ def log_telemetry(
             json.dumps(context)
         )
         
-        cursor.execute(query, values)
-        conn.commit()
-    except sqlite3.Error as e:
+        _telemetry_writer.log(values)
+    except (TypeError, ValueError) as e:
         logger.error(f"Failed to log telemetry: {e}")
-    finally:
-        conn.close()
+
+ITEM_UPSERT = """
+    INSERT INTO items (
+        item_code, title, description_hero, description_modern, description_social, 
+        attributes_json, rarity_rank, updated_at
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(item_code) DO UPDATE SET
+        title=excluded.title,
+        description_hero=excluded.description_hero,
+        description_modern=excluded.description_modern,
+        description_social=excluded.description_social,
+        attributes_json=excluded.attributes_json,
+        rarity_rank=excluded.rarity_rank,
+        updated_at=CURRENT_TIMESTAMP
+"""
+
+def _item_values(item_data: Dict[str, Any]) -> tuple:
+    """Maps an item dict to the ITEM_UPSERT parameter tuple."""
+    if not item_data.get("item_code"):
+        raise ValueError("missing item_code")
+    return (
+        item_data["item_code"],
+        item_data.get("title", ""),
+        item_data.get("description_hero", ""),
+        item_data.get("description_modern", ""),
+        item_data.get("description_social", ""),
+        # Unescaped, so keyword search over attributes_json matches CJK values
+        json.dumps(item_data.get("attributes", {}), ensure_ascii=False),
+        item_data.get("rarity_rank", "B")
+    )
 
 def save_item(item_data: Dict[str, Any]):
     """
@@ -142,49 +572,370 @@ def save_item(item_data: Dict[str, Any]):
         item_data: Dictionary containing 'item_code', 'title', 'description_hero', 
                    'description_modern', 'description_social', 'attributes', 'rarity_rank'.
     """
-    conn = get_db_connection()
-    if not conn:
+    try:
+        values = _item_values(item_data)
+        with transaction() as conn:
+            conn.execute(ITEM_UPSERT, values)
+        logger.info(f"Item saved successfully: {item_data['item_code']}")
+        return True
+        
+    except (sqlite3.Error, ValueError, TypeError) as e:
+        logger.error(f"Failed to save item {item_data.get('item_code')}: {e}")
         return False
 
+def save_items(items: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Saves or updates many items in a single transaction.
+
+    Rows are upserted with executemany; if the batch is rejected, it is retried
+    row by row under savepoints so one bad row does not sink the others.
+
+    Returns:
+        One {'item_code', 'success', 'error'} dict per input item, in input order.
+    """
+    results = []
+    rows = [] # (result index, values)
+    for item_data in items:
+        code = item_data.get("item_code") if isinstance(item_data, dict) else None
+        try:
+            rows.append((len(results), _item_values(item_data)))
+            results.append({"item_code": code, "success": True, "error": None})
+        except (ValueError, TypeError, AttributeError) as e:
+            results.append({"item_code": code, "success": False, "error": str(e)})
+
+    if not rows:
+        return results
+
     try:
-        cursor = conn.cursor()
-        
-        query = """
-            INSERT INTO items (
-                item_code, title, description_hero, description_modern, description_social, 
-                attributes_json, rarity_rank, updated_at
+        with transaction() as conn:
+            conn.executemany(ITEM_UPSERT, [values for _, values in rows])
+    except sqlite3.Error as batch_error:
+        logger.warning(f"Bulk save rejected ({batch_error}); retrying row by row.")
+        try:
+            with transaction() as conn:
+                for idx, values in rows:
+                    try:
+                        with transaction(): # Nested -> SAVEPOINT
+                            conn.execute(ITEM_UPSERT, values)
+                    except sqlite3.Error as e:
+                        results[idx].update(success=False, error=str(e))
+        except sqlite3.Error as e:
+            for idx, _ in rows:
+                results[idx].update(success=False, error=str(e))
+
+    saved = sum(1 for r in results if r["success"])
+    logger.info(f"Bulk save: {saved}/{len(results)} items saved.")
+    return results
+
+def _item_from_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Accepts both export-style rows (attributes_json) and save_item dicts (attributes)."""
+    item = {k: v for k, v in record.items() if v is not None}
+    attributes_json = item.pop("attributes_json", None)
+    if "attributes" not in item and attributes_json:
+        item["attributes"] = json.loads(attributes_json)
+    if not item.get("rarity_rank"):
+        item.pop("rarity_rank", None)
+    return item
+
+def _import_in_batches(records: Iterable[Dict[str, Any]], batch_size: int) -> Dict[str, Any]:
+    summary = {"total": 0, "saved": 0, "failed": 0, "errors": []}
+
+    def _fail(result: Dict[str, Any]):
+        summary["failed"] += 1
+        if len(summary["errors"]) < 100: # Keep the report readable
+            summary["errors"].append(result)
+
+    iterator = iter(records)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            break
+        summary["total"] += len(batch)
+
+        items = []
+        for record in batch:
+            try:
+                items.append(_item_from_record(record))
+            except (ValueError, TypeError, AttributeError) as e:
+                code = record.get("item_code") if isinstance(record, dict) else None
+                _fail({"item_code": code, "success": False, "error": str(e)})
+
+        for result in save_items(items):
+            if result["success"]:
+                summary["saved"] += 1
+            else:
+                _fail(result)
+    return summary
+
+def import_items_from_csv(path: str, batch_size: int = 1000) -> Dict[str, Any]:
+    """
+    Bulk-imports items from a CSV file with the export_items_to_csv headers.
+    Returns a summary dict: total, saved, failed, errors (first 100 failures).
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return _import_in_batches(csv.DictReader(f), batch_size)
+
+def import_items_from_json(path: str, batch_size: int = 1000) -> Dict[str, Any]:
+    """
+    Bulk-imports items from a JSON array (or JSON Lines file) of item dicts.
+    Returns a summary dict: total, saved, failed, errors (first 100 failures).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(1024).lstrip()
+        f.seek(0)
+        if head.startswith("["):
+            records = json.load(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        return _import_in_batches(records, batch_size)
+
+# Ingestion queue: one 'images' row per source photo.
+# PENDING -> PROCESSING (claimed by a worker) -> PROCESSED | ERROR
+IMAGE_STATUSES = ("PENDING", "PROCESSING", "PROCESSED", "ERROR")
+
+def enqueue_images(paths: Iterable[str]) -> int:
+    """Adds image files to the queue as PENDING (known paths are left as they are). Returns the number added."""
+    rows = [(os.path.abspath(p),) for p in paths]
+    if not rows:
+        return 0
+    try:
+        with transaction() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO images (file_path, processed_status) VALUES (?, 'PENDING')", rows)
+            return conn.total_changes - before
+    except sqlite3.Error as e:
+        logger.error(f"Failed to enqueue images: {e}")
+        return 0
+
+def claim_next_image() -> Optional[Dict[str, Any]]:
+    """
+    Atomically moves the oldest PENDING image to PROCESSING and returns it
+    ({'id', 'file_path', 'attempts', 'content_hash'}), or None when the queue is drained.
+    Safe to call from several processes: BEGIN IMMEDIATE serializes claims.
+    """
+    try:
+        with transaction() as conn:
+            row = conn.execute(
+                "SELECT id, file_path, attempts, content_hash FROM images WHERE processed_status = 'PENDING' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE images SET processed_status = 'PROCESSING', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (row["id"],)
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ON CONFLICT(item_code) DO UPDATE SET
-                title=excluded.title,
-                description_hero=excluded.description_hero,
-                description_modern=excluded.description_modern,
-                description_social=excluded.description_social,
-                attributes_json=excluded.attributes_json,
-                rarity_rank=excluded.rarity_rank,
-                updated_at=CURRENT_TIMESTAMP
+            return {"id": row["id"], "file_path": row["file_path"], "attempts": row["attempts"] + 1, "content_hash": row["content_hash"]}
+    except sqlite3.Error as e:
+        logger.error(f"Failed to claim next image: {e}")
+        return None
+
+def mark_image_processed(image_id: int, links: Optional[List[Dict[str, Any]]] = None):
+    """
+    Marks an image PROCESSED. With links ({'item_code', 'bbox', 'ocr_code'} per
+    saved item), its item_images rows are replaced in the same transaction.
+    """
+    with transaction() as conn:
+        if links is not None:
+            _replace_image_links(conn, image_id, links)
+        conn.execute(
+            "UPDATE images SET processed_status = 'PROCESSED', last_error = NULL, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (image_id,)
+        )
+
+def _replace_image_links(conn: sqlite3.Connection, image_id: int, links: List[Dict[str, Any]]):
+    conn.execute("DELETE FROM item_images WHERE image_id = ?", (image_id,))
+    # The first photo an item is linked from stays its primary image
+    conn.executemany(
         """
-        
-        values = (
-            item_data["item_code"],
-            item_data.get("title", ""),
-            item_data.get("description_hero", ""),
-            item_data.get("description_modern", ""),
-            item_data.get("description_social", ""),
-            json.dumps(item_data.get("attributes", {})),
-            item_data.get("rarity_rank", "B")
+        INSERT OR REPLACE INTO item_images (item_code, image_id, is_primary, bbox, ocr_code)
+        VALUES (?, ?, NOT EXISTS (SELECT 1 FROM item_images WHERE item_code = ? AND is_primary = 1), ?, ?)
+        """,
+        [
+            (link["item_code"], image_id, link["item_code"],
+             json.dumps(link["bbox"]) if link.get("bbox") is not None else None, link.get("ocr_code"))
+            for link in links
+        ]
+    )
+
+def mark_image_error(image_id: int, error: str):
+    with transaction() as conn:
+        conn.execute(
+            "UPDATE images SET processed_status = 'ERROR', last_error = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (str(error), image_id)
         )
-        
-        cursor.execute(query, values)
-        conn.commit()
-        logger.info(f"Item saved successfully: {item_data['item_code']}")
-        return True
-        
+
+def requeue_images(statuses: Iterable[str] = ("PROCESSING",)) -> int:
+    """
+    Puts images in the given states back to PENDING. With the default, resets
+    claims left behind by an interrupted run (call only while no workers run).
+    Returns the number of rows requeued.
+    """
+    statuses = [s for s in statuses if s in IMAGE_STATUSES]
+    if not statuses:
+        return 0
+    placeholders = ", ".join("?" for _ in statuses)
+    try:
+        with transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE images SET processed_status = 'PENDING', updated_at = CURRENT_TIMESTAMP WHERE processed_status IN ({placeholders})",
+                statuses
+            )
+            return cursor.rowcount
     except sqlite3.Error as e:
-        logger.error(f"Failed to save item {item_data.get('item_code')}: {e}")
-        return False
-    finally:
-        conn.close()
+        logger.error(f"Failed to requeue images: {e}")
+        return 0
+
+def _copy_image_links(conn: sqlite3.Connection, image_id: int, source_id: int):
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO item_images (item_code, image_id, is_primary, bbox, ocr_code)
+        SELECT item_code, ?, 0, bbox, ocr_code FROM item_images WHERE image_id = ?
+        """,
+        (image_id, source_id)
+    )
+
+def mark_image_duplicate(image_id: int, source_id: int):
+    """Marks an image PROCESSED as a byte-identical copy of source_id, reusing its item links."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM item_images WHERE image_id = ?", (image_id,))
+        _copy_image_links(conn, image_id, source_id)
+        conn.execute(
+            """
+            UPDATE images SET processed_status = 'PROCESSED', duplicate_of = ?, last_error = NULL,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """,
+            (source_id, image_id)
+        )
+
+def get_images_by_path(paths: Iterable[str], chunk_size: int = 500) -> Dict[str, Dict[str, Any]]:
+    """Queue rows (status and file fingerprint) for the given paths, keyed by file_path."""
+    found = {}
+    conn = get_db_connection()
+    if not conn:
+        return found
+    paths = list(paths)
+    try:
+        for i in range(0, len(paths), chunk_size): # Stay under SQLite's variable limit
+            chunk = paths[i:i + chunk_size]
+            rows = conn.execute(
+                f"""
+                SELECT id, file_path, processed_status, content_hash, file_size, mtime
+                FROM images WHERE file_path IN ({', '.join('?' for _ in chunk)})
+                """,
+                chunk
+            )
+            found.update((row["file_path"], dict(row)) for row in rows)
+    except sqlite3.Error as e:
+        logger.error(f"Failed to read images: {e}")
+    return found
+
+def find_processed_image(content_hash: str, exclude_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """An already PROCESSED original (not itself a duplicate) with these exact bytes, or None."""
+    conn = get_db_connection()
+    if not conn or not content_hash:
+        return None
+    row = conn.execute(
+        """
+        SELECT id, file_path FROM images
+        WHERE content_hash = ? AND processed_status = 'PROCESSED' AND duplicate_of IS NULL AND id IS NOT ?
+        ORDER BY id LIMIT 1
+        """,
+        (content_hash, exclude_id)
+    ).fetchone()
+    return dict(row) if row else None
+
+def count_duplicate_images() -> int:
+    """Images whose results were reused from a byte-identical original."""
+    conn = get_db_connection()
+    if not conn:
+        return 0
+    return conn.execute("SELECT COUNT(*) FROM images WHERE duplicate_of IS NOT NULL").fetchone()[0]
+
+def record_scanned_images(records: Iterable[Dict[str, Any]]):
+    """
+    Applies an ingestion scan in one transaction. Each record has file_path,
+    content_hash, file_size and mtime, plus an optional action:
+      'new'       -> queued as PENDING
+      'changed'   -> requeued as PENDING, old item links dropped
+      'duplicate' -> PROCESSED as a copy of image 'duplicate_of' (links copied)
+      None        -> fingerprint refreshed only
+    """
+    with transaction() as conn:
+        for record in records:
+            fingerprint = (record.get("content_hash"), record.get("file_size"), record.get("mtime"))
+            action = record.get("action")
+            if action in ("new", "duplicate"):
+                status = "PROCESSED" if action == "duplicate" else "PENDING"
+                cursor = conn.execute(
+                    """
+                    INSERT INTO images (file_path, processed_status, content_hash, file_size, mtime, duplicate_of, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    """,
+                    (record["file_path"], status, *fingerprint, record.get("duplicate_of"))
+                )
+                if action == "duplicate":
+                    _copy_image_links(conn, cursor.lastrowid, record["duplicate_of"])
+            elif action == "changed":
+                row = conn.execute("SELECT id FROM images WHERE file_path = ?", (record["file_path"],)).fetchone()
+                conn.execute("DELETE FROM item_images WHERE image_id = ?", (row["id"],))
+                conn.execute(
+                    """
+                    UPDATE images SET processed_status = 'PENDING', content_hash = ?, file_size = ?, mtime = ?,
+                        duplicate_of = NULL, attempts = 0, last_error = NULL, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                    """,
+                    (*fingerprint, row["id"])
+                )
+            else:
+                conn.execute(
+                    "UPDATE images SET content_hash = ?, file_size = ?, mtime = ? WHERE file_path = ?",
+                    (*fingerprint, record["file_path"])
+                )
+
+def get_image_items(image_id: int) -> List[Dict[str, Any]]:
+    """Items linked to a photo, with the crop bbox ([x, y, w, h] or None) and OCR code."""
+    conn = get_db_connection()
+    if not conn:
+        return []
+    rows = conn.execute(
+        "SELECT item_code, is_primary, bbox, ocr_code FROM item_images WHERE image_id = ? ORDER BY rowid",
+        (image_id,)
+    ).fetchall()
+    links = []
+    for row in rows:
+        link = dict(row)
+        link["bbox"] = json.loads(link["bbox"]) if link["bbox"] else None
+        links.append(link)
+    return links
+
+def image_queue_counts() -> Dict[str, int]:
+    """Number of queued images per status (every status present, zero if empty)."""
+    counts = {status: 0 for status in IMAGE_STATUSES}
+    conn = get_db_connection()
+    if not conn:
+        return counts
+    try:
+        for row in conn.execute("SELECT processed_status, COUNT(*) FROM images GROUP BY processed_status"):
+            counts[row[0]] = row[1]
+    except sqlite3.Error as e:
+        logger.error(f"Failed to count queued images: {e}")
+    return counts
+
+def get_image_errors(limit: int = 100) -> List[Dict[str, Any]]:
+    """Most recent failed images with their error message."""
+    conn = get_db_connection()
+    if not conn:
+        return []
+    try:
+        rows = conn.execute(
+            "SELECT id, file_path, attempts, last_error FROM images WHERE processed_status = 'ERROR' ORDER BY updated_at DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+    except sqlite3.Error as e:
+        logger.error(f"Failed to read image errors: {e}")
+        return []
 
 def get_all_items() -> List[Dict[str, Any]]:
     """Retrieves all items from the database."""
@@ -205,30 +956,179 @@ def get_all_items() -> List[Dict[str, Any]]:
     except sqlite3.Error as e:
         logger.error(f"Failed to retrieve items: {e}")
         return []
+
+CATALOG_SORTS = {
+    "updated_desc": "items.updated_at DESC",
+    "updated_asc": "items.updated_at ASC",
+    "rank": "CASE items.rarity_rank WHEN 'S' THEN 0 WHEN 'A' THEN 1 ELSE 2 END, items.updated_at DESC",
+    "code": "items.item_code ASC",
+}
+
+def query_items(
+    grade: Optional[str] = None,
+    keyword: str = "",
+    sort: str = "updated_desc",
+    offset: int = 0,
+    limit: Optional[int] = 50
+) -> Dict[str, Any]:
+    """
+    Filtered, paginated catalog query.
+
+    Args:
+        grade: Rarity tier to keep ('S', 'A', 'B'); None or 'All' for every tier.
+        keyword: Case-insensitive substring searched in the code, title, all three
+                 descriptions and the attributes. Uses the FTS5 trigram index when
+                 available (keywords of 3+ characters), otherwise LIKE.
+        sort: One of CATALOG_SORTS.
+        offset, limit: Page window; limit=None returns every match.
+
+    Returns:
+        {'items': [dict, ...], 'total': int} where total counts all matches.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return {"items": [], "total": 0}
+
+    source = "items"
+    where, params = [], []
+    keyword = (keyword or "").strip()
+
+    try:
+        if keyword:
+            has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name='items_fts'").fetchone()
+            if has_fts and len(keyword) >= 3: # Trigram index needs at least 3 characters
+                source = "items JOIN items_fts ON items_fts.rowid = items.rowid"
+                where.append("items_fts MATCH ?")
+                params.append('"' + keyword.replace('"', '""') + '"')
+            else:
+                pattern = "%" + keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                where.append("(" + " OR ".join(f"items.{c} LIKE ? ESCAPE '\\'" for c in FTS_COLUMNS) + ")")
+                params.extend([pattern] * len(FTS_COLUMNS))
+
+        if grade and grade != "All":
+            where.append("items.rarity_rank = ?")
+            params.append(grade)
+
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+        order_sql = CATALOG_SORTS.get(sort, CATALOG_SORTS["updated_desc"])
+
+        total = conn.execute(f"SELECT COUNT(*) FROM {source} {where_sql}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT items.* FROM {source} {where_sql} ORDER BY {order_sql} LIMIT ? OFFSET ?",
+            params + [-1 if limit is None else limit, max(0, offset)]
+        ).fetchall()
+        return {"items": [dict(row) for row in rows], "total": total}
+
+    except sqlite3.Error as e:
+        logger.error(f"Failed to query items: {e}")
+        return {"items": [], "total": 0}
+
+def count_items() -> int:
+    """Total number of cataloged items."""
+    conn = get_db_connection()
+    if not conn:
+        return 0
+    try:
+        return conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+    except sqlite3.Error as e:
+        logger.error(f"Failed to count items: {e}")
+        return 0
+
+EXPORT_COLUMNS = [
+    "item_code", "title", "rarity_rank",
+    "description_hero", "description_modern", "description_social",
+    "attributes_json", "updated_at"
+]
+
+def iter_items(chunk_size: int = 500, columns: List[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Streams items (newest first) from a cursor, fetching chunk_size rows at a time,
+    so callers never hold the whole inventory in memory.
+    """
+    columns = columns or EXPORT_COLUMNS
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    cursor = conn.execute(f"SELECT {', '.join(columns)} FROM items ORDER BY updated_at DESC")
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
     finally:
-        conn.close()
+        cursor.close()
+
+def write_items_csv(fileobj, chunk_size: int = 500) -> int:
+    """Writes the inventory as CSV to a text file object. Returns the row count."""
+    writer = csv.DictWriter(fileobj, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    count = 0
+    for item in iter_items(chunk_size):
+        writer.writerow(item)
+        count += 1
+    return count
+
+def write_items_jsonl(fileobj, chunk_size: int = 500) -> int:
+    """Writes the inventory as JSON Lines (one item per line). Returns the row count."""
+    count = 0
+    for item in iter_items(chunk_size):
+        fileobj.write(json.dumps(item, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+def write_items_parquet(path: str, chunk_size: int = 5000) -> int:
+    """
+    Writes the inventory as a Parquet file, one row group per chunk.
+    Requires the optional 'pyarrow' package.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export requires 'pyarrow' (pip install pyarrow).")
+
+    schema = pa.schema([(col, pa.string()) for col in EXPORT_COLUMNS])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        chunk = []
+        for item in iter_items(chunk_size):
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            count += len(chunk)
+    return count
+
+EXPORT_FORMATS = {
+    "csv": {"ext": "csv", "mime": "text/csv"},
+    "jsonl": {"ext": "jsonl", "mime": "application/x-ndjson"},
+    "parquet": {"ext": "parquet", "mime": "application/vnd.apache.parquet"},
+}
+
+def export_items(path: str, fmt: str = "csv") -> int:
+    """
+    Streams the whole inventory to a file in the given format (see EXPORT_FORMATS).
+    Memory stays flat regardless of inventory size. Returns the row count.
+    """
+    if fmt == "parquet":
+        return write_items_parquet(path)
+    if fmt == "jsonl":
+        with open(path, "w", encoding="utf-8") as f:
+            return write_items_jsonl(f)
+    if fmt == "csv":
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            return write_items_csv(f)
+    raise ValueError(f"Unsupported export format: {fmt}")
 
 def export_items_to_csv() -> str:
-    """Exports all items to a CSV string."""
-    items = get_all_items()
-    if not items:
-        return ""
-    
+    """Exports all items to a CSV string (small inventories; prefer export_items)."""
     output = io.StringIO()
-    # Define headers
-    headers = [
-        "item_code", "title", "rarity_rank",
-        "description_hero", "description_modern", "description_social",
-        "attributes_json", "updated_at"
-    ]
-    
-    writer = csv.DictWriter(output, fieldnames=headers)
-    writer.writeheader()
-    
-    for item in items:
-        # Filter item dict to match headers
-        row = {k: item[k] for k in headers if k in item}
-        writer.writerow(row)
-        
+    if not write_items_csv(output):
+        return ""
     return output.getvalue()
-
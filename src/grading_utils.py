@@ -1,7 +1,11 @@
 import json
 import os
+import re
+import time
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+
+from db_manager import transaction, log_telemetry
 
 # Configure Logging
 logger = logging.getLogger(__name__)
@@ -11,6 +15,7 @@ RULES_PATH = os.path.join("data", "grading_rules.json")
 class JadeGrader:
     def __init__(self):
         self.rules = self._load_rules()
+        self._pattern, self._keyword_priority, self._tiers, self._default_tier = self._compile(self.rules)
 
     def _load_rules(self) -> Dict[str, Any]:
         try:
@@ -20,12 +25,42 @@ class JadeGrader:
             logger.error(f"Failed to load grading rules: {e}")
             return {"tiers": {}, "rules": []}
 
+    @staticmethod
+    def _compile(rules: Dict[str, Any]) -> Tuple[Optional[re.Pattern], Dict[str, int], List[str], str]:
+        """
+        Compiles the rules into one regex. Rules are tried from top tier (S) down,
+        so each keyword gets the priority (index) of the first rule listing it; a
+        rule without keywords (e.g. B tier) matches everything and ends the list.
+
+        The alternation sits in a lookahead, so overlapping keywords are all seen,
+        and is ordered by priority so each position reports its best keyword.
+        """
+        keyword_priority = {}
+        tiers = []
+        default_tier = "B" # Fallback
+        for rule in (rules or {}).get("rules", []):
+            keywords = [kw.lower() for kw in rule.get("required_keywords", [])]
+            if not keywords or "" in keywords:
+                default_tier = rule["tier"]
+                break
+            tiers.append(rule["tier"])
+            for kw in keywords:
+                keyword_priority.setdefault(kw, len(tiers) - 1)
+
+        if not keyword_priority:
+            return None, keyword_priority, tiers, default_tier
+        ordered = sorted(keyword_priority, key=lambda kw: (keyword_priority[kw], -len(kw)))
+        pattern = re.compile("(?=(" + "|".join(re.escape(kw) for kw in ordered) + "))")
+        return pattern, keyword_priority, tiers, default_tier
+
     def calculate_grade(self, features: Dict[str, Any]) -> str:
         """
         Determines the Rarity Tier (S, A, B) based on visual feature keywords.
         """
         if not self.rules:
             return "B" # Default fallback
+        if self._pattern is None:
+            return self._default_tier
 
         # Combine all feature text into one searchable string
         search_text = (
@@ -34,22 +69,15 @@ class JadeGrader:
             str(features.get("motif", ""))
         ).lower()
 
-        # Iterate rules from top tier (S) down
-        for rule in self.rules.get("rules", []):
-            tier = rule["tier"]
-            keywords = rule.get("required_keywords", [])
-            
-            # If no keywords required (e.g. B tier), match immediately
-            if not keywords:
-                return tier
-            
-            # Check if ANY of the keywords exist in the features
-            # (Relaxed logic: Match 1 high-value keyword = Upgrade)
-            for kw in keywords:
-                if kw.lower() in search_text:
-                    return tier
-                    
-        return "B" # Fallback
+        # Relaxed logic: Match 1 high-value keyword = Upgrade; the highest tier wins
+        best = None
+        for match in self._pattern.finditer(search_text):
+            priority = self._keyword_priority[match.group(1)]
+            if best is None or priority < best:
+                best = priority
+                if best == 0:
+                    break
+        return self._tiers[best] if best is not None else self._default_tier
 
     def get_tier_info(self, tier_code: str) -> Dict[str, str]:
         """Returns the display name and color for a tier code."""
@@ -57,3 +85,48 @@ class JadeGrader:
             "name": "未分級 (Unranked)",
             "color": "#808080"
         })
+
+def regrade_all(grader: Optional[JadeGrader] = None, batch_size: int = 1000) -> Dict[str, Any]:
+    """
+    Re-applies the grading rules to the whole inventory, e.g. after grading_rules.json
+    changed. attributes_json is streamed batch_size rows at a time and only changed
+    ranks are written, all in one transaction (updated_at is left alone: the item
+    itself did not change). Returns total, changed and per-tier counts.
+    """
+    grader = grader or JadeGrader()
+    start_time = time.time()
+    summary = {"total": 0, "changed": 0, "tiers": {}}
+
+    with transaction() as conn:
+        cursor = conn.execute("SELECT rowid, attributes_json, rarity_rank FROM items ORDER BY rowid")
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                updates = []
+                for rowid, attributes_json, old_rank in rows:
+                    try:
+                        features = json.loads(attributes_json) if attributes_json else {}
+                    except json.JSONDecodeError:
+                        features = {}
+                    rank = grader.calculate_grade(features if isinstance(features, dict) else {})
+                    summary["tiers"][rank] = summary["tiers"].get(rank, 0) + 1
+                    if rank != old_rank:
+                        updates.append((rank, rowid))
+                # The scan is in rowid order, which rank updates do not move
+                conn.executemany("UPDATE items SET rarity_rank = ? WHERE rowid = ?", updates)
+                summary["total"] += len(rows)
+                summary["changed"] += len(updates)
+        finally:
+            cursor.close()
+
+    duration = (time.time() - start_time) * 1000
+    logger.info(f"Regraded {summary['total']} items ({summary['changed']} changed) in {duration:.0f} ms.")
+    log_telemetry(
+        module="grading_utils",
+        action="regrade_all",
+        execution_data={"duration_ms": duration, "exit_code": 0},
+        context=summary
+    )
+    return summary
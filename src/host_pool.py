@@ -0,0 +1,363 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, Any, Optional, List, Set, Iterator, Callable
+
+from db_manager import log_telemetry
+from model_registry import get_registry
+from inference_client import AsyncInferenceClient, CircuitOpenError, get_breaker, backoff_delay, OLLAMA_REQUEST_TIMEOUT_S, OLLAMA_RETRIES
+
+# Configure Logging
+logger = logging.getLogger(__name__)
+
+# Comma-separated Ollama endpoints; requests are spread over all of them
+OLLAMA_HOSTS = [
+    h.strip() for h in
+    os.getenv("OLLAMA_HOSTS", os.getenv("OLLAMA_HOST", "http://192.168.16.120:11434")).split(",")
+    if h.strip()
+]
+# Smoothing factor of the per-host latency moving average
+LATENCY_EWMA_ALPHA = 0.3
+# keep_alive sent with every request (Ollama's own default is 5m); '' = server default
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "10m") or None
+# A response whose load_duration exceeds this counts as a model load (warm calls report a few ms)
+MODEL_LOAD_THRESHOLD_MS = float(os.getenv("MODEL_LOAD_THRESHOLD_MS", "500"))
+
+class OllamaHost:
+    """One endpoint of the pool: clients, breaker and load counters."""
+
+    def __init__(self, url: str, timeout_s: Optional[float] = None):
+        self.url = url
+        self.timeout_s = OLLAMA_REQUEST_TIMEOUT_S if timeout_s is None else timeout_s
+        self._client = None
+        self.breaker = get_breaker(url)
+        # The pool does retries/failover itself, so the per-host async client makes one attempt
+        self.async_client = AsyncInferenceClient(url, timeout_s=timeout_s, retries=0, breaker=self.breaker)
+        self.registry = get_registry(url)
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.latency_ms = None
+        self.model_loads: Dict[str, int] = {}
+
+    @property
+    def client(self):
+        """Sync ollama.Client, created on first use (importing ollama pulls in httpx/pydantic)."""
+        if self._client is None:
+            import ollama
+            with self._lock:
+                if self._client is None:
+                    self._client = ollama.Client(host=self.url, timeout=self.timeout_s)
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        self._client = value
+
+    def begin(self) -> int:
+        """Marks a request as dispatched; returns the queue depth it joined."""
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+            return self.in_flight - 1
+
+    def end(self, duration_ms: float, ok: bool):
+        with self._lock:
+            self.in_flight -= 1
+            if ok:
+                if self.latency_ms is None:
+                    self.latency_ms = duration_ms
+                else:
+                    self.latency_ms += LATENCY_EWMA_ALPHA * (duration_ms - self.latency_ms)
+            else:
+                self.failures += 1
+
+    def record_load(self, model: str, response: Any) -> float:
+        """Counts a model load when the response reports a significant load_duration. Returns load ms."""
+        try:
+            load_ms = (response.get("load_duration") or 0) / 1e6
+        except AttributeError:
+            return 0.0
+        if load_ms > MODEL_LOAD_THRESHOLD_MS:
+            with self._lock:
+                self.model_loads[model] = self.model_loads.get(model, 0) + 1
+        return load_ms
+
+    def rank(self, model: str) -> tuple:
+        """Sort key: up > model loaded > model installed > fewest in flight > fastest."""
+        try:
+            snapshot = self.registry.snapshot()
+            running = snapshot["status"]["running"]
+            info = snapshot["models"].get(model)
+        except Exception as e:
+            logger.warning(f"Registry unavailable for {self.url}: {e}")
+            running, info = False, None
+        return (
+            not running,
+            not (info and info["loaded"]),
+            info is None,
+            self.in_flight,
+            self.latency_ms if self.latency_ms is not None else 0
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "requests": self.requests,
+                "failures": self.failures,
+                "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+                "model_loads": dict(self.model_loads),
+                "breaker": self.breaker.state
+            }
+
+class HostPool:
+    """
+    Routes chat requests over several Ollama hosts.
+
+    Each request goes to the healthy host (circuit not open) that has the model
+    loaded and the fewest requests in flight; on failure it fails over to the next
+    best host. Every attempt is logged to telemetry with the host, its queue depth
+    and the latency.
+    """
+
+    def __init__(self, urls: Optional[List[str]] = None, retries: Optional[int] = None, keep_alive: Optional[str] = OLLAMA_KEEP_ALIVE):
+        self.hosts = [OllamaHost(url) for url in (urls or OLLAMA_HOSTS)]
+        self.retries = OLLAMA_RETRIES if retries is None else retries
+        self.keep_alive = keep_alive
+        self._pick_lock = threading.Lock()
+        self._dispatch_listeners: List[Callable[[str], None]] = []
+
+    def add_dispatch_listener(self, listener: Callable[[str], None]):
+        """Registers listener(model), called each time a request is sent to a host."""
+        self._dispatch_listeners.append(listener)
+
+    def remove_dispatch_listener(self, listener: Callable[[str], None]):
+        if listener in self._dispatch_listeners:
+            self._dispatch_listeners.remove(listener)
+
+    def _dispatch(self, host: OllamaHost, model: str) -> int:
+        queue_depth = host.begin()
+        for listener in list(self._dispatch_listeners):
+            try:
+                listener(model)
+            except Exception as e:
+                logger.warning(f"Dispatch listener failed: {e}")
+        return queue_depth
+
+    def pick(self, model: str, exclude: Optional[Set[str]] = None) -> OllamaHost:
+        """Best host for model, skipping open circuits and hosts in exclude."""
+        candidates = [h for h in self.hosts if h.breaker.state != "open" and h.url not in (exclude or set())]
+        if not candidates:
+            raise CircuitOpenError("No Ollama host available (all circuits open)")
+        if len(candidates) == 1:
+            return candidates[0]
+        # Serialized so concurrent requests see each other's in-flight counts
+        with self._pick_lock:
+            return min(candidates, key=lambda h: h.rank(model))
+
+    def _log(self, host: OllamaHost, model: str, queue_depth: int, attempt: int, duration_ms: float, error: Optional[Exception], load_ms: float = 0.0):
+        log_telemetry(
+            module="host_pool",
+            action="chat",
+            execution_data={
+                "duration_ms": duration_ms,
+                "exit_code": 0 if error is None else 1,
+                "error": str(error) if error is not None else None
+            },
+            context={"host": host.url, "model": model, "queue_depth": queue_depth, "attempt": attempt, "load_ms": round(load_ms, 1)}
+        )
+
+    def _next_host(self, model: str, tried: Set[str]) -> OllamaHost:
+        """Next untried host; once every host has failed, start over."""
+        try:
+            return self.pick(model, exclude=tried)
+        except CircuitOpenError:
+            if not tried:
+                raise
+            tried.clear()
+            return self.pick(model)
+
+    def chat(self, model: str, messages: List[Dict[str, Any]], options: Optional[Dict[str, Any]] = None, format: Optional[str] = None, retries: Optional[int] = None) -> Any:
+        """Synchronous chat with least-loaded routing and failover."""
+        retries = self.retries if retries is None else retries
+        tried: Set[str] = set()
+        last_error = None
+
+        for attempt in range(retries + 1):
+            host = self._next_host(model, tried)
+            if not host.breaker.allow():
+                tried.add(host.url)
+                last_error = CircuitOpenError(f"Ollama host {host.url} is unavailable (circuit open)")
+                continue
+
+            queue_depth = self._dispatch(host, model)
+            start_time = time.time()
+            load_ms = 0.0
+            try:
+                response = host.client.chat(model=model, messages=messages, options=options, format=format, keep_alive=self.keep_alive)
+                host.breaker.record_success()
+                load_ms = host.record_load(model, response)
+                error = None
+            except Exception as e:
+                host.breaker.record_failure()
+                error = last_error = e
+            duration = (time.time() - start_time) * 1000
+            host.end(duration, ok=error is None)
+            self._log(host, model, queue_depth, attempt, duration, error, load_ms)
+
+            if error is None:
+                return response
+            logger.warning(f"Ollama Call Failed on {host.url} (Attempt {attempt+1}/{retries+1}): {error}")
+            tried.add(host.url)
+            # Fail over immediately; back off only once every host has been tried
+            if attempt < retries and len(tried) >= len(self.hosts):
+                time.sleep(backoff_delay(attempt))
+
+        raise last_error
+
+    def chat_stream(self, model: str, messages: List[Dict[str, Any]], options: Optional[Dict[str, Any]] = None, format: Optional[str] = None, retries: Optional[int] = None) -> Iterator[str]:
+        """
+        Streaming chat: yields content deltas as they arrive. Fails over like chat,
+        but only until the first chunk has been yielded; later errors are raised.
+        """
+        retries = self.retries if retries is None else retries
+        tried: Set[str] = set()
+        last_error = None
+
+        for attempt in range(retries + 1):
+            host = self._next_host(model, tried)
+            if not host.breaker.allow():
+                tried.add(host.url)
+                last_error = CircuitOpenError(f"Ollama host {host.url} is unavailable (circuit open)")
+                continue
+
+            queue_depth = self._dispatch(host, model)
+            start_time = time.time()
+            error = None
+            started = False
+            settled = False
+            load_ms = 0.0
+            try:
+                for chunk in host.client.chat(model=model, messages=messages, options=options, format=format, stream=True, keep_alive=self.keep_alive):
+                    started = True
+                    if chunk.get("done"): # load_duration is reported on the final chunk
+                        load_ms = host.record_load(model, chunk)
+                    yield chunk['message']['content']
+                host.breaker.record_success()
+                settled = True
+            except Exception as e:
+                host.breaker.record_failure()
+                settled = True
+                error = last_error = e
+                if started:
+                    raise
+            finally:
+                if not settled:
+                    # Abandoned by the consumer (GeneratorExit): a host that already
+                    # streamed text is healthy; otherwise just free the probe slot
+                    if started:
+                        host.breaker.record_success()
+                    else:
+                        host.breaker.release_probe()
+                duration = (time.time() - start_time) * 1000
+                host.end(duration, ok=error is None)
+                self._log(host, model, queue_depth, attempt, duration, error, load_ms)
+
+            if error is None:
+                return
+            logger.warning(f"Ollama Stream Failed on {host.url} (Attempt {attempt+1}/{retries+1}): {error}")
+            tried.add(host.url)
+            if attempt < retries and len(tried) >= len(self.hosts):
+                time.sleep(backoff_delay(attempt))
+
+        raise last_error
+
+    async def async_chat(self, model: str, messages: List[Dict[str, Any]], options: Optional[Dict[str, Any]] = None, format: Optional[str] = None, deadline_s: Optional[float] = None, retries: Optional[int] = None) -> Any:
+        """asyncio counterpart of chat; deadline_s bounds the whole call."""
+        retries = self.retries if retries is None else retries
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + deadline_s if deadline_s is not None else None
+        tried: Set[str] = set()
+        last_error = None
+
+        for attempt in range(retries + 1):
+            remaining = deadline - loop.time() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                break
+            host = self._next_host(model, tried)
+            # Before dispatching, as in chat: a refused call was never sent, so it
+            # must not count as a request, a failure or a dispatch
+            if not host.breaker.allow():
+                tried.add(host.url)
+                last_error = CircuitOpenError(f"Ollama host {host.url} is unavailable (circuit open)")
+                continue
+
+            queue_depth = self._dispatch(host, model)
+            start_time = time.time()
+            load_ms = 0.0
+            try:
+                response = await host.async_client.chat(model, messages, options=options, format=format, deadline_s=remaining, keep_alive=self.keep_alive, claimed=True)
+                load_ms = host.record_load(model, response)
+                error = None
+            except asyncio.CancelledError:
+                host.end((time.time() - start_time) * 1000, ok=False)
+                raise
+            except Exception as e:
+                error = last_error = e
+            duration = (time.time() - start_time) * 1000
+            host.end(duration, ok=error is None)
+            self._log(host, model, queue_depth, attempt, duration, error, load_ms)
+
+            if error is None:
+                return response
+            logger.warning(f"Async Ollama Call Failed on {host.url} (Attempt {attempt+1}/{retries+1}): {error}")
+            tried.add(host.url)
+            if attempt < retries and len(tried) >= len(self.hosts):
+                await asyncio.sleep(backoff_delay(attempt))
+
+        raise last_error or TimeoutError(f"Ollama request deadline exceeded ({deadline_s}s)")
+
+    def preload(self, model: str, keep_alive: Optional[str] = None):
+        """
+        Loads model on its best host without generating anything (empty-prompt
+        /api/generate), so the first real request does not pay the load. Blocks
+        until the model is resident; errors are logged, not raised.
+        """
+        keep_alive = keep_alive or self.keep_alive
+        try:
+            host = self.pick(model)
+        except CircuitOpenError as e:
+            logger.warning(f"Preload of {model} skipped: {e}")
+            return
+        start_time = time.time()
+        try:
+            response = host.client.generate(model=model, keep_alive=keep_alive)
+            load_ms = host.record_load(model, response)
+            logger.info(f"Preloaded {model} on {host.url} ({load_ms:.0f} ms load)")
+            error = None
+        except Exception as e:
+            logger.warning(f"Preload of {model} on {host.url} failed: {e}")
+            load_ms, error = 0.0, e
+        log_telemetry(
+            module="host_pool",
+            action="preload",
+            execution_data={"duration_ms": (time.time() - start_time) * 1000, "exit_code": 0 if error is None else 1},
+            context={"host": host.url, "model": model, "keep_alive": keep_alive, "load_ms": round(load_ms, 1)}
+        )
+
+    def model_loads(self) -> Dict[str, int]:
+        """Model loads observed so far, summed over hosts, keyed by model."""
+        totals: Dict[str, int] = {}
+        for host in self.hosts:
+            for model, count in host.stats()["model_loads"].items():
+                totals[model] = totals.get(model, 0) + count
+        return totals
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-host load and health, keyed by URL."""
+        return {h.url: h.stats() for h in self.hosts}
@@ -0,0 +1,180 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Dict, Any, Optional, List
+
+# Configure Logging
+logger = logging.getLogger(__name__)
+
+# Per-attempt timeout for one Ollama request (vision calls on a cold model can take a while)
+OLLAMA_REQUEST_TIMEOUT_S = float(os.getenv("OLLAMA_REQUEST_TIMEOUT_S", "120"))
+OLLAMA_RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))
+# Full-jitter exponential backoff: sleep uniform(0, min(MAX, BASE * 2**attempt))
+OLLAMA_BACKOFF_BASE_S = float(os.getenv("OLLAMA_BACKOFF_BASE_S", "0.5"))
+OLLAMA_BACKOFF_MAX_S = float(os.getenv("OLLAMA_BACKOFF_MAX_S", "8"))
+# Circuit breaker: open after this many consecutive failures, probe again after the cool-down
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("OLLAMA_BREAKER_FAILURES", "5"))
+BREAKER_RESET_S = float(os.getenv("OLLAMA_BREAKER_RESET_S", "30"))
+
+class CircuitOpenError(RuntimeError):
+    """Raised without contacting the host while its circuit breaker is open."""
+
+def backoff_delay(attempt: int, base_s: Optional[float] = None, max_s: Optional[float] = None) -> float:
+    """Full-jitter delay before retry number attempt (0-based)."""
+    base_s = OLLAMA_BACKOFF_BASE_S if base_s is None else base_s
+    max_s = OLLAMA_BACKOFF_MAX_S if max_s is None else max_s
+    return random.uniform(0, min(max_s, base_s * (2 ** attempt)))
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one Ollama host.
+
+    closed -> open after failure_threshold failures in a row; while open, calls
+    fail fast with CircuitOpenError. After reset_s one probe call is let through
+    (half-open): success closes the circuit, failure re-opens it. A probe that
+    ends neither way (cancelled, abandoned) must call release_probe(); a claimed
+    probe also expires after reset_s, so a lost one cannot lock the host out.
+    Thread-safe, so the sync and async clients can share one breaker per host.
+    """
+
+    def __init__(self, failure_threshold: Optional[int] = None, reset_s: Optional[float] = None):
+        self.failure_threshold = BREAKER_FAILURE_THRESHOLD if failure_threshold is None else failure_threshold
+        self.reset_s = BREAKER_RESET_S if reset_s is None else reset_s
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._probe_at = 0.0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_s:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        """True if a call may be attempted now (claims the probe slot when half-open)."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at >= self.reset_s and (not self._probing or now - self._probe_at >= self.reset_s):
+                self._probing = True
+                self._probe_at = now
+                return True
+            return False
+
+    def release_probe(self):
+        """Frees the half-open probe slot after a call that neither succeeded nor failed."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Circuit opened after {self._failures} consecutive Ollama failures")
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(host: str) -> CircuitBreaker:
+    """Shared breaker per host."""
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker()
+        return _breakers[host]
+
+class AsyncInferenceClient:
+    """
+    asyncio wrapper around ollama.AsyncClient for one host, with a deadline per
+    attempt (and optionally for the whole call), jittered exponential backoff
+    between retries and the host's shared circuit breaker.
+    """
+
+    def __init__(self, host: str, timeout_s: Optional[float] = None, retries: Optional[int] = None, breaker: Optional[CircuitBreaker] = None):
+        self.host = host
+        self.timeout_s = OLLAMA_REQUEST_TIMEOUT_S if timeout_s is None else timeout_s
+        self.retries = OLLAMA_RETRIES if retries is None else retries
+        self.breaker = breaker or get_breaker(host)
+        # httpx connection pools are bound to an event loop: one client per loop
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _client(self) -> "ollama.AsyncClient":
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            import ollama # Deferred: only needed once a request is made
+            client = self._clients[loop] = ollama.AsyncClient(host=self.host)
+        return client
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], options: Optional[Dict[str, Any]] = None, format: Optional[str] = None, deadline_s: Optional[float] = None, keep_alive: Optional[str] = None, claimed: bool = False) -> Any:
+        """
+        client.chat with retries. Each attempt is bounded by timeout_s, and the
+        whole call (retries and backoff included) by deadline_s when given.
+        Raises CircuitOpenError immediately while the host is marked unhealthy.
+        claimed=True: the caller already got breaker.allow() for the first attempt
+        (e.g. HostPool, which must know before dispatching); released if unused.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + deadline_s if deadline_s is not None else None
+        last_error = None
+
+        for attempt in range(self.retries + 1):
+            timeout = self.timeout_s
+            if deadline is not None:
+                timeout = min(timeout, deadline - loop.time())
+                if timeout <= 0:
+                    break
+
+            # Only after the deadline check, so an unused probe slot is never claimed
+            if claimed:
+                claimed = False
+            elif not self.breaker.allow():
+                raise CircuitOpenError(f"Ollama host {self.host} is unavailable (circuit open)")
+
+            settled = False
+            try:
+                response = await asyncio.wait_for(
+                    self._client().chat(model=model, messages=messages, options=options, format=format, keep_alive=keep_alive),
+                    timeout=timeout
+                )
+                self.breaker.record_success()
+                settled = True
+                return response
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                last_error = e if not isinstance(e, asyncio.TimeoutError) else TimeoutError(f"Ollama request timed out after {timeout:.1f}s")
+                self.breaker.record_failure()
+                settled = True
+                logger.warning(f"Async Ollama Call Failed (Attempt {attempt+1}/{self.retries+1}): {last_error}")
+            finally:
+                if not settled:
+                    self.breaker.release_probe() # Cancelled: the host's health is still unknown
+
+            if attempt < self.retries:
+                delay = backoff_delay(attempt)
+                if deadline is not None and loop.time() + delay >= deadline:
+                    break
+                await asyncio.sleep(delay)
+
+        if claimed: # Deadline ran out before the caller's claim was used
+            self.breaker.release_probe()
+        raise last_error or TimeoutError(f"Ollama request deadline exceeded ({deadline_s}s)")
@@ -0,0 +1,310 @@
+import os
+import glob
+import time
+import hashlib
+import logging
+import multiprocessing
+from typing import Dict, Any, Optional, List, Iterable, Callable
+
+import db_manager
+from db_manager import (
+    save_items, log_telemetry, claim_next_image, mark_image_processed, mark_image_error,
+    mark_image_duplicate, requeue_images, image_queue_counts, get_images_by_path,
+    find_processed_image, record_scanned_images, count_duplicate_images
+)
+from ai_engine import analyze_image_content, generate_marketing_copy
+from grading_utils import JadeGrader
+
+# Configure Logging
+logger = logging.getLogger(__name__)
+
+# Worker processes draining the queue. Ollama is usually the bottleneck, so more
+# than one mainly helps when segmentation/OCR (CPU) is slow or several hosts serve.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+# How often the parent reports queue progress while worker processes run
+PROGRESS_INTERVAL_S = 5.0
+
+def scan_images(targets: Iterable[str]) -> List[str]:
+    """Expands directories (recursively) and glob patterns into sorted, de-duplicated image paths."""
+    found = set()
+    for target in targets:
+        if os.path.isdir(target):
+            for root, _, files in os.walk(target):
+                found.update(os.path.join(root, name) for name in files)
+        else:
+            found.update(glob.glob(target, recursive=True))
+    return sorted(
+        os.path.abspath(p) for p in found
+        if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def sync_images(paths: Iterable[str]) -> Dict[str, int]:
+    """
+    Records scanned files in the images queue, deciding what needs work:
+
+    - known path, same size and mtime: unchanged, not even hashed
+    - known path, different stat: hashed; reprocessed only if the bytes changed
+    - new path whose bytes match a processed image: recorded as its duplicate
+    - anything else: queued as PENDING
+
+    Files already waiting in the queue keep their status. Returns counts per
+    outcome plus skipped_bytes (size of the processed files not redone).
+    """
+    paths = list(paths)
+    known = get_images_by_path(paths)
+    summary = {"new": 0, "changed": 0, "unchanged": 0, "duplicates": 0, "skipped_bytes": 0}
+    records = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            logger.warning(f"Skipping unreadable file {path}: {e}")
+            continue
+        row = known.get(path)
+        record = {"file_path": path, "file_size": stat.st_size, "mtime": stat.st_mtime, "content_hash": None}
+
+        done = row is not None and row["processed_status"] == "PROCESSED"
+        if row and row["file_size"] == stat.st_size and row["mtime"] == stat.st_mtime and row["content_hash"]:
+            if done:
+                summary["unchanged"] += 1
+                summary["skipped_bytes"] += stat.st_size
+            continue
+
+        try:
+            record["content_hash"] = file_sha256(path)
+        except OSError as e:
+            logger.warning(f"Skipping unreadable file {path}: {e}")
+            continue
+
+        if row is None:
+            original = find_processed_image(record["content_hash"])
+            if original:
+                record.update(action="duplicate", duplicate_of=original["id"])
+                summary["duplicates"] += 1
+                summary["skipped_bytes"] += stat.st_size
+            else:
+                record["action"] = "new"
+                summary["new"] += 1
+        elif row["content_hash"] and row["content_hash"] != record["content_hash"]:
+            record["action"] = "changed"
+            summary["changed"] += 1
+        elif done:
+            # Same bytes (touched or copied back), or processed before fingerprints existed
+            summary["unchanged"] += 1
+            summary["skipped_bytes"] += stat.st_size
+        records.append(record)
+
+    if records:
+        record_scanned_images(records)
+    return summary
+
+def _analysis_failed(item: Dict[str, Any]) -> bool:
+    return item.get("visual_features", {}).get("color") == "Analysis Failed"
+
+def process_image(image_path: str, enable_ocr: bool = True, user_hints: str = "", grader: Optional[JadeGrader] = None) -> Dict[str, Any]:
+    """
+    analyze_image_content -> generate_marketing_copy -> save_items for one tray photo,
+    mirroring the upload tab. Items without a readable code are skipped, as in the UI.
+
+    Returns {'items', 'saved', 'skipped', 'error', 'links'}; error is set when the
+    image should be retried (analysis, a crop or a save failed), links holds the
+    item_images rows ({'item_code', 'bbox', 'ocr_code'}) of the saved items.
+    """
+    grader = grader or JadeGrader()
+    summary = {"items": 0, "saved": 0, "skipped": 0, "error": None, "links": []}
+
+    items = analyze_image_content(image_path, enable_ocr=enable_ocr, user_hints=user_hints)
+    if items and "error" in items[0]:
+        summary["error"] = items[0]["error"]
+        return summary
+
+    summary["items"] = len(items)
+    failed_crops = 0
+    items_to_save = []
+    crops_saved = []
+    for item in items:
+        item_code = item.get("item_code")
+        if _analysis_failed(item):
+            failed_crops += 1
+            continue
+        if not item_code or "Unknown" in item_code:
+            summary["skipped"] += 1
+            continue
+
+        features = item.get("visual_features", {})
+        copy_deck = generate_marketing_copy(item)
+        crops_saved.append(item)
+        items_to_save.append({
+            "item_code": item_code,
+            "title": f"Jade Pendant - {features.get('motif', 'Unknown')}",
+            "description_hero": copy_deck["hero"],
+            "description_modern": copy_deck["modern"],
+            "description_social": copy_deck["social"],
+            "attributes": features,
+            "rarity_rank": grader.calculate_grade(features)
+        })
+
+    # The whole tray in one transaction (upserts, so a retried image is idempotent)
+    errors = []
+    if items_to_save:
+        for item, result in zip(crops_saved, save_items(items_to_save)):
+            if result["success"]:
+                summary["saved"] += 1
+                summary["links"].append({"item_code": result["item_code"], "bbox": item.get("bbox"), "ocr_code": item.get("ocr_code")})
+            else:
+                errors.append(f"{result['item_code']}: {result['error']}")
+    if failed_crops:
+        errors.insert(0, f"{failed_crops} crop(s) failed analysis")
+    if errors:
+        summary["error"] = "; ".join(errors)
+    return summary
+
+def drain_queue(enable_ocr: bool = True, user_hints: str = "", limit: Optional[int] = None, on_image: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, int]:
+    """
+    Claims and processes PENDING images until the queue is empty (or limit images
+    were handled). Each image ends as PROCESSED or ERROR. Returns per-worker totals.
+    """
+    grader = JadeGrader()
+    totals = {"images": 0, "processed": 0, "errors": 0, "duplicates": 0, "items_saved": 0}
+
+    while limit is None or totals["images"] < limit:
+        claimed = claim_next_image()
+        if claimed is None:
+            break
+
+        start_time = time.time()
+        # Byte-identical to a photo another worker finished since the scan
+        original = find_processed_image(claimed["content_hash"], exclude_id=claimed["id"])
+        if original:
+            mark_image_duplicate(claimed["id"], original["id"])
+            totals["images"] += 1
+            totals["duplicates"] += 1
+            continue
+
+        try:
+            result = process_image(claimed["file_path"], enable_ocr=enable_ocr, user_hints=user_hints, grader=grader)
+        except Exception as e:
+            logger.error(f"Ingestion failed for {claimed['file_path']}: {e}")
+            result = {"items": 0, "saved": 0, "skipped": 0, "error": str(e), "links": []}
+
+        links = result.pop("links")
+        if result["error"]:
+            mark_image_error(claimed["id"], result["error"])
+            totals["errors"] += 1
+        else:
+            mark_image_processed(claimed["id"], links=links)
+            totals["processed"] += 1
+        totals["images"] += 1
+        totals["items_saved"] += result["saved"]
+
+        duration = (time.time() - start_time) * 1000
+        log_telemetry(
+            module="ingestion",
+            action="process_image",
+            execution_data={"duration_ms": duration, "exit_code": 1 if result["error"] else 0, "error": result["error"]},
+            context={"image_id": claimed["id"], "attempt": claimed["attempts"], "pid": os.getpid(), **result}
+        )
+        if on_image:
+            on_image({**claimed, **result, "duration_ms": duration})
+    return totals
+
+def _worker_main(db_path: str, enable_ocr: bool, user_hints: str):
+    """Entry point of a spawned worker process."""
+    db_manager.DB_PATH = db_path
+    try:
+        drain_queue(enable_ocr=enable_ocr, user_hints=user_hints)
+    except KeyboardInterrupt:
+        pass # The claimed image stays PROCESSING and is requeued by the next run
+    finally:
+        db_manager.flush_telemetry()
+
+def run_ingest(
+    targets: Iterable[str] = (),
+    workers: Optional[int] = None,
+    enable_ocr: bool = True,
+    user_hints: str = "",
+    retry_errors: bool = False,
+    progress: Optional[Callable[[Dict[str, int]], None]] = None
+) -> Dict[str, Any]:
+    """
+    Syncs the images under targets into the queue (see sync_images; unchanged
+    and duplicate files are skipped), then drains the whole queue (including
+    work left over from earlier runs) with the given number of worker processes.
+
+    Claims left in PROCESSING by an interrupted run are put back to PENDING first,
+    so only one ingestion run should use a database at a time. With workers <= 1
+    the queue is drained in this process. progress(counts) gets queue counts
+    after each image (inline) or every PROGRESS_INTERVAL_S (worker processes).
+    """
+    workers = INGEST_WORKERS if workers is None else workers
+    start_time = time.time()
+
+    paths = scan_images(targets)
+    scan = sync_images(paths)
+    requeued = requeue_images(("PROCESSING", "ERROR") if retry_errors else ("PROCESSING",))
+    if requeued:
+        logger.info(f"Requeued {requeued} image(s) from an earlier run.")
+    before = image_queue_counts()
+    duplicates_before = count_duplicate_images()
+
+    if workers <= 1:
+        drain_queue(enable_ocr=enable_ocr, user_hints=user_hints, on_image=(lambda _: progress(image_queue_counts())) if progress else None)
+    else:
+        _run_workers(workers, enable_ocr, user_hints, progress)
+
+    counts = image_queue_counts()
+    worker_duplicates = count_duplicate_images() - duplicates_before
+    duration = time.time() - start_time
+    summary = {
+        "scanned": len(paths),
+        "added": scan["new"],
+        "changed": scan["changed"],
+        "unchanged": scan["unchanged"],
+        "duplicates": scan["duplicates"] + worker_duplicates,
+        "skipped_bytes": scan["skipped_bytes"],
+        "requeued": requeued,
+        "processed": counts["PROCESSED"] - before["PROCESSED"] - worker_duplicates,
+        "errors": counts["ERROR"] - before["ERROR"],
+        "pending": counts["PENDING"] + counts["PROCESSING"],
+        "duration_s": duration,
+        "counts": counts
+    }
+    log_telemetry(
+        module="ingestion",
+        action="run",
+        execution_data={"duration_ms": duration * 1000, "exit_code": 0},
+        context={"workers": workers, **{k: v for k, v in summary.items() if k != "counts"}}
+    )
+    return summary
+
+def _run_workers(workers: int, enable_ocr: bool, user_hints: str, progress: Optional[Callable[[Dict[str, int]], None]]):
+    # spawn: no forked copies of open SQLite connections or model clients.
+    # Entry points must call multiprocessing.freeze_support() (see ingest.py).
+    ctx = multiprocessing.get_context("spawn")
+    processes = [
+        ctx.Process(target=_worker_main, args=(db_manager.DB_PATH, enable_ocr, user_hints), name=f"ingest-{i}")
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        while any(p.is_alive() for p in processes):
+            for process in processes:
+                process.join(timeout=PROGRESS_INTERVAL_S / len(processes))
+            if progress:
+                progress(image_queue_counts())
+    except KeyboardInterrupt:
+        # Workers got the same SIGINT; give them a moment to flush telemetry
+        for process in processes:
+            process.join(timeout=PROGRESS_INTERVAL_S)
+            if process.is_alive():
+                process.terminate()
+        raise
@@ -1,26 +1,22 @@
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 import io
 import logging
 
-logger = logging.getLogger(__name__)
+from pdf_generator import get_font_name
 
-# Font Registration (Using same logic as pdf_generator)
-try:
-    pdfmetrics.registerFont(TTFont('MsJhengHei', 'msjh.ttc'))
-    FONT_NAME = 'MsJhengHei'
-except:
-    FONT_NAME = 'Helvetica'
+logger = logging.getLogger(__name__)
 
 def generate_user_manual() -> bytes:
     """
     Generates a User Manual PDF for JadeScribe.
     """
+    # ReportLab is only loaded when a manual is actually built
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+    FONT_NAME = get_font_name() # Same font logic as pdf_generator
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4,
                             rightMargin=2*cm, leftMargin=2*cm,
@@ -0,0 +1,150 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, Any, Optional, List
+
+import requests
+
+from utils import fetch_ollama_tags
+
+# Configure Logging
+logger = logging.getLogger(__name__)
+
+# How long a healthy snapshot is served before a background refresh is started
+REGISTRY_TTL_S = float(os.getenv("OLLAMA_REGISTRY_TTL_S", "15"))
+# Shorter TTL while the service is down, so recovery shows up quickly
+REGISTRY_DOWN_TTL_S = float(os.getenv("OLLAMA_REGISTRY_DOWN_TTL_S", "3"))
+REGISTRY_TIMEOUT_S = float(os.getenv("OLLAMA_REGISTRY_TIMEOUT_S", "5"))
+
+def _format_size(size_bytes: Optional[int]) -> str:
+    if not size_bytes:
+        return "?"
+    return f"{size_bytes / (1024 ** 3):.1f} GB"
+
+class ModelRegistry:
+    """
+    Cached view of one Ollama host: service status plus installed models
+    (/api/tags) and which of them are loaded in memory (/api/ps).
+
+    The first call fetches synchronously; after that, callers always get the
+    cached snapshot and an expired snapshot triggers a single background refresh
+    (stale-while-revalidate), so UI reruns and analysis calls never block on HTTP.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, ttl_s: Optional[float] = None, down_ttl_s: Optional[float] = None, timeout_s: Optional[float] = None):
+        self.base_url = base_url or os.getenv("OLLAMA_HOST", "http://localhost:11434")
+        self.ttl_s = REGISTRY_TTL_S if ttl_s is None else ttl_s
+        self.down_ttl_s = REGISTRY_DOWN_TTL_S if down_ttl_s is None else down_ttl_s
+        self.timeout_s = REGISTRY_TIMEOUT_S if timeout_s is None else timeout_s
+
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._refreshing = False
+
+    def _fetch(self) -> Dict[str, Any]:
+        status, tags = fetch_ollama_tags(self.base_url, timeout=self.timeout_s)
+
+        loaded = {}
+        if status["running"]:
+            try:
+                response = requests.get(f"{self.base_url}/api/ps", timeout=self.timeout_s)
+                if response.status_code == 200:
+                    loaded = {m.get("name"): m for m in response.json().get("models", [])}
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.warning(f"Could not read loaded models from {self.base_url}: {e}")
+
+        models = {}
+        for tag in tags:
+            name = tag.get("name")
+            details = tag.get("details") or {}
+            running = loaded.get(name)
+            models[name] = {
+                "name": name,
+                "size": tag.get("size"),
+                "family": details.get("family"),
+                "parameter_size": details.get("parameter_size"),
+                "quantization": details.get("quantization_level"),
+                "loaded": running is not None,
+                "size_vram": running.get("size_vram") if running else None,
+                "expires_at": running.get("expires_at") if running else None
+            }
+
+        return {"status": status, "models": models, "fetched_at": time.time()}
+
+    def refresh(self) -> Dict[str, Any]:
+        """Fetches now (blocking) and replaces the cached snapshot."""
+        snapshot = self._fetch()
+        with self._lock:
+            self._snapshot = snapshot
+            self._refreshing = False
+        return snapshot
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning(f"Model registry refresh failed: {e}")
+            with self._lock:
+                self._refreshing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns the cached snapshot, refreshing in the background once it expires."""
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None:
+                ttl = self.ttl_s if snapshot["status"]["running"] else self.down_ttl_s
+                if time.time() - snapshot["fetched_at"] > ttl and not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh_in_background, name="ollama-registry", daemon=True).start()
+                return snapshot
+        return self.refresh()
+
+    def invalidate(self):
+        """Drops the cache so the next call fetches synchronously (e.g. after 'ollama pull')."""
+        with self._lock:
+            self._snapshot = None
+
+    def status(self) -> Dict[str, Any]:
+        """Same shape as utils.check_ollama_status."""
+        return self.snapshot()["status"]
+
+    def models(self) -> List[str]:
+        return list(self.snapshot()["models"])
+
+    def model_info(self, model_name: str) -> Optional[Dict[str, Any]]:
+        """Size, family, quantization and loaded state for one model, or None if missing."""
+        return self.snapshot()["models"].get(model_name)
+
+    def check_model(self, model_name: str) -> Dict[str, Any]:
+        """Same shape as utils.check_model_availability, plus the model metadata."""
+        info = self.model_info(model_name)
+        is_available = info is not None
+        return {
+            "available": is_available,
+            "message": f"✅ 模型 '{model_name}' 已就緒" if is_available else f"⚠️ 未找到模型 '{model_name}'",
+            "info": info
+        }
+
+    def describe_model(self, model_name: str) -> str:
+        """Short human-readable summary, e.g. '1.7 GB · Q4_0 · loaded'."""
+        info = self.model_info(model_name)
+        if info is None:
+            return "missing"
+        parts = [_format_size(info["size"])]
+        if info["quantization"]:
+            parts.append(info["quantization"])
+        parts.append("loaded" if info["loaded"] else "not loaded")
+        return " · ".join(parts)
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+def get_registry(base_url: Optional[str] = None) -> ModelRegistry:
+    """Shared registry per Ollama host."""
+    base_url = base_url or os.getenv("OLLAMA_HOST", "http://localhost:11434")
+    with _registries_lock:
+        registry = _registries.get(base_url)
+        if registry is None:
+            registry = _registries[base_url] = ModelRegistry(base_url)
+        return registry
@@ -0,0 +1,184 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Iterator
+
+from ai_engine import VISION_MODEL, TEXT_MODEL, generate_marketing_copy, host_pool
+from batch_pipeline import BatchPipeline, COPY_WORKERS, count_model_loads
+from db_manager import log_telemetry
+
+# Configure Logging
+logger = logging.getLogger(__name__)
+
+# Group a batch's work by model (all vision calls, then all text calls)
+MODEL_AFFINITY = os.getenv("MODEL_AFFINITY", "1") == "1"
+# Load the next phase's model while the current phase drains
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "1") == "1"
+
+
+class ModelAffinityScheduler:
+    """
+    Runs an upload batch in model phases instead of alternating per item, so a
+    host that only fits one model in VRAM loads each model once per batch:
+
+    1. vision phase: segmentation + VISION_MODEL analysis for every file
+       (BatchPipeline without its copy stage)
+    2. text phase: TEXT_MODEL copy for every item
+
+    As soon as the last vision request of the batch has been sent, TEXT_MODEL is
+    preloaded in the background; Ollama starts the load as soon as the GPU frees
+    up, overlapping the tail of the vision phase. With generate_copy=False the
+    caller runs the text phase itself after the jobs are yielded. With
+    stream_first=True the batch's first item is left to the caller to stream
+    into the UI (fast first text) while the pool generates every other item.
+    """
+
+    def __init__(
+        self,
+        enable_ocr: bool = True,
+        user_hints: str = "",
+        generate_copy: bool = True,
+        copy_workers: Optional[int] = None,
+        preprocess_pool=None,
+        preload: Optional[bool] = None,
+        stream_first: bool = False
+    ):
+        self.enable_ocr = enable_ocr
+        self.user_hints = user_hints
+        self.generate_copy = generate_copy
+        self.stream_first = stream_first
+        self.copy_workers = max(1, copy_workers or COPY_WORKERS)
+        self.preprocess_pool = preprocess_pool
+        self.preload = MODEL_PRELOAD if preload is None else preload
+        self.stats: Dict[str, Any] = {}
+
+        self._lock = threading.Lock()
+        self._total_jobs = 0
+        self._jobs_entered = 0
+        self._expected_requests = 0
+        self._dispatched = 0
+        self._preload_started = None
+
+    # --- Preload Trigger ---
+
+    def _on_stage(self, name: str, job: Dict[str, Any]):
+        """Counts the vision requests each job will send (one per crop, or one full-image call)."""
+        if name != "vision":
+            return
+        with self._lock:
+            self._jobs_entered += 1
+            if "error" not in job:
+                self._expected_requests += len(job.get("crops") or []) or 1
+        self._maybe_preload()
+
+    def _on_dispatch(self, model: str):
+        if model != VISION_MODEL:
+            return
+        with self._lock:
+            self._dispatched += 1
+        self._maybe_preload()
+
+    def _maybe_preload(self):
+        with self._lock:
+            last_request_sent = (
+                self._jobs_entered >= self._total_jobs
+                and self._dispatched >= self._expected_requests
+            )
+        if last_request_sent:
+            self._start_preload("tail")
+
+    def _start_preload(self, trigger: str):
+        with self._lock:
+            if self._preload_started is not None:
+                return
+            self._preload_started = trigger
+        if not self.preload or TEXT_MODEL == VISION_MODEL:
+            return
+        threading.Thread(target=host_pool.preload, args=(TEXT_MODEL,), name="model-preload", daemon=True).start()
+
+    # --- Phases ---
+
+    def _vision_phase(self, jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        self._total_jobs = len(jobs)
+        pipeline = BatchPipeline(
+            enable_ocr=self.enable_ocr,
+            user_hints=self.user_hints,
+            generate_copy=False,
+            preprocess_pool=self.preprocess_pool,
+            stage_hook=self._on_stage
+        )
+        host_pool.add_dispatch_listener(self._on_dispatch)
+        try:
+            return list(pipeline.run(jobs))
+        finally:
+            host_pool.remove_dispatch_listener(self._on_dispatch)
+            # Cache hits send no requests; make sure the next model is on its way
+            self._start_preload("phase_end")
+
+    def run(self, jobs: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Same contract as BatchPipeline.run: yields each job, in input order, with
+        'items' (and 'copy_deck' per item when generate_copy) or 'error'.
+
+        With stream_first the job holding the batch's first item is yielded as
+        soon as the vision phase ends: that item has no copy_deck, and the job's
+        other items carry a 'copy_future' (resolve it for the deck) instead.
+        """
+        start_time = time.time()
+        loads_before = host_pool.model_loads()
+        yielded = 0
+        vision_ms = None
+
+        try:
+            results = self._vision_phase(jobs)
+            vision_ms = (time.time() - start_time) * 1000
+
+            if not self.generate_copy:
+                for job in results:
+                    yielded += 1
+                    yield job
+                return
+
+            # Text phase: every item's copy, yielded per job in upload order
+            items = [item for job in results for item in job.get("items", [])]
+            streamed = items[0] if self.stream_first and items else None
+            executor = ThreadPoolExecutor(max_workers=self.copy_workers, thread_name_prefix="copy")
+            try:
+                futures = [
+                    [(item, executor.submit(generate_marketing_copy, item)) for item in job.get("items", []) if item is not streamed]
+                    for job in results
+                ]
+                for job, job_futures in zip(results, futures):
+                    # Don't hold back the streamed item while its tray-mates generate
+                    deferred = streamed is not None and any(item is streamed for item in job.get("items", []))
+                    for item, future in job_futures:
+                        if deferred:
+                            item["copy_future"] = future
+                        else:
+                            item["copy_deck"] = future.result()
+                    yielded += 1
+                    yield job
+            finally:
+                # Also reached when the consumer abandons the generator (e.g. Streamlit rerun)
+                executor.shutdown(wait=False, cancel_futures=True)
+        finally:
+            duration = (time.time() - start_time) * 1000
+            loads = count_model_loads(loads_before, host_pool.model_loads())
+            self.stats = {
+                "model_loads": sum(loads.values()),
+                "loads_by_model": loads,
+                "preload": self._preload_started
+            }
+            log_telemetry(
+                module="model_scheduler",
+                action="run_batch",
+                execution_data={"duration_ms": duration, "exit_code": 0},
+                context={
+                    "files": len(jobs),
+                    "completed": yielded,
+                    "vision_phase_ms": round(vision_ms, 1) if vision_ms is not None else None,
+                    **self.stats
+                }
+            )
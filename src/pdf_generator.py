@@ -1,39 +1,48 @@
 import io
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.pdfgen import canvas
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 import logging
 import os
 
 # Configure Logging
 logger = logging.getLogger(__name__)
 
-# Register a Font that supports Chinese (Microsoft JhengHei usually available on Win, or Noto)
-# For portability in this environment, we'll check for a system font or fallback to basic.
-# NOTE: In a real deploy, you should ship a .ttf file in /resources.
-try:
-    # Attempt to load a common Windows Traditional Chinese font
-    pdfmetrics.registerFont(TTFont('MsJhengHei', 'msjh.ttc')) # Windows standard
-    FONT_NAME = 'MsJhengHei'
-except:
+# ReportLab is imported and the font registered on first use, not at import time
+_font_name = None
+
+def get_font_name() -> str:
+    """Registers a font that supports Chinese (once) and returns its ReportLab name."""
+    global _font_name
+    if _font_name is not None:
+        return _font_name
+
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    # Register a Font that supports Chinese (Microsoft JhengHei usually available on Win, or Noto)
+    # For portability in this environment, we'll check for a system font or fallback to basic.
+    # NOTE: In a real deploy, you should ship a .ttf file in /resources.
     try:
+        # Attempt to load a common Windows Traditional Chinese font
+        pdfmetrics.registerFont(TTFont('MsJhengHei', 'msjh.ttc')) # Windows standard
+        _font_name = 'MsJhengHei'
+    except:
         # Linux/Mac fallback (Noto Sans CJK) - path varies, often not found without config
         # For this prototype, we will warn if we can't find a Chinese font.
         logger.warning("Chinese Font not found. PDF may not render characters correctly.")
-        FONT_NAME = 'Helvetica' # Standard built-in (No Chinese support)
-    except:
-        FONT_NAME = 'Helvetica'
+        _font_name = 'Helvetica' # Standard built-in (No Chinese support)
+    return _font_name
 
 def generate_pdf_catalog(items: list) -> bytes:
     """
     Generates a PDF catalog from the list of items.
     Returns the PDF bytes.
     """
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+    FONT_NAME = get_font_name()
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4,
                             rightMargin=1*cm, leftMargin=1*cm,
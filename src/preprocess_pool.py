@@ -0,0 +1,128 @@
+import os
+import time
+import atexit
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Dict, Any, Optional, List, Iterator
+
+# Configure Logging
+logger = logging.getLogger(__name__)
+
+# Worker processes for tray preprocessing (segmentation + enhancement + OCR).
+# Each worker holds its own EasyOCR reader, so budget roughly 1 GB RAM per worker.
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+# --- Worker Process Side ---
+
+_worker_processor = None
+
+def _init_worker(output_dir: str, warm_ocr: bool):
+    """Runs once per worker process: one ImageProcessor and one EasyOCR reader."""
+    global _worker_processor
+    import cv2
+    from vision_utils import ImageProcessor, ocr_service
+
+    # One process per core already; keep OpenCV/torch from oversubscribing
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+    _worker_processor = ImageProcessor(output_dir=output_dir)
+    if warm_ocr:
+        ocr_service.warm_up(background=False)
+
+def _ping() -> int:
+    return os.getpid()
+
+def _preprocess_one(image_path: str, enable_ocr: bool) -> Dict[str, Any]:
+    """
+    Segments, enhances and OCRs one tray photo inside a worker process.
+    Returns a lightweight record: crop path, code and bbox per crop, plus the
+    encoded JPEG bytes when crops are handed off in memory (never raw pixels).
+    """
+    start = time.time()
+    try:
+        crops = _worker_processor.segment_and_crop(image_path, enable_ocr=enable_ocr)
+        error = None
+    except Exception as e:
+        crops, error = [], str(e)
+    return {
+        "image_path": image_path,
+        "crops": [
+            {k: c[k] for k in ("crop_path", "ocr_code", "bbox", "crop_bytes") if k in c}
+            for c in crops
+        ],
+        "duration_ms": (time.time() - start) * 1000,
+        "worker_pid": os.getpid(),
+        "error": error
+    }
+
+# --- Parent Process Side ---
+
+class PreprocessPool:
+    """
+    Process pool that runs ImageProcessor.segment_and_crop for many photos in
+    parallel, so CPU-bound OpenCV/EasyOCR work is spread across cores instead of
+    running on the Streamlit script thread.
+
+    Workers use the 'spawn' start method (safe with the app's background threads,
+    and the only option on Windows). Frozen builds rely on the
+    multiprocessing.freeze_support() call in run.py.
+    """
+
+    def __init__(self, workers: Optional[int] = None, output_dir: str = "images/processed", warm_ocr: bool = True):
+        self.workers = max(1, workers or PREPROCESS_WORKERS)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(output_dir, warm_ocr)
+        )
+
+    def start(self):
+        """Spawns and initializes the workers up front (model loading included)."""
+        futures = [self._executor.submit(_ping) for _ in range(self.workers)]
+        for f in futures:
+            f.result()
+
+    def submit(self, image_path: str, enable_ocr: bool = True) -> Future:
+        return self._executor.submit(_preprocess_one, image_path, enable_ocr)
+
+    def segment(self, image_path: str, enable_ocr: bool = True) -> List[Dict[str, Any]]:
+        """Blocking helper with the segment_and_crop return shape."""
+        record = self.submit(image_path, enable_ocr).result()
+        if record["error"]:
+            logger.error(f"Preprocessing failed for {image_path}: {record['error']}")
+        return record["crops"]
+
+    def map(self, image_paths: List[str], enable_ocr: bool = True) -> Iterator[Dict[str, Any]]:
+        """Preprocesses all paths in parallel; yields records in input order."""
+        futures = [self.submit(path, enable_ocr) for path in image_paths]
+        for f in futures:
+            yield f.result()
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+def get_shared_pool() -> PreprocessPool:
+    """Process-wide pool reused across batches (worker start-up and OCR load are paid once)."""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = PreprocessPool()
+            atexit.register(_shared_pool.close)
+        return _shared_pool
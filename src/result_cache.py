@@ -0,0 +1,181 @@
+import sqlite3
+import json
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, Any, Optional
+
+from db_manager import get_connection, transaction
+
+# Configure Logging
+logger = logging.getLogger(__name__)
+
+CACHE_DB_PATH = os.path.join("data", "result_cache.db")
+
+# Run an eviction pass every N writes
+EVICT_EVERY = 100
+
+def make_cache_key(*parts: Any) -> str:
+    """Builds a stable content-addressed key from the given parts."""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            h.update(part)
+        else:
+            h.update(str(part).encode("utf-8"))
+        h.update(b"\x1f") # Unit separator so ('ab', 'c') != ('a', 'bc')
+    return h.hexdigest()
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's bytes."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class ResultCache:
+    """
+    Persistent key/value cache for expensive model results, stored in SQLite.
+
+    Entries live in one table shared by several namespaces (e.g. 'vision').
+    Entries older than max_age_s are dropped, and once a namespace holds more than
+    max_entries the least recently used entries are evicted.
+    """
+
+    def __init__(self, namespace: str, db_path: Optional[str] = None, max_entries: int = 5000, max_age_s: Optional[float] = None):
+        self.namespace = namespace
+        self.db_path = db_path or CACHE_DB_PATH
+        self.max_entries = max_entries
+        self.max_age_s = max_age_s
+
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._saved_ms = 0.0
+        self._writes = 0
+        self._initialized = False
+
+    def _ensure_schema(self):
+        if self._initialized:
+            return
+        with transaction(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value_json TEXT NOT NULL,
+                    cost_ms REAL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_access ON cache_entries(namespace, last_access)")
+        self._initialized = True
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returns the cached value or None. Counts a hit or a miss."""
+        now = time.time()
+        try:
+            self._ensure_schema()
+            conn = get_connection(self.db_path)
+            row = conn.execute(
+                "SELECT value_json, cost_ms, created_at FROM cache_entries WHERE namespace=? AND key=?",
+                (self.namespace, key)
+            ).fetchone()
+
+            if row and self.max_age_s is not None and now - row[2] > self.max_age_s:
+                conn.execute("DELETE FROM cache_entries WHERE namespace=? AND key=?", (self.namespace, key))
+                row = None
+
+            if row is None:
+                with self._lock:
+                    self._misses += 1
+                return None
+
+            conn.execute(
+                "UPDATE cache_entries SET last_access=? WHERE namespace=? AND key=?",
+                (now, self.namespace, key)
+            )
+            with self._lock:
+                self._hits += 1
+                self._saved_ms += row[1] or 0
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Cache lookup failed ({self.namespace}): {e}")
+            with self._lock:
+                self._misses += 1
+            return None
+
+    def put(self, key: str, value: Any, cost_ms: float = 0):
+        """Stores a JSON-serializable value. cost_ms records what a hit saves."""
+        now = time.time()
+        try:
+            self._ensure_schema()
+            with transaction(self.db_path) as conn:
+                conn.execute(
+                    """
+                    INSERT INTO cache_entries (namespace, key, value_json, cost_ms, created_at, last_access)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(namespace, key) DO UPDATE SET
+                        value_json=excluded.value_json,
+                        cost_ms=excluded.cost_ms,
+                        created_at=excluded.created_at,
+                        last_access=excluded.last_access
+                    """,
+                    (self.namespace, key, json.dumps(value, ensure_ascii=False), cost_ms, now, now)
+                )
+
+            with self._lock:
+                self._writes += 1
+                run_eviction = self._writes % EVICT_EVERY == 1
+            if run_eviction:
+                self.evict()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Cache write failed ({self.namespace}): {e}")
+
+    def _evict(self, conn: sqlite3.Connection):
+        if self.max_age_s is not None:
+            conn.execute(
+                "DELETE FROM cache_entries WHERE namespace=? AND created_at < ?",
+                (self.namespace, time.time() - self.max_age_s)
+            )
+        conn.execute(
+            """
+            DELETE FROM cache_entries WHERE namespace=? AND key IN (
+                SELECT key FROM cache_entries WHERE namespace=?
+                ORDER BY last_access DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.namespace, self.namespace, self.max_entries)
+        )
+
+    def evict(self):
+        """Applies age and size limits now."""
+        try:
+            self._ensure_schema()
+            with transaction(self.db_path) as conn:
+                self._evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Cache eviction failed ({self.namespace}): {e}")
+
+    def clear(self):
+        """Drops every entry in this namespace."""
+        try:
+            self._ensure_schema()
+            with transaction(self.db_path) as conn:
+                conn.execute("DELETE FROM cache_entries WHERE namespace=?", (self.namespace,))
+        except sqlite3.Error as e:
+            logger.warning(f"Cache clear failed ({self.namespace}): {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Cumulative hit/miss counters for telemetry."""
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "saved_ms": round(self._saved_ms, 1)
+            }
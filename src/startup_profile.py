@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import logging
+import subprocess
+from typing import Dict, Any, Optional, List
+
+# Configure Logging
+logger = logging.getLogger(__name__)
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SRC_DIR)
+
+# Deferred until first use; none of these may load just because a module was imported
+HEAVY_MODULES = ("cv2", "numpy", "ollama", "httpx", "reportlab", "torch", "easyocr", "PIL")
+# Cold-start budgets (ms for the import alone, in a fresh interpreter), enforced by the
+# tests. Together they cover what app.py imports at script start, besides Streamlit.
+IMPORT_BUDGETS_MS = {
+    "ai_engine": float(os.getenv("STARTUP_BUDGET_MS", "500")),
+    "batch_pipeline": float(os.getenv("STARTUP_BUDGET_MS", "500")),
+    "model_scheduler": float(os.getenv("STARTUP_BUDGET_MS", "500")),
+    "preprocess_pool": 100.0,
+    "pdf_generator": 100.0,
+    "manual_generator": 100.0,
+}
+
+_PROBE = """
+import sys, time, json
+preloaded = sorted(sys.modules)
+start = time.perf_counter()
+import {module}
+wall_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{"wall_ms": wall_ms, "preloaded": preloaded, "modules": sorted(sys.modules)}}))
+"""
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """
+    Parses `python -X importtime` output into
+    {'module', 'self_us', 'cumulative_us', 'depth'} entries (depth 0 = imported directly).
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            self_us, cumulative_us = int(self_us), int(cumulative_us)
+        except ValueError:
+            continue # Header line
+        stripped = name.lstrip()
+        entries.append({
+            "module": stripped.strip(),
+            "self_us": self_us,
+            "cumulative_us": cumulative_us,
+            "depth": (len(name) - len(stripped) - 1) // 2
+        })
+    return entries
+
+def profile_import(module: str, python: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Imports module in a fresh interpreter with -X importtime (cwd = repo root,
+    src on the path, like the app). Returns wall_ms, the parsed import entries
+    (interpreter start-up imports left out) and which HEAVY_MODULES ended up loaded.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (SRC_DIR, env.get("PYTHONPATH")) if p)
+    proc = subprocess.run(
+        [python or sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module)],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    probe = json.loads(proc.stdout.strip().splitlines()[-1])
+    loaded = set(probe["modules"])
+    preloaded = set(probe["preloaded"]) | {"json", "time"} # The probe's own imports
+    return {
+        "module": module,
+        "wall_ms": probe["wall_ms"],
+        "imports": [e for e in parse_importtime(proc.stderr) if e["module"] not in preloaded],
+        "heavy": [m for m in HEAVY_MODULES if m in loaded]
+    }
+
+def check_budget(result: Dict[str, Any]) -> List[str]:
+    """Budget violations for a profile_import result (empty when within budget)."""
+    problems = []
+    budget = IMPORT_BUDGETS_MS.get(result["module"])
+    if budget is not None and result["wall_ms"] > budget:
+        problems.append(f"{result['module']}: import took {result['wall_ms']:.0f} ms (budget {budget:.0f} ms)")
+    if result["heavy"]:
+        problems.append(f"{result['module']}: loads {', '.join(result['heavy'])} at import time")
+    return problems
+
+def format_report(result: Dict[str, Any], top: int = 15) -> str:
+    """Wall time plus the slowest packages (cumulative) pulled in by the import."""
+    packages = {}
+    for entry in result["imports"]:
+        # A package's own entry includes its submodules, so the max is its total
+        package = entry["module"].split(".")[0]
+        packages[package] = max(packages.get(package, 0), entry["cumulative_us"])
+
+    budget = IMPORT_BUDGETS_MS.get(result["module"])
+    lines = [
+        f"{result['module']}: {result['wall_ms']:.0f} ms"
+        + (f" (budget {budget:.0f} ms)" if budget is not None else "")
+        + (f" · heavy: {', '.join(result['heavy'])}" if result["heavy"] else "")
+    ]
+    for package, cumulative_us in sorted(packages.items(), key=lambda kv: kv[1], reverse=True)[:top]:
+        lines.append(f"   {cumulative_us / 1000:8.1f} ms  {package}")
+    return "\n".join(lines)
@@ -1,7 +1,7 @@
 import requests
 import logging
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -24,6 +24,13 @@ def check_ollama_status(base_url: Optional[str] = None) -> Dict[str, Any]:
                 "error_details": str (optional)
             }
     """
+    return fetch_ollama_tags(base_url)[0]
+
+def fetch_ollama_tags(base_url: Optional[str] = None, timeout: float = 5.0) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    One GET of /api/tags. Returns (status, models): the check_ollama_status dict and
+    the raw model entries (empty when the service is unreachable).
+    """
     if base_url is None:
         base_url = os.getenv("OLLAMA_HOST", "http://localhost:11434")
 
@@ -31,7 +38,7 @@ def check_ollama_status(base_url: Optional[str] = None) -> Dict[str, Any]:
         logger.info(f"Checking Ollama status at: {base_url}")
         
         # Using a longer timeout (5s) to avoid flakes on busy systems
-        response = requests.get(f"{base_url}/api/tags", timeout=5.0)
+        response = requests.get(f"{base_url}/api/tags", timeout=timeout)
         
         if response.status_code == 200:
             try:
@@ -39,47 +46,49 @@ def check_ollama_status(base_url: Optional[str] = None) -> Dict[str, Any]:
                 
                 # Handle both old and new Ollama API formats
                 if "models" in data:
-                    model_count = len(data.get("models", []))
+                    models = data.get("models", [])
+                    model_count = len(models)
                 else:
+                    models = data if isinstance(data, list) else []
                     model_count = len(data)
                 
                 return {
                     "running": True,
                     "message": f"Ollama 服務運作中 (已安裝 {model_count} 個模型)",
                     "model_count": model_count
-                }
+                }, models
             except ValueError as json_err:
                 return {
                     "running": True,
                     "message": "Ollama 服務運作中，但回傳資料格式錯誤",
                     "error_details": str(json_err)
-                }
+                }, []
         else:
             return {
                 "running": False,
                 "message": f"Ollama 服務回傳錯誤代碼: {response.status_code}",
                 "status_code": response.status_code
-            }
+            }, []
 
     except requests.exceptions.ConnectionError:
         return {
             "running": False,
             "message": f"無法連接到 Ollama 服務 ({base_url})。請確認 IP 正確且防火牆已開啟。",
             "error_type": "connection_error"
-        }
+        }, []
     except requests.exceptions.Timeout:
         return {
             "running": False,
             "message": "連接 Ollama 服務逾時 (Timeout)。",
             "error_type": "timeout"
-        }
+        }, []
     except Exception as e:
         return {
             "running": False,
             "message": f"檢查 Ollama 狀態時發生未預期的錯誤: {str(e)}",
             "error_type": "exception",
             "error_details": str(e)
-        }
+        }, []
 
 def get_ollama_models(base_url: Optional[str] = None) -> list:
     """
@@ -4,47 +4,240 @@ import re
 import os
 import logging
 import time
+import threading
+import uuid
+import atexit
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 
 # Configure Logging
 logger = logging.getLogger(__name__)
 
-# Global variable for lazy loading
-_reader = None
+# OCR batching: crops up to OCR_MAX_CANVAS px per side are padded onto a shared
+# canvas and recognized OCR_BATCH_SIZE at a time; larger crops are read one by
+# one at full resolution (shrinking them would lose small code labels)
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "8"))
+OCR_MAX_CANVAS = int(os.getenv("OCR_MAX_CANVAS", "640"))
 
-def get_reader():
-    """Lazy loads EasyOCR reader only when requested."""
-    global _reader
-    if _reader is None:
+class OCRService:
+    """
+    Owns the EasyOCR reader.
+
+    warm_up() loads the model on a background thread (e.g. at app startup) so the
+    first tray does not pay the multi-second load; status() reports progress for
+    the UI. read_batch() recognizes many crops with batched detection calls.
+    """
+
+    def __init__(self, languages=None, gpu=False):
+        self.languages = languages or ['en']
+        self.gpu = gpu
+        self._reader = None # None = not loaded, False = unavailable
+        self._state = "idle" # idle -> loading -> ready | unavailable
+        self._error = None
+        self._load_s = None
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self._thread = None
+
+    def _load(self):
+        start = time.time()
         try:
             import easyocr
-            logger.info("Initializing EasyOCR (Lazy Load)...")
-            _reader = easyocr.Reader(['en'], gpu=False)
+            logger.info("Initializing EasyOCR...")
+            self._reader = easyocr.Reader(self.languages, gpu=self.gpu)
+            self._load_s = time.time() - start
+            self._state = "ready"
             logger.info("EasyOCR initialized successfully.")
         except ImportError:
             logger.error("EasyOCR module not found.")
-            _reader = False # Sentinel for failure
+            self._reader, self._state, self._error = False, "unavailable", "easyocr not installed"
         except Exception as e:
             logger.error(f"Failed to initialize EasyOCR: {e}")
-            _reader = False
-    return _reader
+            self._reader, self._state, self._error = False, "unavailable", str(e)
+        finally:
+            if self._load_s is None:
+                self._load_s = time.time() - start
+            self._loaded.set()
+
+    def warm_up(self, background=True):
+        """Starts loading the reader (idempotent). Returns immediately when background=True."""
+        with self._lock:
+            if self._state == "idle":
+                self._state = "loading"
+                self._thread = threading.Thread(target=self._load, name="ocr-warmup", daemon=True)
+                self._thread.start()
+        if not background:
+            self._loaded.wait()
+
+    @property
+    def ready(self) -> bool:
+        return self._state == "ready"
+
+    def status(self):
+        """{'state': idle|loading|ready|unavailable, 'load_s': float|None, 'error': str|None}"""
+        return {"state": self._state, "load_s": self._load_s, "error": self._error}
+
+    def get_reader(self):
+        """Returns the reader, loading it (or waiting for warm-up) if needed. False if unavailable."""
+        self.warm_up(background=False)
+        return self._reader
+
+    def _letterbox(self, img, width, height):
+        """Pads img onto a white width x height canvas (never shrinks it)."""
+        h, w = img.shape[:2]
+        canvas = np.full((height, width) + img.shape[2:], 255, dtype=img.dtype)
+        canvas[:h, :w] = img
+        return canvas
+
+    def _read_one(self, reader, img):
+        try:
+            return "".join(reader.readtext(img, detail=0))
+        except Exception as e:
+            logger.warning(f"OCR failed for crop: {e}")
+            return ""
+
+    def read_batch(self, images):
+        """
+        Runs OCR over a list of images and returns the concatenated text per image
+        ('' when nothing was read). Images that fit OCR_MAX_CANVAS are batched;
+        larger ones, and every image of a batch whose call fails, are read singly.
+        """
+        reader = self.get_reader()
+        if not reader or not images:
+            return ["" for _ in images]
+
+        texts = [""] * len(images)
+        batchable = []
+        for idx, img in enumerate(images):
+            if img.shape[0] <= OCR_MAX_CANVAS and img.shape[1] <= OCR_MAX_CANVAS:
+                batchable.append(idx)
+            else:
+                texts[idx] = self._read_one(reader, img)
+
+        for start in range(0, len(batchable), OCR_BATCH_SIZE):
+            chunk = batchable[start:start + OCR_BATCH_SIZE]
+            width = max(images[idx].shape[1] for idx in chunk)
+            height = max(images[idx].shape[0] for idx in chunk)
+            try:
+                batch = [self._letterbox(images[idx], width, height) for idx in chunk]
+                results = reader.readtext_batched(batch, detail=0)
+                for idx, result in zip(chunk, results):
+                    texts[idx] = "".join(result)
+            except Exception as e:
+                logger.warning(f"Batched OCR failed ({e}); falling back to per-crop OCR.")
+                for idx in chunk:
+                    texts[idx] = self._read_one(reader, images[idx])
+        return texts
+
+# Shared service (one reader per process)
+ocr_service = OCRService()
+
+def get_reader():
+    """Lazy loads EasyOCR reader only when requested."""
+    return ocr_service.get_reader()
+
+# Label localization: OCR only the tag region, normalized to this height
+OCR_LABEL_ROI = os.getenv("OCR_LABEL_ROI", "1") == "1"
+OCR_LABEL_HEIGHT = int(os.getenv("OCR_LABEL_HEIGHT", "64"))
+
+# Segmentation runs on a proxy whose longest side is at most this many px
+# (0 = segment at full resolution). Crops are still cut from the full image.
+SEGMENT_PROXY_MAX_DIM = int(os.getenv("SEGMENT_PROXY_MAX_DIM", "1600"))
+# Full-resolution tuning of the contour pass; scaled down with the proxy
+SEGMENT_BLUR_KSIZE = 5
+SEGMENT_BLOCK_SIZE = 19
+SEGMENT_PADDING = 20
+
+# Enhancement parameters
+WB_STRENGTH = 1.1
+CLAHE_CLIP_LIMIT = 2.5
+CLAHE_TILE_GRID = (8, 8)
+
+# CLAHE objects are reused, one per thread (they are not safe to share across threads)
+_clahe_local = threading.local()
+
+def get_clahe():
+    """Returns this thread's cached CLAHE instance."""
+    clahe = getattr(_clahe_local, "clahe", None)
+    if clahe is None:
+        clahe = cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_TILE_GRID)
+        _clahe_local.clahe = clahe
+    return clahe
+
+# Crop hand-off to the vision model: 'memory' encodes each crop once to JPEG bytes
+# sized for the model; 'disk' writes crop files and passes paths (legacy behaviour)
+CROP_HANDOFF = os.getenv("CROP_HANDOFF", "memory")
+# Longest side of the encoded crop (vision encoders resize to a few hundred px anyway)
+VISION_INPUT_MAX_DIM = int(os.getenv("VISION_INPUT_MAX_DIM", "768"))
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "90"))
+# In memory mode, also save the encoded crops to output_dir on a background thread
+CROP_PERSIST = os.getenv("CROP_PERSIST", "0") == "1"
+
+def encode_for_vision(img, max_dim=None, quality=None):
+    """JPEG-encodes a crop for the vision model, downscaling so the longest side fits max_dim."""
+    max_dim = VISION_INPUT_MAX_DIM if max_dim is None else max_dim
+    h, w = img.shape[:2]
+    if max_dim and max(h, w) > max_dim:
+        scale = max_dim / max(h, w)
+        img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality or VISION_JPEG_QUALITY])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return buf.tobytes()
+
+class CropWriter:
+    """Writes already-encoded crops to disk on one background thread, off the analysis path."""
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _write(self, path, data):
+        try:
+            with open(path, "wb") as f:
+                f.write(data)
+        except OSError as e:
+            logger.warning(f"Could not persist crop {path}: {e}")
+
+    def submit(self, path, data):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="crop-writer")
+                atexit.register(self.flush)
+            return self._executor.submit(self._write, path, data)
+
+    def flush(self):
+        """Blocks until every queued crop is on disk."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+crop_writer = CropWriter()
 
 class ImageProcessor:
     def __init__(self, output_dir="images/processed"):
         self.output_dir = output_dir
         os.makedirs(self.output_dir, exist_ok=True)
 
+    def _gray_world_lab(self, l, a, b):
+        """
+        In-place Gray World correction on LAB planes:
+        a -= (mean(a) - 128) * L/255 * WB_STRENGTH (same for b).
+        addWeighted computes per pixel and saturates to uint8, so no float
+        temporaries are allocated and out-of-range values clip instead of wrapping.
+        """
+        for chan in (a, b):
+            shift = (cv2.mean(chan)[0] - 128) * WB_STRENGTH / 255.0
+            cv2.addWeighted(chan, 1.0, l, -shift, 0, dst=chan)
+
     def apply_white_balance(self, img):
         """
         Applies Gray World White Balance to correct lighting color casts.
         """
-        result = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-        avg_a = np.average(result[:, :, 1])
-        avg_b = np.average(result[:, :, 2])
-        result[:, :, 1] = result[:, :, 1] - ((avg_a - 128) * (result[:, :, 0] / 255.0) * 1.1)
-        result[:, :, 2] = result[:, :, 2] - ((avg_b - 128) * (result[:, :, 0] / 255.0) * 1.1)
-        result = cv2.cvtColor(result, cv2.COLOR_LAB2BGR)
-        return result
+        l, a, b = cv2.split(cv2.cvtColor(img, cv2.COLOR_BGR2LAB))
+        self._gray_world_lab(l, a, b)
+        return cv2.cvtColor(cv2.merge((l, a, b)), cv2.COLOR_LAB2BGR)
 
     def apply_clahe(self, img):
         """
@@ -52,17 +245,76 @@ class ImageProcessor:
         to bring out texture details in jade.
         """
         # Convert to LAB to only enhance Luminance channel
-        lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-        l, a, b = cv2.split(lab)
-        
-        # Apply CLAHE to L-channel
-        clahe = cv2.createCLAHE(clipLimit=2.5, tileGridSize=(8, 8))
-        cl = clahe.apply(l)
-        
-        # Merge back
-        limg = cv2.merge((cl, a, b))
-        final = cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
-        return final
+        l, a, b = cv2.split(cv2.cvtColor(img, cv2.COLOR_BGR2LAB))
+        get_clahe().apply(l, dst=l)
+        return cv2.cvtColor(cv2.merge((l, a, b)), cv2.COLOR_LAB2BGR)
+
+    def enhance_crop(self, img):
+        """
+        Fused White Balance + CLAHE: one BGR->LAB conversion, in-place gray-world
+        correction of a/b, cached CLAHE on L, one LAB->BGR conversion.
+        Equivalent to apply_clahe(apply_white_balance(img)) minus the intermediate
+        BGR round-trip.
+        """
+        l, a, b = cv2.split(cv2.cvtColor(img, cv2.COLOR_BGR2LAB))
+        self._gray_world_lab(l, a, b)
+        get_clahe().apply(l, dst=l)
+        return cv2.cvtColor(cv2.merge((l, a, b)), cv2.COLOR_LAB2BGR)
+
+    def locate_label_region(self, crop):
+        """
+        Finds the small, high-contrast rectangular tag in a pendant crop.
+
+        Morphological gradient + Otsu marks strong edges (tag border and printed
+        characters); a horizontal closing merges them into solid blobs. Candidates
+        must be label-shaped (aspect 1.5-15, 0.2%-20% of the crop) and densely
+        filled, which rejects the thin, scattered edges of carved texture.
+
+        Returns: (x, y, w, h) of the best candidate, or None.
+        """
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        h, w = gray.shape[:2]
+        k = max(3, (min(h, w) // 40) | 1)
+
+        grad = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3)))
+        _, edges = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2 * k + 1, max(3, (k // 2) | 1)))
+        closed = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, kernel)
+
+        contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        best, best_score = None, 0.0
+        for cnt in contours:
+            x, y, bw, bh = cv2.boundingRect(cnt)
+            box_area = bw * bh
+            if not (0.002 * h * w <= box_area <= 0.2 * h * w):
+                continue
+            if not (1.5 <= bw / float(bh) <= 15):
+                continue
+            fill = cv2.contourArea(cnt) / box_area
+            if fill < 0.4:
+                continue
+            score = fill * float(gray[y:y+bh, x:x+bw].std()) # Dense and high-contrast
+            if score > best_score:
+                best, best_score = (x, y, bw, bh), score
+        return best
+
+    def extract_label_roi(self, crop):
+        """
+        Cuts the tag region out of a crop (with a small margin) and rescales it to
+        OCR_LABEL_HEIGHT px high. Returns None when no tag is found.
+        """
+        box = self.locate_label_region(crop)
+        if box is None:
+            return None
+        x, y, bw, bh = box
+        margin = max(2, bh // 8)
+        x0, y0 = max(0, x - margin), max(0, y - margin)
+        x1, y1 = min(crop.shape[1], x + bw + margin), min(crop.shape[0], y + bh + margin)
+        roi = crop[y0:y1, x0:x1]
+
+        scale = OCR_LABEL_HEIGHT / float(roi.shape[0])
+        interp = cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA
+        return cv2.resize(roi, (max(1, int(roi.shape[1] * scale)), OCR_LABEL_HEIGHT), interpolation=interp)
 
     def clean_item_code(self, raw_text):
         """
@@ -98,99 +350,160 @@ class ImageProcessor:
             
         return None # Return None if no valid code pattern found
 
+    def _assign_ocr_codes(self, detected_items, raw_crops, enhanced_crops):
+        """
+        Reads item codes for every crop: one batched pass over the tag regions of the
+        raw crops (whole crop when no tag is found), then a second batched pass over
+        the full enhanced crops that yielded no code.
+        """
+        try:
+            first_pass = []
+            for crop in raw_crops: # Unenhanced crop often reads better
+                roi = self.extract_label_roi(crop) if OCR_LABEL_ROI else None
+                first_pass.append(roi if roi is not None else crop)
+            texts = ocr_service.read_batch(first_pass)
+            retry = []
+            for idx, text in enumerate(texts):
+                cleaned = self.clean_item_code(text)
+                if cleaned:
+                    detected_items[idx]["ocr_code"] = cleaned
+                else:
+                    retry.append(idx)
+
+            # Fallback: Try OCR on enhanced crops
+            if retry:
+                retry_texts = ocr_service.read_batch([enhanced_crops[idx] for idx in retry])
+                for idx, text in zip(retry, retry_texts):
+                    cleaned = self.clean_item_code(text)
+                    if cleaned:
+                        detected_items[idx]["ocr_code"] = cleaned
+        except Exception as e:
+            logger.warning(f"OCR failed for tray: {e}")
+
+    def find_item_boxes(self, img, proxy_max_dim=None):
+        """
+        Detects pendant bounding boxes (x, y, w, h) in full-resolution coordinates.
+
+        When the photo is larger than proxy_max_dim (default SEGMENT_PROXY_MAX_DIM),
+        blur/threshold/contours run on an INTER_AREA-downscaled proxy with the blur
+        kernel and threshold block scaled to match, and boxes are mapped back.
+        """
+        if proxy_max_dim is None:
+            proxy_max_dim = SEGMENT_PROXY_MAX_DIM
+        img_h, img_w = img.shape[:2]
+
+        scale = 1.0
+        if proxy_max_dim and max(img_h, img_w) > proxy_max_dim:
+            scale = proxy_max_dim / float(max(img_h, img_w))
+
+        def _odd(value):
+            return max(3, int(round(value)) | 1)
+
+        # 1. Pre-processing for Contours
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if scale < 1.0:
+            gray = cv2.resize(gray, (max(1, int(img_w * scale)), max(1, int(img_h * scale))), interpolation=cv2.INTER_AREA)
+            ksize = _odd(SEGMENT_BLUR_KSIZE * scale)
+            block = _odd(SEGMENT_BLOCK_SIZE * scale)
+        else:
+            ksize, block = SEGMENT_BLUR_KSIZE, SEGMENT_BLOCK_SIZE
+
+        blurred = cv2.GaussianBlur(gray, (ksize, ksize), 0)
+        # Adaptive thresholding to handle uneven lighting on the tray
+        thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+                                      cv2.THRESH_BINARY_INV, block, 3)
+
+        # 2. Find Contours
+        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        proxy_h, proxy_w = gray.shape[:2]
+        min_area = (proxy_w * proxy_h) * 0.02 # Filter out noise (< 2% of image)
+
+        boxes = []
+        for cnt in contours:
+            if cv2.contourArea(cnt) < min_area:
+                continue
+            x, y, w, h = cv2.boundingRect(cnt)
+            if scale < 1.0:
+                # Map back to full resolution (round outward)
+                x0, y0 = int(x / scale), int(y / scale)
+                x1 = min(img_w, int(np.ceil((x + w) / scale)))
+                y1 = min(img_h, int(np.ceil((y + h) / scale)))
+                x, y, w, h = x0, y0, x1 - x0, y1 - y0
+            boxes.append((x, y, w, h))
+        return boxes
+
     def segment_and_crop(self, image_path, enable_ocr=True):
         """
         Detects individual pendants in a tray, crops them, enhances them,
-        and saves them for analysis.
+        and prepares them for analysis.
         
         Args:
             image_path: Path to source image.
             enable_ocr: If True, runs EasyOCR on crops. If False, skips OCR (Faster).
         
-        Returns: List of dicts {'path': str, 'code': str}
+        Returns: List of dicts {'crop_path': str, 'ocr_code': str, 'bbox': [x, y, w, h]}.
+        With CROP_HANDOFF='memory' each dict also has 'crop_bytes' (encoded JPEG), and
+        'crop_path' is None unless CROP_PERSIST queues the bytes for a background write.
         """
         original_img = cv2.imread(image_path)
         if original_img is None:
             logger.error(f"Could not read image: {image_path}")
             return []
 
-        # 1. Pre-processing for Contours
-        gray = cv2.cvtColor(original_img, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        # Adaptive thresholding to handle uneven lighting on the tray
-        thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                      cv2.THRESH_BINARY_INV, 19, 3)
+        img_h, img_w = original_img.shape[:2]
+
+        # 1-2. Find item boxes (on a downscaled proxy for large photos)
+        boxes = self.find_item_boxes(original_img)
 
-        # 2. Find Contours
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
         detected_items = []
         item_count = 0
-        
-        img_h, img_w = original_img.shape[:2]
-        min_area = (img_w * img_h) * 0.02 # Filter out noise (< 2% of image)
+        batch_token = uuid.uuid4().hex[:8]
 
-        # Lazy load reader only if needed
-        ocr_reader = None
-        if enable_ocr:
-            ocr_reader = get_reader()
+        raw_crops = []
+        enhanced_crops = []
 
-        for cnt in contours:
-            area = cv2.contourArea(cnt)
-            if area < min_area:
-                continue
-
-            # Get Bounding Box
-            x, y, w, h = cv2.boundingRect(cnt)
-            
+        for (x, y, w, h) in boxes:
             # Add padding
-            padding = 20
+            padding = SEGMENT_PADDING
             x = max(0, x - padding)
             y = max(0, y - padding)
             w = min(img_w - x, w + 2*padding)
             h = min(img_h - y, h + 2*padding)
             
-            # Crop
+            # Crop (full resolution)
             crop = original_img[y:y+h, x:x+w]
             
             if crop.size == 0:
                 continue
 
             # 3. Enhance Crop (Zoom-In Analysis Prep)
-            # Apply WB then CLAHE
-            enhanced_crop = self.apply_white_balance(crop)
-            enhanced_crop = self.apply_clahe(enhanced_crop)
+            # Apply WB then CLAHE (fused, single LAB round-trip)
+            enhanced_crop = self.enhance_crop(crop)
             
-            # Save Crop
-            item_filename = f"crop_{int(time.time())}_{item_count}.jpg"
+            # Unique per call so parallel workers never overwrite each other's crops
+            item_filename = f"crop_{int(time.time())}_{batch_token}_{item_count}.jpg"
             save_path = os.path.join(self.output_dir, item_filename)
-            cv2.imwrite(save_path, enhanced_crop)
-            
-            # 4. Run Specialized OCR on this specific crop
-            detected_code = "Unknown"
-            if enable_ocr and ocr_reader:
-                try:
-                    ocr_results = ocr_reader.readtext(crop, detail=0) # Use unenhanced crop for OCR sometimes better?
-                    # Concatenate all found text and try to find code
-                    full_text = "".join(ocr_results)
-                    cleaned = self.clean_item_code(full_text)
-                    if cleaned:
-                        detected_code = cleaned
-                    else:
-                        # Fallback: Try OCR on enhanced crop
-                        ocr_results_enh = ocr_reader.readtext(enhanced_crop, detail=0)
-                        full_text_enh = "".join(ocr_results_enh)
-                        cleaned_enh = self.clean_item_code(full_text_enh)
-                        if cleaned_enh:
-                            detected_code = cleaned_enh
-                except Exception as e:
-                    logger.warning(f"OCR failed for crop {item_count}: {e}")
-
-            detected_items.append({
-                "crop_path": save_path,
-                "ocr_code": detected_code
-            })
+            item = {"crop_path": save_path, "ocr_code": "Unknown", "bbox": [int(x), int(y), int(w), int(h)]}
+
+            if CROP_HANDOFF == "memory":
+                # Encode once; the bytes go straight to the vision model
+                item["crop_bytes"] = encode_for_vision(enhanced_crop)
+                if CROP_PERSIST:
+                    crop_writer.submit(save_path, item["crop_bytes"])
+                else:
+                    item["crop_path"] = None
+            else:
+                cv2.imwrite(save_path, enhanced_crop)
+
+            raw_crops.append(crop)
+            enhanced_crops.append(enhanced_crop)
+            detected_items.append(item)
             item_count += 1
+
+        # 4. Run Specialized OCR on all crops of the tray in batched calls
+        if enable_ocr and detected_items:
+            self._assign_ocr_codes(detected_items, raw_crops, enhanced_crops)
             
         return detected_items
 
@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import logging
+from typing import Dict, Any, Callable
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+from vision_utils import ImageProcessor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def legacy_enhance(img):
+    """The pre-fusion path: WB (float temporaries) -> BGR -> CLAHE (new object per call)."""
+    result = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
+    avg_a = np.average(result[:, :, 1])
+    avg_b = np.average(result[:, :, 2])
+    result[:, :, 1] = result[:, :, 1] - ((avg_a - 128) * (result[:, :, 0] / 255.0) * 1.1)
+    result[:, :, 2] = result[:, :, 2] - ((avg_b - 128) * (result[:, :, 0] / 255.0) * 1.1)
+    result = cv2.cvtColor(result, cv2.COLOR_LAB2BGR)
+
+    lab = cv2.cvtColor(result, cv2.COLOR_BGR2LAB)
+    l, a, b = cv2.split(lab)
+    clahe = cv2.createCLAHE(clipLimit=2.5, tileGridSize=(8, 8))
+    cl = clahe.apply(l)
+    return cv2.cvtColor(cv2.merge((cl, a, b)), cv2.COLOR_LAB2BGR)
+
+def measure(fn: Callable, img, runs: int) -> Dict[str, Any]:
+    fn(img) # Warm-up
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn(img)
+    per_crop_ms = (time.perf_counter() - start) * 1000 / runs
+
+    tracemalloc.start()
+    fn(img)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"per_crop_ms": round(per_crop_ms, 3), "peak_alloc_mb": round(peak / (1024 * 1024), 2)}
+
+def load_crop(path: str, size: int):
+    if path:
+        img = cv2.imread(path)
+        if img is None:
+            raise SystemExit(f"Could not read image: {path}")
+        return img
+    # Synthetic greenish crop with a warm color cast
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 255, (size, size, 3), dtype=np.uint8)
+    img[:, :, 1] = np.clip(img[:, :, 1].astype(np.int16) + 40, 0, 255)
+    img[:, :, 2] = np.clip(img[:, :, 2].astype(np.int16) + 25, 0, 255)
+    return img
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark for crop enhancement (WB + CLAHE).")
+    parser.add_argument("--image", default="", help="Crop image to use (default: synthetic)")
+    parser.add_argument("--size", type=int, default=800, help="Synthetic crop edge length in px")
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    img = load_crop(args.image, args.size)
+    processor = ImageProcessor()
+    logger.info(f"Benchmarking enhancement on a {img.shape[1]}x{img.shape[0]} crop, {args.runs} runs")
+
+    results = {
+        "legacy (WB -> CLAHE)": measure(legacy_enhance, img, args.runs),
+        "fused (enhance_crop)": measure(processor.enhance_crop, img, args.runs),
+    }
+
+    print("\n" + "=" * 64)
+    print(f"{'Path':<26} | {'ms / crop':<12} | {'Peak alloc (MB)'}")
+    print("-" * 64)
+    for name, r in results.items():
+        print(f"{name:<26} | {r['per_crop_ms']:<12} | {r['peak_alloc_mb']}")
+    print("=" * 64 + "\n")
+
+if __name__ == "__main__":
+    main()
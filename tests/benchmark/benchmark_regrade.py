@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import random
+import argparse
+import logging
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+import db_manager
+from grading_utils import JadeGrader, regrade_all
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+COLORS = ["Imperial Green", "Apple Green", "Lavender", "Icy white", "pale green", "grey", "帝王綠", "陽綠"]
+TEXTURES = ["Glassy, translucent", "fine grained", "cloudy with inclusions", "冰種 texture", "coarse"]
+MOTIFS = ["Guanyin", "Buddha", "Bamboo", "Leaf", "Dragon", "Pixiu", "Ruyi"]
+
+def build_inventory(count: int, seed: int = 7):
+    random.seed(seed)
+    items = [{
+        "item_code": f"BENCH-{i:06d}",
+        "title": "Jade Pendant",
+        "description_hero": "A classical pendant. " * 10,
+        "attributes": {
+            "color": random.choice(COLORS),
+            "characteristics": random.choice(TEXTURES),
+            "motif": random.choice(MOTIFS)
+        },
+        "rarity_rank": "B"
+    } for i in range(count)]
+    for i in range(0, count, 5000):
+        db_manager.save_items(items[i:i + 5000])
+    return items
+
+def main():
+    parser = argparse.ArgumentParser(description="Grading throughput and bulk regrade time on a synthetic inventory.")
+    parser.add_argument("--items", type=int, default=50000, help="Synthetic inventory size (default: 50000)")
+    parser.add_argument("--db", default=os.path.join("data", "benchmark_regrade.db"))
+    args = parser.parse_args()
+
+    db_manager.DB_PATH = args.db
+    for path in (args.db, args.db + "-wal", args.db + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    db_manager.reset_database()
+
+    start = time.perf_counter()
+    items = build_inventory(args.items)
+    logger.info(f"Inserted {args.items} items in {time.perf_counter() - start:.1f}s")
+
+    grader = JadeGrader()
+    features = [item["attributes"] for item in items]
+    start = time.perf_counter()
+    for f in features:
+        grader.calculate_grade(f)
+    grade_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    first = regrade_all(grader)
+    first_s = time.perf_counter() - start
+    start = time.perf_counter()
+    second = regrade_all(grader)
+    second_s = time.perf_counter() - start
+
+    print(f"calculate_grade: {len(features) / grade_s:,.0f} items/s")
+    print(f"regrade_all (all ranks change):  {first_s:.2f}s, {first['changed']} updated")
+    print(f"regrade_all (rules unchanged):   {second_s:.2f}s, {second['changed']} updated")
+
+    db_manager.flush_telemetry()
+    db_manager.close_db_connections()
+    for path in (args.db, args.db + "-wal", args.db + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,19 @@ import unittest
 import os
 import json
 import sqlite3
+import shutil
 import sys
+import time
+from unittest import mock
 
 # Add src to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from db_manager import save_item, get_all_items, log_telemetry
+from db_manager import save_item, get_all_items, log_telemetry, flush_telemetry
 from ai_engine import _get_symbolism_context
+import ai_engine
+import batch_pipeline
+from result_cache import ResultCache
 
 class TestJadeSystem(unittest.TestCase):
 
@@ -25,10 +31,22 @@ class TestJadeSystem(unittest.TestCase):
             conn.executescript(f.read())
         conn.close()
 
+        self.test_cache_path = "data/test_cache.db"
+
+        # No Ollama here: pipelines skip their per-batch service check unless a test opts in
+        service_check = mock.patch.object(batch_pipeline, "check_ollama_service", return_value=None)
+        service_check.start()
+        self.addCleanup(service_check.stop)
+
     def tearDown(self):
-        # Clean up test DB
-        if os.path.exists(self.test_db_path):
-            os.remove(self.test_db_path)
+        # Clean up test DB (pooled connections must be closed first)
+        import db_manager
+        db_manager.flush_telemetry()
+        db_manager.close_db_connections()
+        for base in (self.test_db_path, self.test_cache_path):
+            for path in (base, base + "-wal", base + "-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
 
     def test_database_crud(self):
         """Test saving and retrieving items."""
@@ -62,6 +80,7 @@ class TestJadeSystem(unittest.TestCase):
             action="run_test",
             execution_data={"duration_ms": 100}
         )
+        flush_telemetry() # Telemetry is written asynchronously
         
         conn = sqlite3.connect(self.test_db_path)
         cursor = conn.cursor()
@@ -88,5 +107,1015 @@ class TestJadeSystem(unittest.TestCase):
         context = _get_symbolism_context("UnknownThing", "Invisible")
         self.assertEqual(context, "")
 
+    def test_concurrent_crop_analysis_order(self):
+        """Test that concurrent crop analysis keeps tray order and isolates failures."""
+        crops = [{"crop_path": f"crop_{i}.jpg", "ocr_code": f"PA-000{i}"} for i in range(6)]
+
+        def fake_analyze(path, code, user_hints="", image_bytes=None):
+            idx = int(path.split("_")[1].split(".")[0])
+            time.sleep(0.01 * (6 - idx)) # Later crops finish first
+            if idx == 3:
+                raise RuntimeError("boom")
+            return {"item_code": code, "visual_features": {"motif": "Buddha"}}
+
+        with mock.patch.object(ai_engine, "analyze_single_crop", side_effect=fake_analyze):
+            results = ai_engine.analyze_crops(crops, max_workers=4)
+
+        self.assertEqual([r["crop_path"] for r in results], [c["crop_path"] for c in crops])
+        self.assertEqual(results[3]["visual_features"]["color"], "Analysis Failed")
+        self.assertEqual([r["visual_features"]["motif"] for i, r in enumerate(results) if i != 3], ["Buddha"] * 5)
+        self.assertEqual(results[5]["item_code"], "PA-0005")
+
+    def test_batch_pipeline_order_and_errors(self):
+        """Test that the staged pipeline yields files in upload order and isolates failures."""
+        def fake_segment(path, enable_ocr=True):
+            time.sleep(0.01)
+            return [{"crop_path": path, "ocr_code": "PA-0001"}]
+
+        def fake_vision(path, crops, user_hints="", max_workers=None):
+            if path.endswith("bad.jpg"):
+                return [{"error": "vision down"}]
+            time.sleep(0.02)
+            return [{"item_code": "PA-0001", "visual_features": {"motif": "Leaf"}}]
+
+        jobs = [{"name": f"f{i}", "path": f"img_{i}.jpg"} for i in range(5)]
+        jobs[2]["path"] = "bad.jpg"
+
+        with mock.patch.object(batch_pipeline, "segment_image", side_effect=fake_segment), \
+             mock.patch.object(batch_pipeline, "analyze_segmented_image", side_effect=fake_vision), \
+             mock.patch.object(batch_pipeline, "generate_marketing_copy", return_value={"hero": "h", "modern": "m", "social": "s"}):
+            pipeline = batch_pipeline.BatchPipeline(segment_workers=2, vision_workers=2, copy_workers=2, queue_size=1)
+            results = list(pipeline.run(jobs))
+
+        self.assertEqual([r["name"] for r in results], [j["name"] for j in jobs])
+        self.assertEqual(results[2]["error"], "vision down")
+        self.assertEqual(results[4]["items"][0]["copy_deck"]["hero"], "h")
+
+    def test_batch_pipeline_reports_ollama_down(self):
+        """Test that the pipeline checks Ollama once per batch and fails every file clearly."""
+        registry = mock.Mock()
+        registry.status.return_value = {"running": False}
+        jobs = [{"name": f"f{i}", "path": f"img_{i}.jpg"} for i in range(3)]
+
+        with mock.patch.object(batch_pipeline, "check_ollama_service", ai_engine.check_ollama_service), \
+             mock.patch.object(ai_engine, "get_registry", return_value=registry), \
+             mock.patch.object(batch_pipeline, "segment_image") as segment, \
+             mock.patch.object(batch_pipeline, "analyze_segmented_image") as vision:
+            results = list(batch_pipeline.BatchPipeline().run(jobs))
+
+        self.assertEqual([r["index"] for r in results], [0, 1, 2])
+        self.assertTrue(all("Ollama service is not running" in r["error"] and r["items"] == [] for r in results))
+        segment.assert_not_called()
+        vision.assert_not_called()
+        self.assertEqual(registry.status.call_count, len(ai_engine.OLLAMA_HOSTS))
+
+    def test_result_cache_eviction(self):
+        """Test cache hits/misses and LRU/age eviction."""
+        cache = ResultCache("test", db_path=self.test_cache_path, max_entries=2)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", {"v": 1}, cost_ms=500)
+        cache.put("b", {"v": 2})
+        self.assertEqual(cache.get("a"), {"v": 1}) # 'a' is now most recently used
+        cache.put("c", {"v": 3})
+        cache.evict()
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), {"v": 3})
+        self.assertEqual(cache.stats(), {"hits": 2, "misses": 2, "saved_ms": 500})
+
+        expiring = ResultCache("test", db_path=self.test_cache_path, max_age_s=-1)
+        self.assertIsNone(expiring.get("a"))
+
+    def test_vision_cache_skips_ollama(self):
+        """Test that a repeated crop is served from the vision cache."""
+        crop_path = "data/test_crop.jpg"
+        with open(crop_path, "wb") as f:
+            f.write(b"fake-jpeg-bytes")
+        response = {"message": {"content": "A green buddha pendant"}}
+        try:
+            with mock.patch.object(ai_engine, "VISION_CACHE", ResultCache("vision", db_path=self.test_cache_path)), \
+                 mock.patch.object(ai_engine, "VISION_MODEL", "moondream:latest"), \
+                 mock.patch.object(ai_engine, "safe_chat_call", return_value=response) as chat:
+                first = ai_engine.analyze_single_crop(crop_path, "PA-0425")
+                second = ai_engine.analyze_single_crop(crop_path, "PA-0425")
+                third = ai_engine.analyze_single_crop(crop_path, "PA-0425", user_hints="觀音")
+        finally:
+            os.remove(crop_path)
+
+        self.assertEqual(chat.call_count, 2) # Different hints miss the cache
+        self.assertEqual(first, second)
+        self.assertEqual(second["visual_features"]["motif"], "Buddha")
+
+    def test_copy_cache_signature_dedup(self):
+        """Test that near-identical features reuse one copy generation."""
+        response = {"message": {"content": json.dumps({"hero": "h", "modern": "m", "social": "s"})}}
+        item_a = {"visual_features": {"motif": "Buddha", "color": "Green", "characteristics": "Smooth,  icy."}}
+        item_b = {"visual_features": {"motif": "buddha", "color": "green", "characteristics": "smooth icy"}}
+        item_c = {"visual_features": {"motif": "Dragon", "color": "green", "characteristics": "smooth icy"}}
+
+        with mock.patch.object(ai_engine, "COPY_CACHE", ResultCache("copy", db_path=self.test_cache_path)), \
+             mock.patch.object(ai_engine, "safe_chat_call", return_value=response) as chat:
+            first = ai_engine.generate_marketing_copy(item_a)
+            second = ai_engine.generate_marketing_copy(item_b)
+            self.assertEqual(chat.call_count, 1)
+            self.assertEqual(first, second)
+
+            ai_engine.generate_marketing_copy(item_c)
+            self.assertEqual(chat.call_count, 2)
+
+            # Variant mode reuses the cached copy but asks for a rewrite
+            chat.return_value = {"message": {"content": json.dumps({"hero": "h2", "modern": "m2", "social": "s2"})}}
+            variant = ai_engine.generate_marketing_copy(item_b, variant=True)
+            self.assertEqual(chat.call_count, 3)
+            self.assertEqual(variant["hero"], "h2")
+
+    def test_connection_pool_reuse_and_concurrency(self):
+        """Test per-thread connection reuse and concurrent writers under WAL."""
+        import threading
+        import db_manager
+
+        conn = db_manager.get_db_connection()
+        self.assertIs(conn, db_manager.get_db_connection())
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+        errors = []
+        def writer(n):
+            for i in range(20):
+                if not save_item({"item_code": f"T{n}-{i}", "title": "t"}):
+                    errors.append((n, i))
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(get_all_items()), 80)
+
+        # A failing transaction rolls back
+        with self.assertRaises(sqlite3.IntegrityError):
+            with db_manager.transaction() as tx:
+                tx.execute("INSERT INTO items (item_code) VALUES ('ROLLBACK-1')")
+                tx.execute("INSERT INTO items (item_code) VALUES ('T0-0')")
+        self.assertEqual(len(get_all_items()), 80)
+
+    def test_telemetry_batching_and_spill(self):
+        """Test that buffered telemetry is batched and overflow spills to a file."""
+        import db_manager
+        spill_path = "data/test_spill.jsonl"
+        writer = db_manager.TelemetryWriter(flush_size=10, flush_interval_s=60, max_queue=1000, spill_path=spill_path)
+        try:
+            with mock.patch.object(db_manager, "_telemetry_writer", writer):
+                for i in range(25):
+                    log_telemetry(module="batch", action=f"evt_{i}")
+                self.assertTrue(flush_telemetry())
+
+            conn = sqlite3.connect(self.test_db_path)
+            count = conn.execute("SELECT COUNT(*) FROM telemetry WHERE module='batch'").fetchone()[0]
+            conn.close()
+            self.assertEqual(count, 25)
+
+            # Overflowing the queue spills instead of blocking
+            tiny = db_manager.TelemetryWriter(max_queue=1, spill_path=spill_path)
+            tiny._ensure_started = lambda: None # Keep the queue undrained
+            for _ in range(3):
+                tiny.log(("row",))
+            with open(spill_path, encoding="utf-8") as f:
+                self.assertEqual(len(f.readlines()), 2)
+        finally:
+            writer.close()
+            if os.path.exists(spill_path):
+                os.remove(spill_path)
+
+    def test_bulk_save_and_import(self):
+        """Test bulk upserts with per-row results and the CSV/JSON import paths."""
+        import db_manager
+        results = db_manager.save_items([
+            {"item_code": "BULK-1", "title": "One"},
+            {"title": "No code"},
+            {"item_code": "BULK-2", "title": "Two", "attributes": {"color": "green"}},
+        ])
+        self.assertEqual([r["success"] for r in results], [True, False, True])
+        self.assertEqual(len(get_all_items()), 2)
+
+        csv_path, json_path = "data/test_import.csv", "data/test_import.json"
+        try:
+            with open(csv_path, "w", encoding="utf-8", newline="") as f:
+                f.write("item_code,title,rarity_rank,attributes_json\n")
+                f.write('BULK-1,Updated,A,"{""motif"": ""Leaf""}"\n')
+                f.write("BULK-3,Three,,\n")
+                f.write("BULK-4,Broken,B,{not json\n")
+            summary = db_manager.import_items_from_csv(csv_path, batch_size=2)
+            self.assertEqual((summary["total"], summary["saved"], summary["failed"]), (3, 2, 1))
+
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump([{"item_code": f"J-{i}", "title": "t"} for i in range(5)], f)
+            summary = db_manager.import_items_from_json(json_path)
+            self.assertEqual(summary["saved"], 5)
+        finally:
+            for path in (csv_path, json_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        items = {i["item_code"]: i for i in get_all_items()}
+        self.assertEqual(len(items), 8)
+        self.assertEqual(items["BULK-1"]["rarity_rank"], "A")
+        self.assertEqual(json.loads(items["BULK-1"]["attributes_json"]), {"motif": "Leaf"})
+
+    def test_catalog_query_filters_and_pages(self):
+        """Test server-side grade/keyword filtering, FTS search and pagination."""
+        import db_manager
+        db_manager.check_and_migrate_db()
+        db_manager.save_items([
+            {"item_code": f"PA-{i:04d}", "title": f"Jade Pendant - {'Guanyin' if i % 2 else 'Leaf'}",
+             "description_social": "觀音 護身" if i % 2 else "一葉致富",
+             "attributes": {"color": "Icy" if i % 3 == 0 else "Green"},
+             "rarity_rank": "A" if i % 3 == 0 else "B"}
+            for i in range(30)
+        ])
+
+        page = db_manager.query_items(limit=10, offset=20, sort="code")
+        self.assertEqual(page["total"], 30)
+        self.assertEqual([i["item_code"] for i in page["items"]][:2], ["PA-0020", "PA-0021"])
+
+        self.assertEqual(db_manager.query_items(grade="A")["total"], 10)
+        self.assertEqual(db_manager.query_items(keyword="guanyin")["total"], 15) # FTS, case-insensitive
+        self.assertEqual(db_manager.query_items(keyword="觀音")["total"], 15) # Short CJK -> LIKE
+        self.assertEqual(db_manager.query_items(keyword="icy", grade="A")["total"], 10) # attributes_json
+        self.assertEqual(db_manager.query_items(keyword="pa-0007")["items"][0]["item_code"], "PA-0007")
+
+        # Updates keep the index in sync
+        save_item({"item_code": "PA-0007", "title": "Dragon"})
+        self.assertEqual(db_manager.query_items(keyword="Dragon")["total"], 1)
+        self.assertEqual(db_manager.query_items(keyword="guanyin")["total"], 14)
+        self.assertEqual(db_manager.count_items(), 30)
+
+        # CJK attribute values are stored unescaped, so they are searchable
+        save_item({"item_code": "PA-0100", "title": "Jade Pendant", "attributes": {"color": "帝王綠"}})
+        self.assertEqual([i["item_code"] for i in db_manager.query_items(keyword="帝王綠")["items"]], ["PA-0100"])
+        self.assertEqual(db_manager.query_items(keyword="王綠")["total"], 1) # Short CJK -> LIKE
+
+        # Rows escaped by older versions are re-encoded (and re-indexed) once
+        with db_manager.transaction() as conn:
+            conn.execute("UPDATE items SET attributes_json = ? WHERE item_code = 'PA-0100'", (json.dumps({"color": "帝王綠"}),))
+            conn.execute("DELETE FROM meta WHERE key = 'attributes_utf8'")
+        self.assertEqual(db_manager.query_items(keyword="帝王綠")["total"], 0)
+        db_manager.check_and_migrate_db()
+        self.assertEqual(db_manager.query_items(keyword="帝王綠")["total"], 1)
+
+    def test_streaming_export(self):
+        """Test chunked CSV / JSON Lines export."""
+        import csv
+        import db_manager
+        db_manager.save_items([{"item_code": f"EX-{i}", "title": f"Item {i}"} for i in range(12)])
+
+        self.assertEqual(len(list(db_manager.iter_items(chunk_size=5))), 12)
+
+        csv_path, jsonl_path = "data/test_export.csv", "data/test_export.jsonl"
+        try:
+            self.assertEqual(db_manager.export_items(csv_path, "csv"), 12)
+            with open(csv_path, encoding="utf-8", newline="") as f:
+                rows = list(csv.DictReader(f))
+            self.assertEqual(len(rows), 12)
+            self.assertEqual(list(rows[0].keys()), db_manager.EXPORT_COLUMNS)
+
+            self.assertEqual(db_manager.export_items(jsonl_path, "jsonl"), 12)
+            with open(jsonl_path, encoding="utf-8") as f:
+                self.assertEqual(json.loads(f.readline())["item_code"][:3], "EX-")
+        finally:
+            for path in (csv_path, jsonl_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        self.assertTrue(db_manager.export_items_to_csv().startswith("item_code,title"))
+
+    def test_fused_enhancement(self):
+        """Test that the fused WB + CLAHE path removes a color cast without wrapping."""
+        import cv2
+        import numpy as np
+        from vision_utils import ImageProcessor
+
+        rng = np.random.default_rng(0)
+        img = rng.integers(0, 255, (120, 160, 3), dtype=np.uint8)
+        img[:, :, 2] = np.clip(img[:, :, 2].astype(np.int16) + 80, 0, 255) # Strong red cast
+
+        output_dir = "data/test_enhance_crops"
+        self.addCleanup(shutil.rmtree, output_dir, ignore_errors=True)
+        processor = ImageProcessor(output_dir=output_dir)
+        enhanced = processor.enhance_crop(img)
+        self.assertEqual(enhanced.shape, img.shape)
+        self.assertEqual(enhanced.dtype, np.uint8)
+
+        cast_before = abs(cv2.mean(cv2.cvtColor(img, cv2.COLOR_BGR2LAB))[1] - 128)
+        cast_after = abs(cv2.mean(cv2.cvtColor(enhanced, cv2.COLOR_BGR2LAB))[1] - 128)
+        self.assertLess(cast_after, cast_before)
+
+    def test_ocr_batching_and_fallback(self):
+        """Test that tray OCR runs batched and only retries failed crops on enhanced images."""
+        import numpy as np
+        import vision_utils
+
+        class FakeReader:
+            def __init__(self):
+                self.batches = []
+            def readtext_batched(self, images, detail=0):
+                self.batches.append(len(images))
+                self.sizes = {img.shape for img in images}
+                return [["PA-0425"] if img.mean() > 200 else ["x"] for img in images]
+
+        reader = FakeReader()
+        service = vision_utils.OCRService()
+        service._reader, service._state = reader, "ready"
+        service._loaded.set()
+
+        raw = [np.full((40, 60, 3), 250, np.uint8), np.full((50, 30, 3), 10, np.uint8)]
+        enhanced = [np.full((40, 60, 3), 250, np.uint8), np.full((50, 30, 3), 250, np.uint8)]
+        items = [{"ocr_code": "Unknown"}, {"ocr_code": "Unknown"}]
+
+        output_dir = "data/test_ocr_crops"
+        self.addCleanup(shutil.rmtree, output_dir, ignore_errors=True)
+        with mock.patch.object(vision_utils, "ocr_service", service):
+            vision_utils.ImageProcessor(output_dir=output_dir)._assign_ocr_codes(items, raw, enhanced)
+
+        self.assertEqual(reader.batches, [2, 1]) # One batch for the tray, one for the retry
+        self.assertEqual(len(reader.sizes), 1) # Letterboxed to a common canvas
+        self.assertEqual([i["ocr_code"] for i in items], ["PA-0425", "PA-0425"])
+        self.assertEqual(service.status()["state"], "ready")
+
+    def test_ocr_keeps_large_crops_at_full_resolution(self):
+        """Test that crops larger than the batch canvas are not shrunk before OCR."""
+        import numpy as np
+        import vision_utils
+
+        class FakeReader:
+            def __init__(self):
+                self.single, self.batched = [], []
+            def readtext(self, img, detail=0):
+                self.single.append(img.shape)
+                return ["PA-0425"] if img.shape[:2] == (900, 1200) else ["x"] # Tag only legible at full size
+            def readtext_batched(self, images, detail=0):
+                self.batched.append([img.shape for img in images])
+                return [["PA-0007"] for _ in images]
+
+        reader = FakeReader()
+        service = vision_utils.OCRService()
+        service._reader, service._state = reader, "ready"
+        service._loaded.set()
+
+        big = np.full((900, 1200, 3), 250, np.uint8)
+        small = np.full((40, 60, 3), 250, np.uint8)
+        self.assertGreater(big.shape[1], vision_utils.OCR_MAX_CANVAS)
+        self.assertEqual(service.read_batch([small, big, small]), ["PA-0007", "PA-0425", "PA-0007"])
+        self.assertEqual(reader.single, [(900, 1200, 3)])
+        self.assertEqual(reader.batched, [[(40, 60, 3), (40, 60, 3)]])
+
+    def test_label_region_detection(self):
+        """Test that the tag is localized and carved texture is ignored."""
+        import cv2
+        import numpy as np
+        from vision_utils import ImageProcessor, OCR_LABEL_HEIGHT
+
+        rng = np.random.default_rng(0)
+        crop = np.full((600, 500, 3), 40, np.uint8)
+        cv2.ellipse(crop, (250, 260), (170, 220), 0, 0, 360, (90, 170, 80), -1)
+        for _ in range(60): # Carved texture
+            p1, p2 = rng.integers(100, 420, 2), rng.integers(100, 420, 2)
+            cv2.line(crop, (int(p1[0]), int(p1[1])), (int(p2[0]), int(p2[1])), (60, 130, 55), 2)
+        cv2.rectangle(crop, (300, 500), (470, 560), (245, 245, 245), -1)
+        cv2.putText(crop, "PA-0425_AF", (308, 540), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (20, 20, 20), 2)
+
+        output_dir = "data/test_label_crops"
+        self.addCleanup(shutil.rmtree, output_dir, ignore_errors=True)
+        processor = ImageProcessor(output_dir=output_dir)
+        x, y, w, h = processor.locate_label_region(crop)
+        self.assertTrue(abs(x - 300) < 10 and abs(y - 500) < 10 and abs(w - 170) < 15 and abs(h - 60) < 15)
+
+        roi = processor.extract_label_roi(crop)
+        self.assertEqual(roi.shape[0], OCR_LABEL_HEIGHT)
+        self.assertLess(roi.shape[0] * roi.shape[1], crop.shape[0] * crop.shape[1] / 10)
+
+        self.assertIsNone(processor.locate_label_region(np.full((200, 200, 3), 128, np.uint8)))
+
+    def test_proxy_segmentation_matches_full_res(self):
+        """Test that proxy-resolution segmentation finds the same items as full resolution."""
+        import cv2
+        import numpy as np
+        from vision_utils import ImageProcessor
+
+        rng = np.random.default_rng(1)
+        tray = np.full((2400, 3200, 3), 25, np.uint8)
+        for r in range(3):
+            for c in range(4):
+                color = tuple(int(v) for v in rng.integers(80, 220, 3))
+                cv2.ellipse(tray, (c * 800 + 400, r * 800 + 400), (240, 300), 0, 0, 360, color, -1)
+        tray = np.clip(tray.astype(np.int16) + rng.normal(0, 6, tray.shape).astype(np.int16), 0, 255).astype(np.uint8)
+
+        output_dir = "data/test_proxy_crops"
+        self.addCleanup(shutil.rmtree, output_dir, ignore_errors=True)
+        processor = ImageProcessor(output_dir=output_dir)
+        def by_cell(box):
+            return ((box[1] + box[3] // 2) // 800, (box[0] + box[2] // 2) // 800)
+
+        full = sorted(processor.find_item_boxes(tray, proxy_max_dim=0), key=by_cell)
+        proxy = sorted(processor.find_item_boxes(tray, proxy_max_dim=800), key=by_cell)
+
+        self.assertEqual(len(full), 12)
+        self.assertEqual(len(proxy), len(full))
+        for (fx, fy, fw, fh), (px, py, pw, ph) in zip(full, proxy):
+            self.assertLess(max(abs(fx - px), abs(fy - py), abs(fw - pw), abs(fh - ph)), 12)
+
+    def test_preprocess_pool_records(self):
+        """Test that the process pool returns lightweight crop records and feeds the pipeline."""
+        import cv2
+        import numpy as np
+        from preprocess_pool import PreprocessPool
+
+        tray = np.full((900, 1200, 3), 25, np.uint8)
+        for c in range(3):
+            cv2.ellipse(tray, (c * 400 + 200, 450), (120, 160), 0, 0, 360, (60, 160, 90), -1)
+        tray_path = "data/test_tray.jpg"
+        cv2.imwrite(tray_path, tray)
+        self.addCleanup(os.remove, tray_path)
+
+        output_dir = "data/test_pool_crops"
+        self.addCleanup(shutil.rmtree, output_dir, ignore_errors=True)
+        with PreprocessPool(workers=1, output_dir=output_dir, warm_ocr=False) as pool:
+            records = list(pool.map([tray_path, "data/missing.jpg"], enable_ocr=False))
+
+            jobs = [{"name": "tray", "path": tray_path}]
+            with mock.patch.object(batch_pipeline, "segment_image") as in_process_segment, \
+                 mock.patch.object(batch_pipeline, "analyze_segmented_image", side_effect=lambda path, crops, **kw: [{"crops": len(crops)}]):
+                results = list(batch_pipeline.BatchPipeline(generate_copy=False, preprocess_pool=pool).run(jobs))
+
+        self.assertEqual(len(records[0]["crops"]), 3)
+        self.assertEqual(set(records[0]["crops"][0]), {"crop_path", "ocr_code", "bbox", "crop_bytes"})
+        self.assertTrue(all(c["crop_bytes"][:2] == b"\xff\xd8" for c in records[0]["crops"]))
+        self.assertEqual(records[1]["crops"], [])
+        in_process_segment.assert_not_called()
+        self.assertEqual(results[0]["items"], [{"crops": 3}])
+
+    def test_in_memory_crop_handoff(self):
+        """Test that crops reach the vision model as encoded bytes without touching disk."""
+        import cv2
+        import numpy as np
+        import vision_utils
+
+        tray = np.full((1800, 2400, 3), 25, np.uint8)
+        for c in range(2):
+            cv2.ellipse(tray, (c * 1200 + 600, 900), (400, 600), 0, 0, 360, (60, 160, 90), -1)
+        tray_path = "data/test_tray.jpg"
+        cv2.imwrite(tray_path, tray)
+        self.addCleanup(os.remove, tray_path)
+
+        output_dir = "data/test_crops"
+        processor = vision_utils.ImageProcessor(output_dir=output_dir)
+        self.addCleanup(shutil.rmtree, output_dir, ignore_errors=True)
+
+        with mock.patch.object(vision_utils, "CROP_HANDOFF", "memory"), \
+             mock.patch.object(vision_utils, "CROP_PERSIST", False):
+            crops = processor.segment_and_crop(tray_path, enable_ocr=False)
+        self.assertEqual(len(crops), 2)
+        self.assertEqual(os.listdir(output_dir), [])
+        self.assertIsNone(crops[0]["crop_path"])
+        decoded = cv2.imdecode(np.frombuffer(crops[0]["crop_bytes"], np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(max(decoded.shape[:2]), vision_utils.VISION_INPUT_MAX_DIM)
+
+        response = {"message": {"content": "A green leaf pendant"}}
+        with mock.patch.object(ai_engine, "VISION_CACHE_ENABLED", False), \
+             mock.patch.object(ai_engine, "VISION_MODEL", "moondream:latest"), \
+             mock.patch.object(ai_engine, "safe_chat_call", return_value=response) as chat:
+            results = ai_engine.analyze_crops(crops)
+        sent = [call.kwargs["messages"][0]["images"][0] for call in chat.call_args_list]
+        self.assertEqual(sorted(sent), sorted(c["crop_bytes"] for c in crops))
+        self.assertEqual(results[1]["crop_bytes"], crops[1]["crop_bytes"])
+
+        # Optional persistence happens off the analysis path
+        with mock.patch.object(vision_utils, "CROP_HANDOFF", "memory"), \
+             mock.patch.object(vision_utils, "CROP_PERSIST", True):
+            persisted = processor.segment_and_crop(tray_path, enable_ocr=False)
+        vision_utils.crop_writer.flush()
+        with open(persisted[0]["crop_path"], "rb") as f:
+            self.assertEqual(f.read(), persisted[0]["crop_bytes"])
+
+    def test_model_registry_caches_and_refreshes(self):
+        """Test that status/model checks share one cached fetch and refresh in the background."""
+        import model_registry
+
+        tags = {"models": [{"name": "moondream:latest", "size": 1738000000,
+                            "details": {"family": "phi2", "quantization_level": "Q4_0"}}]}
+        ps = {"models": [{"name": "moondream:latest", "size_vram": 1900000000, "expires_at": "2026-01-01T00:00:00Z"}]}
+
+        def fake_get(url, timeout=None):
+            response = mock.Mock(status_code=200)
+            response.json.return_value = ps if url.endswith("/api/ps") else tags
+            return response
+
+        registry = model_registry.ModelRegistry("http://ollama.test", ttl_s=60)
+        with mock.patch("requests.get", side_effect=fake_get) as http_get:
+            self.assertTrue(registry.status()["running"])
+            self.assertTrue(registry.check_model("moondream:latest")["available"])
+            self.assertFalse(registry.check_model("gemma3n:e4b")["available"])
+            info = registry.model_info("moondream:latest")
+            self.assertEqual(http_get.call_count, 2) # one /api/tags + one /api/ps
+
+            self.assertEqual(info["quantization"], "Q4_0")
+            self.assertTrue(info["loaded"])
+            self.assertEqual(registry.describe_model("moondream:latest"), "1.6 GB · Q4_0 · loaded")
+
+            # Expired snapshot is still served while one background refresh runs
+            registry.ttl_s = 0
+            stale = registry.snapshot()
+            registry.models()
+            for _ in range(50):
+                if registry.snapshot()["fetched_at"] > stale["fetched_at"]:
+                    break
+                time.sleep(0.01)
+            self.assertGreater(registry.snapshot()["fetched_at"], stale["fetched_at"])
+
+    def test_circuit_breaker_and_async_client(self):
+        """Test deadlines, retries and fail-fast behaviour of the async inference client."""
+        import asyncio
+        import inference_client
+
+        breaker = inference_client.CircuitBreaker(failure_threshold=2, reset_s=0.05)
+        client = inference_client.AsyncInferenceClient("http://ollama.test", timeout_s=0.05, retries=3, breaker=breaker)
+        calls = []
+
+        async def wedged_chat(**kwargs):
+            calls.append(kwargs["model"])
+            await asyncio.sleep(1)
+
+        async def healthy_chat(**kwargs):
+            calls.append(kwargs["model"])
+            return {"message": {"content": "ok"}}
+
+        fake = mock.Mock()
+        import ollama # Imported lazily by inference_client
+        with mock.patch.object(ollama, "AsyncClient", return_value=fake), \
+             mock.patch.object(inference_client, "backoff_delay", return_value=0):
+            fake.chat = wedged_chat
+            with self.assertRaises(inference_client.CircuitOpenError):
+                asyncio.run(client.chat("m", []))
+            self.assertEqual(len(calls), 2) # Breaker opened after 2 timeouts; no further attempts
+            self.assertEqual(breaker.state, "open")
+            with self.assertRaises(inference_client.CircuitOpenError):
+                asyncio.run(client.chat("m", []))
+            self.assertEqual(len(calls), 2)
+
+            # After the cool-down one probe goes through and closes the circuit
+            time.sleep(0.06)
+            fake.chat = healthy_chat
+            response = asyncio.run(client.chat("m", []))
+            self.assertEqual(response["message"]["content"], "ok")
+            self.assertEqual(breaker.state, "closed")
+
+            # A cancelled probe hands the slot back instead of locking the host out
+            breaker.record_failure(); breaker.record_failure()
+            time.sleep(0.06)
+            fake.chat = wedged_chat
+
+            async def cancel_probe():
+                task = asyncio.ensure_future(client.chat("m", []))
+                await asyncio.sleep(0.01)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+            asyncio.run(cancel_probe())
+            self.assertTrue(breaker.allow())
+            breaker.release_probe()
+
+            # Whole-call deadline caps retries
+            fake.chat = wedged_chat
+            client.breaker = inference_client.CircuitBreaker(failure_threshold=100)
+            start = time.time()
+            with self.assertRaises(TimeoutError):
+                asyncio.run(client.chat("m", [], deadline_s=0.12))
+            self.assertLess(time.time() - start, 0.5)
+
+        delays = [inference_client.backoff_delay(n, base_s=0.5, max_s=2) for n in range(10)]
+        self.assertTrue(all(0 <= d <= 2 for d in delays))
+
+    def test_async_crop_and_copy_variants(self):
+        """Test that the awaitable variants fan out in order and share copy generations."""
+        import asyncio
+
+        async def fake_chat(model, messages, options=None, format=None, deadline_s=None):
+            await asyncio.sleep(0.01)
+            if model == ai_engine.VISION_MODEL:
+                return {"message": {"content": "A green leaf pendant"}}
+            return {"message": {"content": json.dumps({"hero": "h", "modern": "m", "social": "s"})}}
+
+        crops = [{"crop_path": None, "crop_bytes": f"crop-{i}".encode(), "ocr_code": f"PA-000{i}"} for i in range(5)]
+        features = {"visual_features": {"motif": "Leaf", "color": "Green", "characteristics": "c"}}
+
+        async def run():
+            results = await ai_engine.analyze_crops_async(crops, max_concurrency=2)
+            decks = await asyncio.gather(*(ai_engine.generate_marketing_copy_async(features) for _ in range(4)))
+            return results, decks
+
+        with mock.patch.object(ai_engine, "VISION_CACHE_ENABLED", False), \
+             mock.patch.object(ai_engine, "VISION_MODEL", "moondream:latest"), \
+             mock.patch.object(ai_engine, "COPY_CACHE", ResultCache("copy", db_path=self.test_cache_path)), \
+             mock.patch.object(ai_engine, "COPY_VARIANT_MODE", False), \
+             mock.patch.object(ai_engine.host_pool, "async_chat", side_effect=fake_chat) as chat:
+            results, decks = asyncio.run(run())
+
+        self.assertEqual([r["item_code"] for r in results], [c["ocr_code"] for c in crops])
+        self.assertEqual(results[0]["visual_features"]["motif"], "Leaf")
+        self.assertEqual(results[3]["crop_bytes"], b"crop-3")
+        self.assertTrue(all(deck == {"hero": "h", "modern": "m", "social": "s"} for deck in decks))
+        self.assertEqual(chat.call_count, len(crops) + 1) # One copy generation for 4 identical items
+
+    def test_host_pool_routing_and_failover(self):
+        """Test least-loaded routing to hosts with the model loaded, and failover on errors."""
+        import host_pool
+
+        def registry(loaded):
+            stub = mock.Mock()
+            stub.snapshot.return_value = {
+                "status": {"running": True},
+                "models": {"moondream:latest": {"loaded": loaded}}
+            }
+            return stub
+
+        pool = host_pool.HostPool(["http://gpu-a.test", "http://gpu-b.test"], retries=2)
+        host_a, host_b = pool.hosts
+        for host in pool.hosts:
+            host.breaker = type(host.breaker)(failure_threshold=3)
+
+        host_a.registry, host_b.registry = registry(False), registry(True)
+        self.assertIs(pool.pick("moondream:latest"), host_b) # Model already loaded on B
+
+        host_a.registry = registry(True)
+        host_b.in_flight = 2
+        self.assertIs(pool.pick("moondream:latest"), host_a) # Both loaded: fewer in flight wins
+        host_b.in_flight = 0
+
+        host_b.client = mock.Mock()
+        host_b.client.chat.side_effect = ConnectionError("gpu-b down")
+        host_a.client = mock.Mock()
+        host_a.client.chat.return_value = {"message": {"content": "ok"}}
+        host_a.latency_ms = 500 # B is picked first (same load, faster), then fails over to A
+
+        with mock.patch.object(host_pool, "log_telemetry") as telemetry:
+            response = pool.chat("moondream:latest", [{"role": "user", "content": "hi"}])
+
+        self.assertEqual(response["message"]["content"], "ok")
+        self.assertEqual(host_b.client.chat.call_count, 1)
+        hosts_logged = [c.kwargs["context"]["host"] for c in telemetry.call_args_list]
+        self.assertEqual(hosts_logged, ["http://gpu-b.test", "http://gpu-a.test"])
+        self.assertIn("queue_depth", telemetry.call_args_list[0].kwargs["context"])
+        stats = pool.stats()
+        self.assertEqual(stats["http://gpu-b.test"]["failures"], 1)
+        self.assertEqual(stats["http://gpu-a.test"]["in_flight"], 0)
+
+    def test_abandoned_stream_settles_probe(self):
+        """Test that closing a half-open probe stream early does not lock the host out."""
+        import host_pool
+
+        pool = host_pool.HostPool(["http://gpu-a.test"], retries=0)
+        host = pool.hosts[0]
+        host.breaker = type(host.breaker)(failure_threshold=1, reset_s=0.01)
+        host.breaker.record_failure()
+        time.sleep(0.02)
+        host.client = mock.Mock()
+        host.client.chat.return_value = iter([{"message": {"content": "溫"}}, {"message": {"content": "潤"}}])
+
+        with mock.patch.object(host_pool, "log_telemetry"):
+            stream = pool.chat_stream("qwen2.5:3b", [])
+            self.assertEqual(next(stream), "溫") # The probe is in flight
+            self.assertFalse(host.breaker.allow())
+            stream.close() # e.g. a Streamlit rerun stops the loop
+
+        self.assertEqual(host.breaker.state, "closed")
+        self.assertTrue(host.breaker.allow())
+        self.assertEqual(host.in_flight, 0)
+
+    def test_async_chat_skips_refused_hosts(self):
+        """Test that a call refused by a busy half-open breaker is not counted as dispatched."""
+        import asyncio
+        import host_pool
+
+        pool = host_pool.HostPool(["http://gpu-a.test"], retries=0)
+        host = pool.hosts[0]
+        host.breaker = type(host.breaker)(failure_threshold=1, reset_s=0.01)
+        host.async_client.breaker = host.breaker
+        host.breaker.record_failure()
+        time.sleep(0.02)
+        dispatched = []
+        pool.add_dispatch_listener(dispatched.append)
+        self.addCleanup(pool.remove_dispatch_listener, dispatched.append)
+
+        self.assertTrue(host.breaker.allow()) # Another caller holds the probe
+        with mock.patch.object(host_pool, "log_telemetry") as telemetry:
+            with self.assertRaises(host_pool.CircuitOpenError):
+                asyncio.run(pool.async_chat("qwen2.5:3b", []))
+        self.assertEqual((host.requests, host.failures, dispatched), (0, 0, []))
+        telemetry.assert_not_called()
+
+        # The pool's own claim is the one the client uses
+        host.breaker.release_probe()
+
+        async def healthy_chat(**kwargs):
+            return {"message": {"content": "ok"}}
+
+        fake = mock.Mock()
+        fake.chat = healthy_chat
+        with mock.patch.object(host.async_client, "_client", return_value=fake), \
+             mock.patch.object(host_pool, "log_telemetry"):
+            response = asyncio.run(pool.async_chat("qwen2.5:3b", []))
+        self.assertEqual(response["message"]["content"], "ok")
+        self.assertEqual(host.breaker.state, "closed")
+        self.assertEqual((host.requests, dispatched), (1, ["qwen2.5:3b"]))
+
+    def test_streaming_copy_partial_json(self):
+        """Test that streamed copy is parsed incrementally and the final deck is cached."""
+        full = json.dumps({"hero": "溫潤如玉\n歷久彌新", "modern": "材質：\"天然\"翡翠", "social": "🍃 #翡翠"}, ensure_ascii=False)
+        self.assertEqual(ai_engine.parse_partial_json_fields('{"hero": "溫潤', ai_engine.COPY_KEYS), {"hero": "溫潤"})
+        self.assertEqual(ai_engine.parse_partial_json_fields('{"hero": "a\\', ["hero"]), {"hero": "a"}) # Split escape
+        self.assertEqual(ai_engine.parse_partial_json_fields('{"hero": "\\u7d', ["hero"]), {"hero": ""})
+        self.assertEqual(ai_engine.parse_partial_json_fields(full, ai_engine.COPY_KEYS), json.loads(full))
+
+        chunks = [full[i:i + 7] for i in range(0, len(full), 7)]
+        features = {"visual_features": {"motif": "Leaf", "color": "Green", "characteristics": "c"}}
+        with mock.patch.object(ai_engine, "COPY_CACHE", ResultCache("copy", db_path=self.test_cache_path)), \
+             mock.patch.object(ai_engine, "COPY_VARIANT_MODE", False), \
+             mock.patch.object(ai_engine.host_pool, "chat_stream", return_value=iter(chunks)) as stream:
+            decks = list(ai_engine.generate_marketing_copy_stream(features))
+            cached = list(ai_engine.generate_marketing_copy_stream(features))
+
+        self.assertGreater(len(decks), 3)
+        self.assertEqual(decks[0]["modern"], "")
+        self.assertTrue(all(len(a["hero"]) <= len(b["hero"]) for a, b in zip(decks, decks[1:])))
+        self.assertEqual(decks[-1], json.loads(full))
+        self.assertEqual(cached, [json.loads(full)])
+        self.assertEqual(stream.call_count, 1)
+
+    def test_model_affinity_scheduler_phases(self):
+        """Test that all vision work runs before any copy and the text model is preloaded in between."""
+        import threading
+        import model_scheduler
+
+        events = []
+        lock = threading.Lock()
+        host = ai_engine.host_pool.hosts[0]
+
+        def fake_segment(path, enable_ocr=True):
+            return [{"crop_path": path, "ocr_code": "PA-0001"}, {"crop_path": path, "ocr_code": "PA-0002"}]
+
+        def fake_vision(path, crops, user_hints="", max_workers=None):
+            for crop in crops:
+                with lock:
+                    cold = not events # First call on a cold host pays the load
+                    events.append(f"vision:{path}")
+                ai_engine.host_pool._dispatch(host, ai_engine.VISION_MODEL)
+                host.end(1.0, ok=True)
+                if cold:
+                    host.record_load(ai_engine.VISION_MODEL, {"load_duration": 3e9})
+            time.sleep(0.05)
+            return [{"item_code": c["ocr_code"], "visual_features": {"motif": "Leaf"}} for c in crops]
+
+        def fake_copy(item):
+            with lock:
+                events.append("copy")
+            return {"hero": "h", "modern": "m", "social": "s"}
+
+        def fake_preload(model, keep_alive=None):
+            with lock:
+                events.append(f"preload:{model}")
+
+        jobs = [{"name": f"f{i}", "path": f"img_{i}.jpg"} for i in range(3)]
+        with mock.patch.object(batch_pipeline, "segment_image", side_effect=fake_segment), \
+             mock.patch.object(batch_pipeline, "analyze_segmented_image", side_effect=fake_vision), \
+             mock.patch.object(model_scheduler, "generate_marketing_copy", side_effect=fake_copy), \
+             mock.patch.object(model_scheduler, "TEXT_MODEL", "text-model"), \
+             mock.patch.object(ai_engine.host_pool, "preload", side_effect=fake_preload):
+            scheduler = model_scheduler.ModelAffinityScheduler(copy_workers=2)
+            results = list(scheduler.run(jobs))
+
+        self.assertEqual([r["name"] for r in results], ["f0", "f1", "f2"])
+        self.assertEqual(results[2]["items"][1]["copy_deck"]["hero"], "h")
+        last_vision = max(i for i, e in enumerate(events) if e.startswith("vision"))
+        first_copy = events.index("copy")
+        self.assertLess(last_vision, first_copy)
+        self.assertLess(last_vision, events.index("preload:text-model"))
+        self.assertLess(events.index("preload:text-model"), first_copy)
+        self.assertEqual(scheduler.stats["preload"], "tail")
+        self.assertEqual(scheduler.stats["model_loads"], 1)
+
+        # stream_first: the pool writes all copy but the first item's, which the UI streams
+        events.clear()
+        with mock.patch.object(batch_pipeline, "segment_image", side_effect=fake_segment), \
+             mock.patch.object(batch_pipeline, "analyze_segmented_image", side_effect=fake_vision), \
+             mock.patch.object(model_scheduler, "generate_marketing_copy", side_effect=fake_copy), \
+             mock.patch.object(ai_engine.host_pool, "preload", side_effect=fake_preload):
+            results = list(model_scheduler.ModelAffinityScheduler(copy_workers=2, stream_first=True).run(jobs))
+
+        items = [item for r in results for item in r["items"]]
+        self.assertNotIn("copy_deck", items[0])
+        self.assertNotIn("copy_future", items[0])
+        self.assertEqual(items[1]["copy_future"].result()["hero"], "h") # Same tray: not waited for
+        self.assertTrue(all("copy_deck" in item for item in items[2:]))
+        self.assertEqual(events.count("copy"), len(items) - 1)
+
+    def test_ingestion_queue_resumes(self):
+        """Headless ingestion drains the images queue and resumes interrupted runs."""
+        import db_manager
+        import ingestion
+
+        db_manager.check_and_migrate_db()
+        photo_dir = os.path.join("data", "test_ingest_photos")
+        os.makedirs(photo_dir, exist_ok=True)
+        self.addCleanup(shutil.rmtree, photo_dir, ignore_errors=True)
+        for name in ("tray_a.jpg", "tray_b.jpg", "tray_c.png", "notes.txt"):
+            with open(os.path.join(photo_dir, name), "wb") as f:
+                f.write(name.encode())
+
+        def fake_analyze(path, enable_ocr=True, user_hints=""):
+            name = os.path.basename(path)
+            if name == "tray_c.png":
+                return [{"error": "vision timeout"}]
+            return [
+                {"item_code": f"{name[5].upper()}-1", "visual_features": {"motif": "Leaf", "color": "green"}},
+                {"item_code": "Unknown", "visual_features": {"motif": "Leaf"}}
+            ]
+
+        copy_deck = {"hero": "h", "modern": "m", "social": "s"}
+        with mock.patch.object(ingestion, "analyze_image_content", side_effect=fake_analyze) as analyze, \
+             mock.patch.object(ingestion, "generate_marketing_copy", return_value=copy_deck):
+            # An earlier run enqueued everything, then died while holding tray_a
+            self.assertEqual(db_manager.enqueue_images(ingestion.scan_images([photo_dir])), 3)
+            claimed = db_manager.claim_next_image()
+            self.assertTrue(claimed["file_path"].endswith("tray_a.jpg"))
+            self.assertEqual(db_manager.image_queue_counts()["PROCESSING"], 1)
+
+            summary = ingestion.run_ingest([photo_dir], workers=1)
+            self.assertEqual(summary["added"], 0)
+            self.assertEqual(summary["requeued"], 1)
+            self.assertEqual(summary["processed"], 2)
+            self.assertEqual(summary["errors"], 1)
+            self.assertEqual(analyze.call_count, 3)
+
+            # Nothing left to do: a rerun does not touch finished images
+            summary = ingestion.run_ingest([photo_dir], workers=1)
+            self.assertEqual(summary["processed"], 0)
+            self.assertEqual(analyze.call_count, 3)
+
+            summary = ingestion.run_ingest([], workers=1, retry_errors=True)
+            self.assertEqual(summary["requeued"], 1)
+            self.assertEqual(summary["errors"], 1)
+            self.assertEqual(analyze.call_count, 4)
+
+        self.assertEqual(sorted(i["item_code"] for i in get_all_items()), ["A-1", "B-1"])
+        self.assertEqual(db_manager.image_queue_counts(), {"PENDING": 0, "PROCESSING": 0, "PROCESSED": 2, "ERROR": 1})
+        errors = db_manager.get_image_errors()
+        self.assertEqual(errors[0]["last_error"], "vision timeout")
+        self.assertEqual(errors[0]["attempts"], 2)
+
+    def test_ingestion_skips_unchanged_files(self):
+        """Re-ingesting a folder only reprocesses new or changed photos and links crops to items."""
+        import db_manager
+        import ingestion
+
+        db_manager.check_and_migrate_db()
+        photo_dir = os.path.join("data", "test_ingest_skip")
+        os.makedirs(photo_dir, exist_ok=True)
+        self.addCleanup(shutil.rmtree, photo_dir, ignore_errors=True)
+
+        def write(name, data, mtime=None):
+            path = os.path.join(photo_dir, name)
+            with open(path, "wb") as f:
+                f.write(data)
+            if mtime:
+                os.utime(path, (mtime, mtime))
+            return path
+
+        write("tray_a.jpg", b"tray a", mtime=1_000_000)
+        write("tray_b.jpg", b"tray b", mtime=1_000_000)
+
+        def fake_analyze(path, enable_ocr=True, user_hints=""):
+            code = open(path, "rb").read().decode().split()[-1].upper()
+            return [{"item_code": f"{code}-1", "ocr_code": f"{code}-1", "bbox": [1, 2, 30, 40], "visual_features": {"motif": "Leaf"}}]
+
+        copy_deck = {"hero": "h", "modern": "m", "social": "s"}
+        with mock.patch.object(ingestion, "analyze_image_content", side_effect=fake_analyze) as analyze, \
+             mock.patch.object(ingestion, "generate_marketing_copy", return_value=copy_deck), \
+             mock.patch.object(ingestion, "file_sha256", wraps=ingestion.file_sha256) as hasher:
+            summary = ingestion.run_ingest([photo_dir], workers=1)
+            self.assertEqual((summary["added"], summary["processed"]), (2, 2))
+
+            # Untouched folder: stat check only, nothing hashed or analyzed
+            hasher.reset_mock()
+            summary = ingestion.run_ingest([photo_dir], workers=1)
+            self.assertEqual((summary["unchanged"], summary["processed"], summary["skipped_bytes"]), (2, 0, 12))
+            self.assertEqual(hasher.call_count, 0)
+
+            # Touched but identical, edited in place, and a byte-identical copy
+            write("tray_a.jpg", b"tray a", mtime=2_000_000)
+            write("tray_b.jpg", b"tray c", mtime=2_000_000)
+            write("copy_of_a.jpg", b"tray a")
+            summary = ingestion.run_ingest([photo_dir], workers=1)
+            self.assertEqual(
+                (summary["unchanged"], summary["changed"], summary["duplicates"], summary["processed"]),
+                (1, 1, 1, 1)
+            )
+            self.assertEqual(analyze.call_count, 3)
+
+        images = db_manager.get_images_by_path(ingestion.scan_images([photo_dir]))
+        by_name = {os.path.basename(p): row for p, row in images.items()}
+        self.assertEqual(by_name["copy_of_a.jpg"]["content_hash"], by_name["tray_a.jpg"]["content_hash"])
+        self.assertEqual(db_manager.get_image_items(by_name["tray_b.jpg"]["id"]),
+                         [{"item_code": "C-1", "is_primary": 1, "bbox": [1, 2, 30, 40], "ocr_code": "C-1"}])
+        copy_links = db_manager.get_image_items(by_name["copy_of_a.jpg"]["id"])
+        self.assertEqual([(l["item_code"], l["is_primary"]) for l in copy_links], [("A-1", 0)])
+
+    def test_items_version_tracks_catalog_changes(self):
+        """The change counter moves on every item write, not on reads or queue updates."""
+        import db_manager
+
+        self.assertEqual(db_manager.get_items_version(), "") # schema.sql alone: not migrated yet
+        db_manager.check_and_migrate_db()
+        v0 = db_manager.get_items_version()
+        self.assertTrue(v0.endswith(".0"))
+
+        save_item({"item_code": "VER-1", "title": "t", "attributes": {}})
+        v1 = db_manager.get_items_version()
+        self.assertNotEqual(v1, v0)
+        db_manager.query_items(keyword="VER")
+        db_manager.enqueue_images(["tray.jpg"])
+        self.assertEqual(db_manager.get_items_version(), v1)
+
+        db_manager.save_items([{"item_code": "VER-1", "title": "t2", "attributes": {}}, {"item_code": "VER-2", "title": "t", "attributes": {}}])
+        v2 = db_manager.get_items_version()
+        self.assertNotEqual(v2, v1)
+        with db_manager.transaction() as conn:
+            conn.execute("DELETE FROM items WHERE item_code = 'VER-2'")
+        self.assertNotEqual(db_manager.get_items_version(), v2)
+
+        # Migrating again keeps the counter
+        version = db_manager.get_items_version()
+        db_manager.check_and_migrate_db()
+        self.assertEqual(db_manager.get_items_version(), version)
+
+    def test_cold_start_budget(self):
+        """Importing the engine and PDF modules defers OpenCV, Ollama and ReportLab and stays within budget."""
+        import startup_profile
+
+        sample = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   _json\n"
+            "import time:       800 |        920 | json\n"
+            "some log line\n"
+        )
+        self.assertEqual(startup_profile.parse_importtime(sample), [
+            {"module": "_json", "self_us": 120, "cumulative_us": 120, "depth": 1},
+            {"module": "json", "self_us": 800, "cumulative_us": 920, "depth": 0},
+        ])
+
+        for module in startup_profile.IMPORT_BUDGETS_MS:
+            result = startup_profile.profile_import(module)
+            self.assertEqual(result["heavy"], [], module)
+            self.assertEqual(startup_profile.check_budget(result), [], module)
+            self.assertTrue(startup_profile.format_report(result).startswith(f"{module}: "))
+
+    def test_regrade_all_applies_rule_changes(self):
+        """Compiled rules keep first-tier-wins semantics; regrade_all rewrites only changed ranks."""
+        import db_manager
+        import grading_utils
+
+        rules = {"tiers": {}, "rules": [
+            {"tier": "S", "required_keywords": ["Imperial Green", "glassy"]},
+            {"tier": "A", "required_keywords": ["green", "Icy"]},
+            {"tier": "B", "required_keywords": []},
+            {"tier": "C", "required_keywords": ["never reached"]}
+        ]}
+        with mock.patch.object(grading_utils.JadeGrader, "_load_rules", return_value=rules):
+            grader = grading_utils.JadeGrader()
+        self.assertEqual(grader.calculate_grade({"color": "imperial green"}), "S") # Overlaps "green" (A)
+        self.assertEqual(grader.calculate_grade({"color": "Apple Green", "characteristics": "GLASSY"}), "S")
+        self.assertEqual(grader.calculate_grade({"characteristics": "icy"}), "A")
+        self.assertEqual(grader.calculate_grade({"motif": "never reached"}), "B")
+
+        db_manager.check_and_migrate_db()
+        db_manager.save_items([
+            {"item_code": "RG-1", "title": "Leaf", "attributes": {"color": "Imperial Green"}, "rarity_rank": "B"},
+            {"item_code": "RG-2", "title": "Bamboo", "attributes": {"color": "grey"}, "rarity_rank": "B"},
+            {"item_code": "RG-3", "title": "Ruyi", "attributes": {"characteristics": "icy"}, "rarity_rank": "S"}
+        ])
+        with db_manager.transaction() as conn:
+            conn.execute("UPDATE items SET updated_at = '2020-01-01 00:00:00'")
+        version = db_manager.get_items_version()
+
+        summary = grading_utils.regrade_all(grader, batch_size=2)
+        self.assertEqual((summary["total"], summary["changed"]), (3, 2))
+        self.assertEqual(summary["tiers"], {"S": 1, "B": 1, "A": 1})
+        ranks = {i["item_code"]: (i["rarity_rank"], i["updated_at"]) for i in get_all_items()}
+        self.assertEqual(ranks, {
+            "RG-1": ("S", "2020-01-01 00:00:00"),
+            "RG-2": ("B", "2020-01-01 00:00:00"),
+            "RG-3": ("A", "2020-01-01 00:00:00")
+        })
+        self.assertNotEqual(db_manager.get_items_version(), version) # Cached exports are rebuilt
+        self.assertEqual(grading_utils.regrade_all(grader)["changed"], 0)
+        self.assertEqual([i["item_code"] for i in db_manager.query_items(keyword="Bamboo")["items"]], ["RG-2"])
+
 if __name__ == '__main__':
     unittest.main()